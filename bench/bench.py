@@ -0,0 +1,432 @@
+"""Benchmark of the signal pipeline on a PC.
+
+Runs under CPython and under the unix port of MicroPython. The hardware
+modules are replaced with the fakes in bench/fakes and the samples come from
+a recording replayed through Filefifo (text or binary). Without a recording
+a synthetic PPG signal is generated.
+
+Usage: python bench/bench.py [recording] [-n samples] [-o result.json] [-hr high_rate_recording]
+       micropython -X heapsize=4M bench/bench.py [options as above]
+
+Every stage is run once for timing and once for measuring the allocated
+memory, the result is written as JSON. The block stages are run with each
+implementation of the kernels that is available (python, and viper on
+MicroPython) to show the speedup of the compiled ones.
+
+On MicroPython the memory allocated by a stage is measured with the garbage
+collector disabled, so the heap must hold all of it. The default heap of
+the unix port is too small for the display and pipeline stages.
+"""
+import sys
+import gc
+import json
+import math
+import array
+
+_here = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+sys.path[:0] = [_here + '/fakes', _here + '/..', _here + '/../lib']
+
+from filefifo import Filefifo, write_header
+import kernels
+from peaks import PeakDetector
+from ppgfilter import PPGFilter
+from pipeline import Pipeline
+from sampler import Sampler
+from hrv import HRVAccumulator, Convergence
+from plot import ScrollingPlot
+from display import Display
+from machine import I2C
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def synthetic(name, rate = 250, seconds = 60, bpm = 70, noise = 128):
+    """Write a binary recording of a PPG like signal with some HRV, baseline wander and noise"""
+    seed = 12345
+    period = 60 / bpm
+    beat = 0.0
+    next_beat = 0.0
+    out = array.array('H')
+    for i in range(rate * seconds):
+        t = i / rate
+        if t >= next_beat:
+            beat = next_beat
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            next_beat += period * (0.95 + 0.1 * seed / 0x7FFFFFFF)
+        ph = (t - beat) / period
+        v = math.exp(-((ph - 0.15) / 0.07) ** 2) + 0.4 * math.exp(-((ph - 0.45) / 0.1) ** 2)
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        out.append(int(30000 + 12000 * v + 300 * math.sin(2 * math.pi * 0.2 * t) + ((seed & 0xFF) - 128) * noise / 128))
+    with open(name, 'wb') as f:
+        write_header(f, rate)
+        f.write(out)
+
+
+def replay(name, n):
+    fifo = Filefifo(32, name = name)
+    buf = array.array('H', bytearray(2 * 32))
+    out = array.array('H', bytearray(2 * n))
+    got = 0
+    while got < n:
+        k = fifo.get_into(buf, min(32, n - got))
+        out[got:got + k] = buf[:k]
+        got += k
+    return out, fifo.rate or 250
+
+
+def hrv_reference(ppi):
+    """HRV metrics calculated over the list with floats before rounding, for checking HRVAccumulator.results()"""
+    n = len(ppi)
+    mean = sum(ppi) / n
+    sdnn = (sum((x - mean) ** 2 for x in ppi) / (n - 1)) ** (1 / 2)
+    d = [ppi[i + 1] - ppi[i] for i in range(n - 1)]
+    rmssd = (sum(x * x for x in d) / (n - 1)) ** (1 / 2)
+    mean_d = sum(d) / len(d)
+    sdsd = (sum((x - mean_d) ** 2 for x in d) / (len(d) - 1)) ** (1 / 2)
+    sd1 = sdsd / 2 ** (1 / 2)
+    sd2 = max(0, 2 * sdnn ** 2 - sdsd ** 2 / 2) ** (1 / 2)
+    return (mean, 60000 / mean, sdnn, rmssd, sdsd, sd1, sd2)
+
+
+def check_hrv(ppi):
+    """Compare the integer HRV results with the rounded float reference, returns the differing metrics"""
+    hrv = HRVAccumulator()
+    for x in ppi:
+        hrv.add(x)
+    names = ('meanPPI', 'meanHR', 'SDNN', 'RMSSD', 'SDSD', 'SD1', 'SD2')
+    got = hrv.results()
+    ref = hrv_reference(ppi)
+    # A float square root can land on either side of an exact .5, only there both are accepted
+    return {names[i]: [got[i], ref[i]] for i in range(7)
+            if got[i] != round(ref[i]) and abs(ref[i] - int(ref[i]) - 0.5) > 1e-9}
+
+
+def check_interpolation(name, rates = (100, 125, 250)):
+    """Replay a high rate recording, detect the intervals at its own rate and
+    at lower rates by taking every k-th sample, with and without the
+    parabolic peak refinement. Returns the mean and max error in ms of the
+    intervals at each lower rate against the ones at the high rate."""
+    fifo = Filefifo(64, name = name, repeat = False)
+    high = fifo.rate or 1000
+    data = array.array('H')
+    buf = array.array('H', bytearray(2 * 64))
+    while True:
+        k = fifo.get_into(buf)
+        if k == 0:
+            break
+        data.extend(buf[:k])
+    ref = PeakDetector(high, 3 * high)
+    reference = [p for p in (ref.add(v) for v in data) if p]
+    result = {'rate': high, 'intervals': len(reference)}
+    for rate in rates:
+        step = high // rate
+        if step < 2:
+            continue
+        result[rate] = {}
+        for label, interpolate in (('plain', False), ('parabolic', True)):
+            detector = PeakDetector(high // step, 3 * high // step, 300, interpolate)
+            got = [p for p in (detector.add(data[i]) for i in range(0, len(data), step)) if p]
+            m = min(len(got), len(reference))
+            err = [abs(got[i] - reference[i]) for i in range(m)]
+            result[rate][label] = {'mean_ms': sum(err) / m if m else 0, 'max_ms': max(err) if m else 0,
+                                   'intervals': len(got)}
+    return result
+
+
+###########
+# Stages  #
+###########
+
+def stage_replay(ctx):
+    fifo = Filefifo(32, name = ctx['name'])
+    buf = array.array('H', bytearray(2 * 32))
+    got = 0
+    n = len(ctx['samples'])
+    while got < n:
+        got += fifo.get_into(buf, min(32, n - got))
+    return n
+
+
+def stage_detector(ctx):
+    detector = PeakDetector(ctx['rate'], 3 * ctx['rate'])
+    for v in ctx['samples']:
+        detector.add(v)
+    return len(ctx['samples'])
+
+
+def stage_hrv(ctx):
+    hrv = HRVAccumulator()
+    for ppi in ctx['ppi']:
+        hrv.add(ppi)
+    hrv.results()
+    return len(ctx['ppi'])
+
+
+def stage_detector_block(ctx):
+    detector = PeakDetector(ctx['rate'], 3 * ctx['rate'])
+    samples = ctx['samples']
+    buf = array.array('H', bytearray(2 * 32))
+    out = array.array('H', bytearray(2 * 8))
+    for i in range(0, len(samples), 32):
+        k = min(32, len(samples) - i)
+        buf[:k] = samples[i:i + k]
+        detector.add_many(buf, k, out)
+    return len(samples)
+
+
+def stage_filter_block(ctx):
+    ppg_filter = PPGFilter(ctx['rate'], 0.5, 5, 4)
+    samples = ctx['samples']
+    buf = array.array('H', bytearray(2 * 32))
+    for i in range(0, len(samples), 32):
+        k = min(32, len(samples) - i)
+        buf[:k] = samples[i:i + k]
+        ppg_filter.process(buf, k)
+    return len(samples)
+
+
+def stage_plot_block(ctx):
+    plot = ScrollingPlot(128, 48, 7)
+    samples = ctx['samples']
+    buf = array.array('H', bytearray(2 * 32))
+    for i in range(0, len(samples), 32):
+        k = min(32, len(samples) - i)
+        buf[:k] = samples[i:i + k]
+        plot.add_many(buf, k)
+    return len(samples)
+
+
+def stage_plot(ctx):
+    plot = ScrollingPlot(128, 48, 7)
+    for v in ctx['samples']:
+        plot.add(v)
+    return len(ctx['samples'])
+
+
+def stage_display(ctx):
+    # Frame refreshes as in the detector task: header, plot copy and flush every 8 columns
+    plot = ScrollingPlot(128, 48, 7)
+    oled = Display(128, 64, I2C())
+    frames = 0
+    for v in ctx['samples']:
+        if plot.add(v) and plot.new_columns >= 8:
+            oled.fill_rect(0, 3, 128, 12, 1)
+            oled.text("BPM:", 39, 5, 0)
+            plot.draw(oled, 16)
+            oled.show()
+            frames += 1
+    return frames
+
+
+def stage_pipeline(ctx):
+    fifo = Filefifo(32, name = ctx['name'])
+    buf = array.array('H', bytearray(2 * 32))
+    ppg_filter = PPGFilter(ctx['rate'], 0.5, 5, 4)
+    detector = PeakDetector(ctx['rate'], 3 * ctx['rate'])
+    hrv = HRVAccumulator()
+    plot = ScrollingPlot(128, 48, 7)
+    oled = Display(128, 64, I2C())
+    out = array.array('H', bytearray(2 * 8))
+    n = len(ctx['samples'])
+    got = 0
+    while got < n:
+        k = fifo.get_into(buf, min(32, n - got))
+        got += k
+        ppg_filter.process(buf, k)
+        plot.add_many(buf, k)
+        for i in range(detector.add_many(buf, k, out)):
+            hrv.add(out[i])
+        if plot.new_columns >= 8:
+            plot.draw(oled, 16)
+            oled.show()
+    hrv.results()
+    return n
+
+
+def run_pipeline(ctx, threaded):
+    # The recording never runs out, the consumer drains the fifos like the detector task
+    sampler = Sampler(name = ctx['name'])
+    pipeline = Pipeline(sampler, PPGFilter(ctx['rate'], 0.5, 5, 4), PeakDetector(ctx['rate'], 3 * ctx['rate']),
+                        threaded = threaded)
+    hrv = HRVAccumulator()
+    buf = array.array('H', bytearray(2 * 32))
+    out = array.array('H', bytearray(2 * 8))
+    n = len(ctx['samples'])
+    pipeline.start()
+    while pipeline.processed < n:
+        pipeline.poll()
+        while pipeline.samples.get_into(buf):
+            pass
+        for i in range(pipeline.beats.get_into(out)):
+            hrv.add(out[i])
+    pipeline.stop()
+    ctx['dropped'][threaded] = pipeline.dropped()
+    return pipeline.processed
+
+
+def stage_pipeline_polled(ctx):
+    return run_pipeline(ctx, False)
+
+
+def stage_pipeline_threaded(ctx):
+    return run_pipeline(ctx, True)
+
+
+STAGES = (
+    ('replay', stage_replay, 'sample'),
+    ('detector', stage_detector, 'sample'),
+    ('hrv', stage_hrv, 'interval'),
+    ('plot', stage_plot, 'sample'),
+    ('display', stage_display, 'frame'),
+    ('pipeline', stage_pipeline, 'sample'),
+    ('pipeline_polled', stage_pipeline_polled, 'sample'),
+    ('pipeline_threaded', stage_pipeline_threaded, 'sample'),
+)
+
+KERNEL_STAGES = (
+    ('filter_block', stage_filter_block, 'sample'),
+    ('detector_block', stage_detector_block, 'sample'),
+    ('plot_block', stage_plot_block, 'sample'),
+)
+
+
+def measure(stage, ctx):
+    gc.collect()
+    start = ticks_us()
+    items = stage(ctx)
+    us = ticks_diff(ticks_us(), start)
+
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        stage(ctx)
+        alloc = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        # Without a collection during the stage the growth is all it allocated
+        gc.disable()
+        before = gc.mem_alloc()
+        stage(ctx)
+        alloc = gc.mem_alloc() - before
+        gc.enable()
+    return items, us, alloc
+
+
+def main(argv):
+    name = None
+    high_rate = None
+    out = 'bench.json'
+    n = 0
+    i = 1
+    while i < len(argv):
+        if argv[i] == '-o':
+            out = argv[i + 1]
+            i += 1
+        elif argv[i] == '-n':
+            n = int(argv[i + 1])
+            i += 1
+        elif argv[i] == '-hr':
+            high_rate = argv[i + 1]
+            i += 1
+        else:
+            name = argv[i]
+        i += 1
+    if name is None:
+        name = 'bench_synthetic.bin'
+        synthetic(name)
+    if n <= 0:
+        n = 15000
+
+    samples, rate = replay(name, n)
+    detector = PeakDetector(rate, 3 * rate)
+    ppi = array.array('H')
+    for v in samples:
+        p = detector.add(v)
+        if p:
+            ppi.append(p)
+    ctx = {'name': name, 'rate': rate, 'samples': samples, 'ppi': ppi, 'dropped': {}}
+
+    result = {
+        'implementation': sys.implementation.name,
+        'kernels': kernels.IMPLEMENTATION,
+        'recording': name,
+        'rate': rate,
+        'samples': n,
+        'intervals': len(ppi),
+        'stages': {},
+    }
+    if len(ppi) > 2:
+        result['hrv_mismatch'] = check_hrv(ppi)
+        print('hrv check', result['hrv_mismatch'] or 'ok')
+    convergence = Convergence(0.1, 30, 300)
+    result['converged_after'] = 0
+    for i in range(len(ppi)):
+        convergence.add(ppi[i])
+        if convergence.done():
+            result['converged_after'] = i + 1
+            break
+    print('converged after', result['converged_after'] or 'never', 'of', len(ppi), 'intervals')
+    if high_rate is None:
+        high_rate = 'bench_synthetic_1000.bin'
+        synthetic(high_rate, 1000, 60, noise = 8)
+    result['interpolation'] = check_interpolation(high_rate)
+    for r, errors in result['interpolation'].items():
+        if isinstance(errors, dict):
+            print('{:4} Hz plain {:6.2f} ms parabolic {:6.2f} ms'.format(
+                r, errors['plain']['mean_ms'], errors['parabolic']['mean_ms']))
+    for stage_name, stage, unit in STAGES:
+        items, us, alloc = measure(stage, ctx)
+        result['stages'][stage_name] = {
+            'us': us,
+            'items': items,
+            'unit': unit,
+            'us_per_item': us / items if items else 0,
+            'alloc_bytes': alloc,
+        }
+        print('{:17} {:10d} us {:8.2f} us/{} {:8d} B'.format(stage_name, us, us / items if items else 0, unit, alloc))
+    default = kernels.IMPLEMENTATION
+    result['kernel_stages'] = {}
+    for impl in ('python', 'viper'):
+        if not kernels.select(impl):
+            continue
+        for stage_name, stage, unit in KERNEL_STAGES:
+            items, us, alloc = measure(stage, ctx)
+            result['kernel_stages'].setdefault(stage_name, {})[impl] = {
+                'us': us,
+                'us_per_item': us / items if items else 0,
+                'alloc_bytes': alloc,
+            }
+            print('{:14} {:6} {:10d} us {:8.2f} us/{} {:8d} B'.format(stage_name, impl, us, us / items if items else 0, unit, alloc))
+    kernels.select(default)
+    for stage_name, runs in result['kernel_stages'].items():
+        if 'python' in runs and 'viper' in runs and runs['viper']['us']:
+            runs['speedup'] = runs['python']['us'] / runs['viper']['us']
+            print('{:14} viper speedup {:.1f}x'.format(stage_name, runs['speedup']))
+    result['stages']['pipeline_polled']['dropped'] = ctx['dropped'][False]
+    result['stages']['pipeline_threaded']['dropped'] = ctx['dropped'][True]
+    print('pipeline_threaded dropped', ctx['dropped'][True])
+    us = result['stages']['pipeline']['us']
+    result['samples_per_s'] = n * 1000000 / us if us else 0
+    print('pipeline {:.0f} samples/s'.format(result['samples_per_s']))
+    with open(out, 'w') as f:
+        json.dump(result, f)
+    if result.get('hrv_mismatch'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,90 @@
+"""Pure Python framebuf with the MONO_VLSB format only, for running on a PC.
+The real module is written in C, so the times measured with this one are
+only comparable with each other."""
+
+MONO_VLSB = 0
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride = None):
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+
+    def pixel(self, x, y, c = None):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = (y >> 3) * self.width + x
+            bit = 1 << (y & 7)
+            if c is None:
+                return 1 if self.buffer[i] & bit else 0
+            if c:
+                self.buffer[i] |= bit
+            else:
+                self.buffer[i] &= ~bit & 0xFF
+
+    def fill(self, c):
+        v = 0xFF if c else 0
+        for i in range(len(self.buffer)):
+            self.buffer[i] = v
+
+    def fill_rect(self, x, y, w, h, c):
+        for yy in range(y, y + h):
+            for xx in range(x, x + w):
+                self.pixel(xx, yy, c)
+
+    def rect(self, x, y, w, h, c, f = False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+        else:
+            self.hline(x, y, w, c)
+            self.hline(x, y + h - 1, w, c)
+            self.vline(x, y, h, c)
+            self.vline(x + w - 1, y, h, c)
+
+    def hline(self, x, y, w, c):
+        for xx in range(x, x + w):
+            self.pixel(xx, y, c)
+
+    def vline(self, x, y, h, c):
+        for yy in range(y, y + h):
+            self.pixel(x, yy, c)
+
+    def line(self, x0, y0, x1, y1, c):
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            self.pixel(x0, y0, c)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def text(self, s, x, y, c = 1):
+        # No font, mark the text area so that it shows up in the frame
+        self.hline(x, y + 3, 8 * len(s), c)
+
+    def scroll(self, xstep, ystep):
+        w = self.width
+        for page in range(self.height >> 3):
+            row = page * w
+            if xstep < 0:
+                for x in range(w + xstep):
+                    self.buffer[row + x] = self.buffer[row + x - xstep]
+            elif xstep > 0:
+                for x in range(w - 1, xstep - 1, -1):
+                    self.buffer[row + x] = self.buffer[row + x - xstep]
+
+    def blit(self, fbuf, x, y, key = -1, palette = None):
+        for yy in range(fbuf.height):
+            for xx in range(fbuf.width):
+                c = fbuf.pixel(xx, yy)
+                if c != key:
+                    self.pixel(x + xx, y + yy, c)
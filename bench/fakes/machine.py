@@ -0,0 +1,75 @@
+"""Fake machine module for running the signal pipeline on a PC."""
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    IRQ_FALLING = 4
+
+    def __init__(self, id, mode = -1, pull = -1, value = None):
+        self._value = value or 0
+
+    def value(self, *args):
+        if args:
+            self._value = args[0]
+        return self._value
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, trigger = 0, handler = None, hard = False):
+        pass
+
+
+class ADC:
+    def __init__(self, pin):
+        pass
+
+    def read_u16(self):
+        return 0
+
+
+class I2C:
+    """I2C bus that only counts the bytes written"""
+    def __init__(self, id = 0, scl = None, sda = None, freq = 400000):
+        self.written = 0
+
+    def writeto(self, addr, buf):
+        self.written += len(buf)
+
+    def writevto(self, addr, bufs):
+        for buf in bufs:
+            self.written += len(buf)
+
+
+def unique_id():
+    return b'\x00\x00\x00\x00\x00\x00\x00\x00'
+
+
+def idle():
+    pass
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+class PWM:
+    def __init__(self, pin, freq = 0, duty_u16 = 0):
+        self._duty = duty_u16
+
+    def freq(self, *args):
+        return 1000
+
+    def duty_u16(self, *args):
+        if args:
+            self._duty = args[0]
+        return self._duty
@@ -0,0 +1,30 @@
+"""Fake network module, the WLAN connects as soon as it is asked to."""
+
+STA_IF = 0
+AP_IF = 1
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_GOT_IP = 3
+
+
+class WLAN:
+    def __init__(self, interface = STA_IF):
+        self._active = False
+        self._connected = False
+
+    def active(self, *args):
+        if args:
+            self._active = args[0]
+        return self._active
+
+    def connect(self, ssid = None, key = None):
+        self._connected = True
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        return self._connected
+
+    def status(self):
+        return STAT_GOT_IP if self._connected else STAT_IDLE
@@ -0,0 +1,55 @@
+"""Fake rp2 module, the PIO programs are not assembled and never run."""
+
+
+class PIO:
+    IN_LOW = 0
+    IN_HIGH = 1
+    OUT_LOW = 2
+    OUT_HIGH = 3
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+
+    def __init__(self, id):
+        pass
+
+    def remove_program(self, program = None):
+        pass
+
+
+def asm_pio(**kwargs):
+    def program(f):
+        return f
+    return program
+
+
+class StateMachine:
+    """State machine with empty fifos"""
+    def __init__(self, id, program = None, freq = -1, **kwargs):
+        self.id = id
+        self._active = 0
+
+    def active(self, *args):
+        if args:
+            self._active = 1 if args[0] else 0
+        return self._active
+
+    def irq(self, handler = None, trigger = 0, hard = False):
+        pass
+
+    def exec(self, instr):
+        pass
+
+    def put(self, value, shift = 0):
+        pass
+
+    def get(self, buf = None, shift = 0):
+        return 0
+
+    def rx_fifo(self):
+        return 0
+
+    def tx_fifo(self):
+        return 0
@@ -0,0 +1,192 @@
+import time
+import json
+
+
+class ConnectionManager:
+    """Keeps the WLAN and one MQTT session up.
+    WLAN is brought up once and one MQTTClient is kept connected. publish()
+    only puts the message in a queue. service() must be called often: it
+    sends the queued messages, pings the broker to keep the session alive
+    and reconnects after a failure. Reconnecting waits with exponential
+    backoff so an unreachable broker does not stall the caller every time,
+    and each connect gives up after connect_timeout ms.
+    Dictionaries queued with publish_json() while the broker is unreachable
+    are sent together as one JSON array when the connection is back. The
+    array goes to the topic with "/batch" appended, the topic itself only
+    ever carries single JSON objects.
+    network and umqtt are imported on the first connect, not at boot.
+    """
+    def __init__(self, ssid, password, broker, client_id = '', keepalive = 60, queue_size = 20,
+                 batch_size = 10, min_backoff = 1000, max_backoff = 60000, port = 0, connect_timeout = 500):
+        """Parameters
+
+        ssid (string): WLAN name
+        password (string): WLAN password
+        broker (string): Address of the MQTT broker
+        client_id (string): MQTT client id
+        keepalive (int): MQTT keepalive in seconds. The broker is pinged at half of it.
+        queue_size (int): Number of messages kept while the broker is unreachable. The oldest is dropped first.
+        batch_size (int): Maximum number of queued JSON messages sent in one array to topic + "/batch"
+        min_backoff (int): First wait in ms before reconnecting after a failure
+        max_backoff (int): Longest wait in ms between reconnects
+        port (int): Port of the MQTT broker. 0 means the default 1883.
+        connect_timeout (int): Longest time in ms that service() waits for the broker to accept a connection
+        """
+        self.ssid = ssid
+        self.password = password
+        self.broker = broker
+        self.client_id = client_id
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.backoff = min_backoff
+        self.retry_at = time.ticks_ms()
+        self.last_io = 0
+        self.queue = []
+        self.dc = 0
+        self.wlan = None
+        self.client = None
+
+    def _wlan_up(self):
+        import network
+        if self.wlan is None:
+            self.wlan = network.WLAN(network.STA_IF)
+            self.wlan.active(True)
+            self.wlan.connect(self.ssid, self.password)
+        elif not self.wlan.isconnected() and self.wlan.status() != network.STAT_CONNECTING:
+            self.wlan.connect(self.ssid, self.password)
+        return self.wlan.isconnected()
+
+    def _failed(self, now):
+        if self.client is not None:
+            try:
+                self.client.sock.close()
+            except Exception:
+                pass
+            self.client = None
+        self.retry_at = time.ticks_add(now, self.backoff)
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def _connect(self, client):
+        # MQTTClient.connect() of lib/umqtt has no timeout, an unreachable or silent broker
+        # would block the caller for the whole TCP timeout. This sends the same CONNECT with
+        # a clean session, without will, user or TLS, on a socket that gives up in time.
+        import socket
+        from umqtt.simple import MQTTException
+        addr = socket.getaddrinfo(client.server, client.port)[0][-1]
+        sock = socket.socket()
+        try:
+            sock.settimeout(self.connect_timeout / 1000)
+            sock.connect(addr)
+            client_id = client.client_id.encode() if isinstance(client.client_id, str) else client.client_id
+            msg = bytearray(b'\x00\x04MQTT\x04\x02\x00\x00\x00\x00')
+            msg[8] = client.keepalive >> 8
+            msg[9] = client.keepalive & 0xFF
+            msg[10] = len(client_id) >> 8
+            msg[11] = len(client_id) & 0xFF
+            n = len(msg) + len(client_id)
+            header = bytearray(b'\x10')
+            while n > 0x7F:
+                header.append((n & 0x7F) | 0x80)
+                n >>= 7
+            header.append(n)
+            sock.write(header)
+            sock.write(msg)
+            sock.write(client_id)
+            resp = sock.read(4)
+            if resp is None or len(resp) != 4 or resp[0] != 0x20 or resp[1] != 0x02:
+                raise OSError('No CONNACK')
+            if resp[3] != 0:
+                raise MQTTException(resp[3])
+            sock.settimeout(None)
+        except Exception:
+            sock.close()
+            raise
+        client.sock = sock
+
+    def connected(self):
+        """Returns True if the MQTT session is up"""
+        return self.client is not None
+
+    def service(self):
+        """Connect if needed, send queued messages and keep the session alive.
+        Returns True if the session is up."""
+        now = time.ticks_ms()
+        if self.client is None:
+            if time.ticks_diff(now, self.retry_at) < 0:
+                return False
+            try:
+                if not self._wlan_up():
+                    raise OSError('WLAN not connected')
+                from umqtt.simple import MQTTClient
+                client = MQTTClient(self.client_id, self.broker, self.port, keepalive = self.keepalive)
+                self._connect(client)
+                self.client = client
+                self.backoff = self.min_backoff
+                self.last_io = now
+            except Exception:
+                self._failed(now)
+                return False
+        try:
+            while self.queue:
+                topic, msg = self.queue[0]
+                if isinstance(msg, dict):
+                    # Consecutive JSON messages to the same topic go in one array on its batch topic
+                    n = 1
+                    while n < len(self.queue) and n < self.batch_size and self.queue[n][0] == topic \
+                          and isinstance(self.queue[n][1], dict):
+                        n += 1
+                    if n == 1:
+                        self.client.publish(topic, json.dumps(msg, separators = (',', ':')))
+                    else:
+                        self.client.publish(topic + '/batch', json.dumps([m for t, m in self.queue[:n]], separators = (',', ':')))
+                else:
+                    n = 1
+                    self.client.publish(topic, msg)
+                del self.queue[:n]
+                self.last_io = now
+            if time.ticks_diff(now, self.last_io) > self.keepalive * 500:
+                self.client.ping()
+                self.last_io = now
+            self.client.check_msg() # Reads the ping responses
+        except Exception:
+            self._failed(now)
+            return False
+        return True
+
+    def publish(self, topic, msg):
+        """Queue a message. It is sent by the next successful service()."""
+        if len(self.queue) >= self.queue_size:
+            self.queue.pop(0)
+            self.dc += 1
+        self.queue.append((topic, msg))
+
+    def publish_json(self, topic, obj):
+        """Queue a dictionary that is sent as compact JSON. Messages queued
+        while offline are sent in batches as a JSON array of the dictionaries
+        to topic + "/batch". A single message always goes to topic."""
+        self.publish(topic, obj)
+
+    def flush(self, timeout = 5000):
+        """Call service() until the queue is empty or timeout ms has passed.
+        Returns True if everything was sent."""
+        start = time.ticks_ms()
+        while True:
+            self.service()
+            if not self.queue:
+                return True
+            if time.ticks_diff(time.ticks_ms(), start) >= timeout:
+                return False
+            time.sleep_ms(100)
+
+    def pending(self):
+        """Returns the number of queued messages"""
+        return len(self.queue)
+
+    def dropped(self):
+        """Return number of messages dropped because the queue was full"""
+        return self.dc
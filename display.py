@@ -0,0 +1,70 @@
+from ssd1306 import SSD1306_I2C
+
+_SET_COL_ADDR = 0x21
+_SET_PAGE_ADDR = 0x22
+
+
+class Display(SSD1306_I2C):
+    """SSD1306_I2C that sends only the changed parts of the frame.
+    A shadow copy of the frame on the display is kept. show() compares every
+    8 pixel high page with the shadow and sends only the columns between the
+    first and the last changed byte of the changed pages. Showing an identical
+    frame sends nothing and allocates nothing. Drawing works exactly as with
+    SSD1306_I2C.
+    """
+    shadow = None
+
+    def __init__(self, width, height, i2c, addr = 0x3C, external_vcc = False):
+        super().__init__(width, height, i2c, addr, external_vcc)
+        # The constructor has already cleared the display
+        self.shadow = bytearray(len(self.buffer))
+        self.shadow[:] = self.buffer
+        self._full = False
+        # One view per page made here, comparing them in show() does not allocate
+        self._buf_pages = [memoryview(self.buffer)[p * width:(p + 1) * width] for p in range(self.pages)]
+        self._shadow_pages = [memoryview(self.shadow)[p * width:(p + 1) * width] for p in range(self.pages)]
+
+    def invalidate(self):
+        """Send the whole frame on the next show(), e.g. after poweron()"""
+        self._full = True
+
+    def show(self):
+        if self.shadow is None:
+            super().show()
+            return
+        buf = self.buffer
+        shadow = self.shadow
+        w = self.width
+        dirty = 0
+        for page in range(self.pages):
+            if self._full or self._buf_pages[page] != self._shadow_pages[page]:
+                dirty |= 1 << page
+        if dirty == 0:
+            return
+        if dirty == (1 << self.pages) - 1:
+            # Every page changed, one transfer is cheaper than one per page
+            super().show()
+            shadow[:] = buf
+            self._full = False
+            return
+
+        offset = (128 - w) // 2
+        src = memoryview(buf)
+        dst = memoryview(shadow)
+        for page in range(self.pages):
+            if not dirty & (1 << page):
+                continue
+            first = page * w
+            last = first + w - 1
+            while buf[first] == shadow[first]:
+                first += 1
+            while buf[last] == shadow[last]:
+                last -= 1
+            self.write_cmd(_SET_COL_ADDR)
+            self.write_cmd(offset + first - page * w)
+            self.write_cmd(offset + last - page * w)
+            self.write_cmd(_SET_PAGE_ADDR)
+            self.write_cmd(page)
+            self.write_cmd(page)
+            self.write_data(src[first:last + 1])
+            dst[first:last + 1] = src[first:last + 1]
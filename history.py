@@ -0,0 +1,78 @@
+import struct
+import time
+
+
+class HistoryLog:
+    """Measurement history stored as fixed size binary records in a ring file.
+    The file is preallocated for capacity records when it is created. A small
+    header at the start of the file holds the number of stored records and
+    the slot where the next record goes. Appending writes one record and the
+    header. When the ring is full the oldest record is overwritten.
+    Reading a record seeks straight to it without reading the rest of the file.
+    """
+    HRV = 0
+    KUBIOS = 1
+
+    _MAGIC = b'HRV1'
+    _HEADER = '<4sHHHH'  # magic, record size, capacity, count, next slot
+    _RECORD = '<IBHHHHhh'  # timestamp, mode, meanPPI, meanHR, SDNN, RMSSD, SD1/SNS, SD2/PNS
+    _HEADER_SIZE = struct.calcsize(_HEADER)
+    _RECORD_SIZE = struct.calcsize(_RECORD)
+
+    def __init__(self, name = 'history.bin', capacity = 50):
+        """Parameters
+
+        name (string): Name of the history file. Created if it does not exist.
+        capacity (int): Number of records kept in a new file. An existing file keeps its own capacity.
+        """
+        self.name = name
+        self._record = bytearray(self._RECORD_SIZE)
+        header = bytearray(self._HEADER_SIZE)
+        try:
+            with open(name, 'rb') as f:
+                n = f.readinto(header)
+            magic, size, self.capacity, self.count, self.head = struct.unpack(self._HEADER, header)
+            if n != self._HEADER_SIZE or magic != self._MAGIC or size != self._RECORD_SIZE:
+                raise ValueError('Not a history file')
+        except (OSError, ValueError):
+            self._create(capacity)
+
+    def _create(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.head = 0
+        with open(self.name, 'wb') as f:
+            f.write(self._pack_header())
+            for i in range(capacity):
+                f.write(self._record)
+
+    def _pack_header(self):
+        return struct.pack(self._HEADER, self._MAGIC, self._RECORD_SIZE, self.capacity, self.count, self.head)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, mode, mean_ppi, mean_hr, sdnn, rmssd, a, b, timestamp = None):
+        """Store one measurement. a and b are SD1 and SD2 for HRV or SNS and PNS for KUBIOS mode."""
+        if timestamp is None:
+            timestamp = int(time.time()) # A float on CPython, the record holds whole seconds
+        struct.pack_into(self._RECORD, self._record, 0, timestamp, mode, mean_ppi, mean_hr, sdnn, rmssd, a, b)
+        with open(self.name, 'r+b') as f:
+            f.seek(self._HEADER_SIZE + self.head * self._RECORD_SIZE)
+            f.write(self._record)
+            self.head = (self.head + 1) % self.capacity
+            if self.count < self.capacity:
+                self.count += 1
+            f.seek(0)
+            f.write(self._pack_header())
+
+    def read(self, n):
+        """Read record n, 0 is the newest. Returns a tuple
+        (timestamp, mode, meanPPI, meanHR, SDNN, RMSSD, SD1/SNS, SD2/PNS)."""
+        if n < 0 or n >= self.count:
+            raise IndexError('No such record')
+        slot = (self.head - 1 - n) % self.capacity
+        with open(self.name, 'rb') as f:
+            f.seek(self._HEADER_SIZE + slot * self._RECORD_SIZE)
+            f.readinto(self._record)
+        return struct.unpack(self._RECORD, self._record)
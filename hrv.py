@@ -0,0 +1,348 @@
+import array
+import math
+
+try:
+    from ulab import numpy as np
+except ImportError:
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+
+def isqrt(n):
+    """Integer square root, the largest x with x*x <= n"""
+    if n < 2:
+        return n
+    # Power of two guess within a factor of two, then Newton from above
+    x = 1
+    t = n
+    while t >= 4:
+        t >>= 2
+        x <<= 1
+    x <<= 1
+    while True:
+        y = (x + n // x) >> 1
+        if y >= x:
+            return x
+        x = y
+
+
+def _round_div(a, b):
+    """round(a / b) for ints, b > 0, ties to even like round()"""
+    q, r = divmod(a, b)
+    r2 = 2 * r
+    if r2 > b or (r2 == b and q & 1):
+        q += 1
+    return q
+
+
+def _round_sqrt(a, b):
+    """round(sqrt(a / b)) for ints, b > 0, ties to even like round()"""
+    if a <= 0:
+        return 0
+    k = isqrt(a // b)
+    # sqrt(a / b) >= k + 0.5 when 4a >= (2k + 1)^2 * b
+    d = 4 * a - (2 * k + 1) * (2 * k + 1) * b
+    if d > 0 or (d == 0 and k & 1):
+        k += 1
+    return k
+
+
+class HRVAccumulator:
+    """Single pass HRV calculator.
+    Intervals are added one at a time with add() as they are detected, or a
+    whole array of intervals at once with add_array(). Only sums are kept,
+    so every metric is available at any time without walking the intervals
+    again. Sums are taken relative to the first interval which keeps the
+    numbers small and the variance exact on single precision floats.
+    The sums are ints, add() does not allocate as long as they stay within
+    the small int range, and results() is calculated with integers only.
+    Mean PPI, SDNN and RMSSD are the same as from the calculators this
+    replaced. The others deliberately differ from them: mean HR is from the
+    mean PPI before rounding, SDSD is the sample standard deviation of all
+    successive differences (the old one left out the last difference and
+    divided its two sums by different counts), and SD1 and SD2 are from
+    SDSD and SDNN before rounding.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget all intervals"""
+        self.n = 0
+        self.ref = 0
+        self.last = 0
+        self.sum = 0      # sum(x - ref)
+        self.sq_sum = 0   # sum((x - ref)^2)
+        self.d_sum = 0    # sum(x[i+1] - x[i])
+        self.d_sq_sum = 0 # sum((x[i+1] - x[i])^2)
+
+    def add(self, ppi):
+        """Add one peak-to-peak interval in ms"""
+        if self.n == 0:
+            self.ref = ppi
+        else:
+            d = ppi - self.last
+            self.d_sum += d
+            self.d_sq_sum += d * d
+        x = ppi - self.ref
+        self.sum += x
+        self.sq_sum += x * x
+        self.last = ppi
+        self.n += 1
+
+    def add_array(self, data):
+        """Add all intervals of an array (e.g. array('H')) in one pass.
+        Uses ulab or numpy array operations when they are available."""
+        count = len(data)
+        if count == 0:
+            return
+        if np is None or count < 2:
+            for ppi in data:
+                self.add(ppi)
+            return
+        if self.n == 0:
+            self.ref = data[0]
+        else:
+            d = data[0] - self.last
+            self.d_sum += d
+            self.d_sq_sum += d * d
+        a = np.array(data, dtype = getattr(np, 'float', float)) - self.ref
+        d = a[1:] - a[:-1]
+        self.sum += int(round(float(np.sum(a))))
+        self.sq_sum += int(round(float(np.sum(a * a))))
+        self.d_sum += int(round(float(np.sum(d))))
+        self.d_sq_sum += int(round(float(np.sum(d * d))))
+        self.last = data[-1]
+        self.n += count
+
+    def mean_ppi(self):
+        """Mean peak-to-peak interval in ms"""
+        if self.n == 0:
+            return 0
+        return self.ref + self.sum / self.n
+
+    def mean_hr(self):
+        """Mean heart rate in bpm"""
+        mean = self.mean_ppi()
+        if mean == 0:
+            return 0
+        return 60000 / mean
+
+    def sdnn(self):
+        """Standard deviation of the intervals in ms"""
+        n = self.n
+        if n < 2:
+            return 0
+        return math.sqrt(max(0, n * self.sq_sum - self.sum * self.sum) / (n * (n - 1)))
+
+    def rmssd(self):
+        """Root mean square of successive differences in ms"""
+        if self.n < 2:
+            return 0
+        return math.sqrt(self.d_sq_sum / (self.n - 1))
+
+    def sdsd(self):
+        """Standard deviation of successive differences in ms"""
+        m = self.n - 1
+        if m < 2:
+            return 0
+        return math.sqrt(max(0, m * self.d_sq_sum - self.d_sum * self.d_sum) / (m * (m - 1)))
+
+    def sd1(self):
+        """Poincare plot SD1 in ms"""
+        return self.sdsd() / math.sqrt(2)
+
+    def sd2(self):
+        """Poincare plot SD2 in ms"""
+        sdnn = self.sdnn()
+        sdsd = self.sdsd()
+        return math.sqrt(max(0, 2 * sdnn * sdnn - sdsd * sdsd / 2))
+
+    def results(self):
+        """Returns rounded (meanPPI, meanHR, SDNN, RMSSD, SDSD, SD1, SD2) as ints.
+        Same values as rounding the float metrics, without any float math."""
+        n = self.n
+        if n == 0:
+            return (0, 0, 0, 0, 0, 0, 0)
+        total = self.ref * n + self.sum
+        mean_hr = _round_div(60000 * n, total) if total > 0 else 0
+        if n < 2:
+            return (_round_div(total, n), mean_hr, 0, 0, 0, 0, 0)
+        # Variances as fractions a / b
+        nn_a = max(0, n * self.sq_sum - self.sum * self.sum)
+        nn_b = n * (n - 1)
+        m = n - 1
+        if m < 2:
+            sd_a = 0
+            sd_b = 1
+        else:
+            sd_a = max(0, m * self.d_sq_sum - self.d_sum * self.d_sum)
+            sd_b = m * (m - 1)
+        # SD2^2 = 2 SDNN^2 - SDSD^2 / 2
+        sd2_a = max(0, 4 * nn_a * sd_b - sd_a * nn_b)
+        return (_round_div(total, n), mean_hr, _round_sqrt(nn_a, nn_b),
+                _round_sqrt(self.d_sq_sum, m), _round_sqrt(sd_a, sd_b),
+                _round_sqrt(sd_a, 2 * sd_b), _round_sqrt(sd2_a, 2 * nn_b * sd_b))
+
+
+class WindowHRV:
+    """Sliding window HRV for live display.
+    Keeps the newest intervals in a ring buffer of fixed size together with
+    their sums, the sums of squares and the sums over successive differences.
+    A new interval is added and the intervals that fell out of the window are
+    removed from the sums, so every update is constant time and the window
+    is never scanned again. The window is the last beats intervals or the
+    last window_ms milliseconds, whichever is shorter.
+    """
+    def __init__(self, beats = 60, window_ms = 60000):
+        """Parameters
+
+        beats (int): Maximum number of intervals in the window, also the ring size
+        window_ms (int): Maximum total length of the intervals in the window in ms
+        """
+        self.size = beats
+        self.window_ms = window_ms
+        self.buf = array.array('H', bytearray(2 * beats))
+        self.reset()
+
+    def reset(self):
+        """Forget all intervals"""
+        self.head = 0     # Oldest interval
+        self.n = 0
+        self.ref = 0
+        self.total = 0    # sum(x), length of the window in ms
+        self.sum = 0      # sum(x - ref)
+        self.sq_sum = 0   # sum((x - ref)^2)
+        self.d_sq_sum = 0 # sum((x[i+1] - x[i])^2) within the window
+
+    def add(self, ppi):
+        """Add one peak-to-peak interval in ms"""
+        if self.n == self.size:
+            self._evict()
+        if self.n == 0:
+            self.ref = ppi
+        else:
+            last = self.buf[(self.head + self.n - 1) % self.size]
+            d = ppi - last
+            self.d_sq_sum += d * d
+        self.buf[(self.head + self.n) % self.size] = ppi
+        self.n += 1
+        x = ppi - self.ref
+        self.total += ppi
+        self.sum += x
+        self.sq_sum += x * x
+        while self.n > 2 and self.total > self.window_ms:
+            self._evict()
+
+    def _evict(self):
+        old = self.buf[self.head]
+        self.head += 1
+        if self.head == self.size:
+            self.head = 0
+        self.n -= 1
+        if self.n:
+            d = self.buf[self.head] - old
+            self.d_sq_sum -= d * d
+        x = old - self.ref
+        self.total -= old
+        self.sum -= x
+        self.sq_sum -= x * x
+
+    def mean_hr(self):
+        """Mean heart rate of the window in bpm, rounded"""
+        if self.n == 0 or self.total == 0:
+            return 0
+        return _round_div(60000 * self.n, self.total)
+
+    def rmssd(self):
+        """RMSSD of the window in ms, rounded"""
+        if self.n < 2:
+            return 0
+        return _round_sqrt(self.d_sq_sum, self.n - 1)
+
+    def sdnn(self):
+        """SDNN of the window in ms, rounded"""
+        n = self.n
+        if n < 2:
+            return 0
+        return _round_sqrt(n * self.sq_sum - self.sum * self.sum, n * (n - 1))
+
+
+def _welford(w, v):
+    # Running [count, mean, sum of squared deviations]
+    w[0] += 1
+    delta = v - w[1]
+    w[1] += delta / w[0]
+    w[2] += delta * (v - w[1])
+
+
+def _rel_se(w):
+    # Standard error of the running mean relative to the mean
+    if w[0] < 2 or w[1] <= 0:
+        return 1.0
+    return math.sqrt(w[2] / (w[0] - 1) / w[0]) / w[1]
+
+
+class Convergence:
+    """Tells when a measurement has enough beats.
+    Clean intervals are added one at a time. The relative standard errors of
+    mean HR, RMSSD and SDNN are tracked with running (Welford) means and
+    variances: of the intervals for mean HR, of the squared successive
+    differences for RMSSD and of the squared deviations from the running
+    mean for SDNN. done() is True when all three are within the tolerance,
+    or when max_beats clean intervals have been added, but never before
+    min_beats. Intervals outside 300 - 2000 ms or more than 30 % from the
+    running mean are counted as artefacts and left out.
+    """
+    def __init__(self, tolerance = 0.05, min_beats = 30, max_beats = 0):
+        """Parameters
+
+        tolerance (float): Largest accepted relative standard error (Default is 0.05 - 5 %)
+        min_beats (int): Clean intervals needed before stopping
+        max_beats (int): Clean intervals that are enough in any case. 0 means no limit.
+        """
+        self.tolerance = tolerance
+        self.min_beats = min_beats
+        self.max_beats = max_beats
+        self.reset()
+
+    def reset(self):
+        """Forget all intervals"""
+        self.n = 0
+        self.rejected = 0
+        self.last = 0
+        self._x = [0, 0.0, 0.0] # count, mean, sum of squared deviations of the intervals
+        self._d = [0, 0.0, 0.0] # the same of the squared successive differences
+        self._e = [0, 0.0, 0.0] # and of the squared deviations from the running mean
+
+    def add(self, ppi):
+        """Add one interval in ms. Returns False if it was left out as an artefact."""
+        mean = self._x[1]
+        if ppi < 300 or ppi > 2000 or (self.n >= 5 and abs(ppi - mean) > 0.3 * mean):
+            self.rejected += 1
+            return False
+        if self.n:
+            d = ppi - self.last
+            _welford(self._d, d * d)
+        if self.n >= 2:
+            e = ppi - mean
+            _welford(self._e, e * e)
+        _welford(self._x, ppi)
+        self.last = ppi
+        self.n += 1
+        return True
+
+    def errors(self):
+        """Returns the relative standard errors of (meanHR, RMSSD, SDNN)"""
+        # HR = 60000 / mean, RMSSD = sqrt(mean d^2), SDNN = sqrt(mean e^2)
+        return (_rel_se(self._x), _rel_se(self._d) / 2, _rel_se(self._e) / 2)
+
+    def done(self):
+        """Returns True when the measurement can be stopped"""
+        if self.n < self.min_beats:
+            return False
+        if self.max_beats and self.n >= self.max_beats:
+            return True
+        return max(self.errors()) <= self.tolerance
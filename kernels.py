@@ -0,0 +1,233 @@
+"""Per-sample inner loops of the signal pipeline.
+
+The loops work on blocks of samples in arrays and keep their state in an
+array('I'), so a whole block is processed with one call. The functions here
+are plain Python. On MicroPython the same functions compiled with
+@micropython.viper from kernels_viper are used instead when the firmware
+supports it. select() switches between them, IMPLEMENTATION tells which
+one is in use.
+"""
+import array
+
+# PeakDetector state slots
+PEAK_POS = 0     # Next write position in the ring
+PEAK_COUNT = 1   # Samples added since reset
+PEAK_SUM = 2     # Sum of the ring
+PEAK_SQ_LO = 3   # Sum of squares of the ring, low 32 bits
+PEAK_SQ_HI = 4   # and high 32 bits
+PEAK_PREV1 = 5   # Previous sample
+PEAK_PREV2 = 6   # Sample before that
+PEAK_ARMED = 7   # 1 when the next peak can be detected
+PEAK_INDEX = 8   # Position in the block
+PEAK_SIZE = 9    # Ring size
+PEAK_SLOTS = 10
+
+# ScrollingPlot state slots
+SPAN_INDEX = 0   # Position in the block
+SPAN_K = 1       # Samples in the current column
+SPAN_DECIMATION = 2
+SPAN_MIN = 3
+SPAN_MAX = 4
+SPAN_SLOTS = 5
+
+# PPGFilter state slots, signed
+FILTER_X1 = 0    # Last two inputs
+FILTER_X2 = 1
+FILTER_H1 = 2    # Last two high-pass outputs
+FILTER_H2 = 3
+FILTER_L1 = 4    # Last two low-pass outputs
+FILTER_L2 = 5
+FILTER_EH = 6    # Rounding error of the high-pass, fed back to the next sample
+FILTER_EL = 7    # and of the low-pass
+FILTER_FH = 8    # Rounding error of the fraction bits of the high-pass feedback
+FILTER_FL = 9    # and of the low-pass
+FILTER_K = 10    # Derivative distance, 0 for no derivative
+FILTER_POS = 11  # Next write position in the derivative ring
+FILTER_RING = 12 # Ring of the last FILTER_K low-pass outputs
+FILTER_MAX_K = 8
+FILTER_SLOTS = FILTER_RING + FILTER_MAX_K
+
+
+def state(slots, typecode = 'I'):
+    """Returns a zeroed state array"""
+    return array.array(typecode, bytearray(4 * slots))
+
+
+def scan_py(ring, st, data, n):
+    """Add samples data[st[PEAK_INDEX]:n] to the ring and its sums.
+    Stops after a sample that makes the previous one a peak candidate:
+    a local maximum above the mean while armed. The caller then tests it
+    against mean + std, which needs more than 32 bits. Rearms the detector
+    when the previous sample is below the mean. Returns 1 when it stopped at
+    a candidate and 0 at the end of the block."""
+    i = st[PEAK_INDEX]
+    size = st[PEAK_SIZE]
+    pos = st[PEAK_POS]
+    count = st[PEAK_COUNT]
+    total = st[PEAK_SUM]
+    sq = st[PEAK_SQ_LO] | st[PEAK_SQ_HI] << 32
+    p1 = st[PEAK_PREV1]
+    p2 = st[PEAK_PREV2]
+    armed = st[PEAK_ARMED]
+    half = size >> 1
+    candidate = 0
+    while i < n:
+        v = data[i]
+        i += 1
+        old = ring[pos]
+        ring[pos] = v
+        pos += 1
+        if pos == size:
+            pos = 0
+        if count >= size:
+            total -= old
+            sq -= old * old
+        total += v
+        sq += v * v
+        count += 1
+        m = count if count < size else size
+        p = p1
+        q = p2
+        p2 = p1
+        p1 = v
+        if m >= half:
+            d = m * p - total
+            if armed:
+                if p > q and p >= v and d > 0:
+                    candidate = 1
+                    break
+            elif d < 0:
+                armed = 1
+    st[PEAK_INDEX] = i
+    st[PEAK_POS] = pos
+    st[PEAK_COUNT] = count
+    st[PEAK_SUM] = total
+    st[PEAK_SQ_LO] = sq & 0xFFFFFFFF
+    st[PEAK_SQ_HI] = sq >> 32
+    st[PEAK_PREV1] = p1
+    st[PEAK_PREV2] = p2
+    st[PEAK_ARMED] = armed
+    return candidate
+
+
+def span_py(data, st, n):
+    """Track min and max of data[st[SPAN_INDEX]:n] until a column is full.
+    Returns the next index, st[SPAN_K] equals the decimation when a column
+    was completed."""
+    i = st[SPAN_INDEX]
+    k = st[SPAN_K]
+    dec = st[SPAN_DECIMATION]
+    lo = st[SPAN_MIN]
+    hi = st[SPAN_MAX]
+    while i < n:
+        v = data[i]
+        i += 1
+        if v < lo:
+            lo = v
+        if v > hi:
+            hi = v
+        k += 1
+        if k >= dec:
+            break
+    st[SPAN_INDEX] = i
+    st[SPAN_K] = k
+    st[SPAN_MIN] = lo
+    st[SPAN_MAX] = hi
+    return i
+
+
+def bandpass_py(data, st, coef, n):
+    """Filter data[:n] in place with a high-pass and a low-pass biquad and
+    optionally the moving average derivative of k samples. Coefficients are
+    (b0, b1, b2, a1, a2, a1 fraction, a2 fraction) of the high-pass and of
+    the low-pass. b0 - b2 are Q14, a1 and a2 are Q28 split in a Q14 part and
+    14 more fraction bits: at high sample rates the poles are too close to 1
+    for Q14. Each product stays within 32 bits for the viper version. The 16
+    bit samples are filtered as 12 bits and the zero centred output is
+    stored as 16 bits around 32768. The bits shifted out of each biquad are
+    added to its next sample, without that the truncation error would be
+    amplified to a large offset by the high-pass poles near 1."""
+    x1 = st[FILTER_X1]
+    x2 = st[FILTER_X2]
+    h1 = st[FILTER_H1]
+    h2 = st[FILTER_H2]
+    l1 = st[FILTER_L1]
+    l2 = st[FILTER_L2]
+    eh = st[FILTER_EH]
+    el = st[FILTER_EL]
+    fh = st[FILTER_FH]
+    fl = st[FILTER_FL]
+    k = st[FILTER_K]
+    pos = st[FILTER_POS]
+    hb0, hb1, hb2, ha1, ha2, hf1, hf2, lb0, lb1, lb2, la1, la2, lf1, lf2 = coef
+    for i in range(n):
+        x = data[i] >> 4
+        f = hf1 * h1 + hf2 * h2 + fh
+        q = f >> 14
+        fh = f - (q << 14)
+        acc = hb0 * x + hb1 * x1 + hb2 * x2 - ha1 * h1 - ha2 * h2 - q + eh
+        h = acc >> 14
+        eh = acc - (h << 14)
+        x2 = x1
+        x1 = x
+        f = lf1 * l1 + lf2 * l2 + fl
+        q = f >> 14
+        fl = f - (q << 14)
+        acc = lb0 * h + lb1 * h1 + lb2 * h2 - la1 * l1 - la2 * l2 - q + el
+        y = acc >> 14
+        el = acc - (y << 14)
+        h2 = h1
+        h1 = h
+        l2 = l1
+        l1 = y
+        if k:
+            old = st[FILTER_RING + pos]
+            st[FILTER_RING + pos] = y
+            pos += 1
+            if pos == k:
+                pos = 0
+            y -= old
+        y = (y << 4) + 32768
+        if y < 0:
+            y = 0
+        elif y > 0xFFFF:
+            y = 0xFFFF
+        data[i] = y
+    st[FILTER_X1] = x1
+    st[FILTER_X2] = x2
+    st[FILTER_H1] = h1
+    st[FILTER_H2] = h2
+    st[FILTER_L1] = l1
+    st[FILTER_L2] = l2
+    st[FILTER_EH] = eh
+    st[FILTER_EL] = el
+    st[FILTER_FH] = fh
+    st[FILTER_FL] = fl
+    st[FILTER_POS] = pos
+    return n
+
+
+def select(name):
+    """Use the 'python' or 'viper' kernels. Returns False if not available."""
+    global scan, span, bandpass, IMPLEMENTATION
+    if name == 'viper':
+        try:
+            import kernels_viper
+        except (ImportError, SyntaxError, ValueError):
+            return False
+        scan = kernels_viper.scan
+        span = kernels_viper.span
+        bandpass = kernels_viper.bandpass
+    else:
+        scan = scan_py
+        span = span_py
+        bandpass = bandpass_py
+    IMPLEMENTATION = name
+    return True
+
+
+IMPLEMENTATION = 'python'
+scan = scan_py
+span = span_py
+bandpass = bandpass_py
+select('viper')
@@ -0,0 +1,197 @@
+"""Viper versions of the kernels in kernels.py, same arguments and results.
+Viper ints are machine words, 32 bits on the Pico, so the sum of squares is
+carried in two 32 bit words. On a 64 bit port (the unix port on a PC) the
+words are masked to 32 bits and the signed state is sign extended after
+loading, on a 32 bit port both are no-ops.
+Importing this module fails on CPython and on firmware without the native
+emitter, kernels.py then keeps the plain Python versions."""
+import micropython
+
+
+@micropython.viper
+def scan(ring, st, data, n: int) -> int:
+    r = ptr16(ring)
+    s = ptr32(st)
+    d = ptr16(data)
+    i = s[8]
+    size = s[9]
+    pos = s[0]
+    count = s[1]
+    total = s[2]
+    lo = uint(s[3])
+    hi = s[4]
+    p1 = s[5]
+    p2 = s[6]
+    armed = s[7]
+    half = size >> 1
+    mask = (uint(1) << 16 << 16) - 1
+    candidate = 0
+    while i < n:
+        v = d[i]
+        i += 1
+        old = r[pos]
+        r[pos] = v
+        pos += 1
+        if pos == size:
+            pos = 0
+        if count >= size:
+            total -= old
+            sq = uint(old * old)
+            if sq > lo:
+                hi -= 1
+            lo = (lo - sq) & mask
+        total += v
+        sq = uint(v * v)
+        lo = (lo + sq) & mask
+        if lo < sq:
+            hi += 1
+        count += 1
+        m = size
+        if count < size:
+            m = count
+        p = p1
+        q = p2
+        p2 = p1
+        p1 = v
+        if m >= half:
+            dev = m * p - total
+            if armed:
+                if p > q and p >= v and dev > 0:
+                    candidate = 1
+                    break
+            elif dev < 0:
+                armed = 1
+    s[8] = i
+    s[0] = pos
+    s[1] = count
+    s[2] = total
+    s[3] = int(lo)
+    s[4] = hi
+    s[5] = p1
+    s[6] = p2
+    s[7] = armed
+    return candidate
+
+
+@micropython.viper
+def span(data, st, n: int) -> int:
+    d = ptr16(data)
+    s = ptr32(st)
+    i = s[0]
+    k = s[1]
+    dec = s[2]
+    lo = s[3]
+    hi = s[4]
+    while i < n:
+        v = d[i]
+        i += 1
+        if v < lo:
+            lo = v
+        if v > hi:
+            hi = v
+        k += 1
+        if k >= dec:
+            break
+    s[0] = i
+    s[1] = k
+    s[3] = lo
+    s[4] = hi
+    return i
+
+
+@micropython.viper
+def bandpass(data, st, coef, n: int) -> int:
+    d = ptr16(data)
+    s = ptr32(st)
+    c = ptr32(coef)
+    wrap = int(uint(1) << 16 << 16)
+    sign = wrap >> 1
+    hb0 = c[0]
+    hb1 = c[1]
+    if hb1 & sign:
+        hb1 -= wrap
+    hb2 = c[2]
+    ha1 = c[3]
+    if ha1 & sign:
+        ha1 -= wrap
+    ha2 = c[4]
+    hf1 = c[5]
+    hf2 = c[6]
+    lb0 = c[7]
+    lb1 = c[8]
+    lb2 = c[9]
+    la1 = c[10]
+    if la1 & sign:
+        la1 -= wrap
+    la2 = c[11]
+    lf1 = c[12]
+    lf2 = c[13]
+    x1 = s[0]
+    x2 = s[1]
+    h1 = s[2]
+    if h1 & sign:
+        h1 -= wrap
+    h2 = s[3]
+    if h2 & sign:
+        h2 -= wrap
+    l1 = s[4]
+    if l1 & sign:
+        l1 -= wrap
+    l2 = s[5]
+    if l2 & sign:
+        l2 -= wrap
+    eh = s[6]
+    el = s[7]
+    fh = s[8]
+    fl = s[9]
+    k = s[10]
+    pos = s[11]
+    i = 0
+    while i < n:
+        x = d[i] >> 4
+        f = hf1 * h1 + hf2 * h2 + fh
+        q = f >> 14
+        fh = f - (q << 14)
+        acc = hb0 * x + hb1 * x1 + hb2 * x2 - ha1 * h1 - ha2 * h2 - q + eh
+        h = acc >> 14
+        eh = acc - (h << 14)
+        x2 = x1
+        x1 = x
+        f = lf1 * l1 + lf2 * l2 + fl
+        q = f >> 14
+        fl = f - (q << 14)
+        acc = lb0 * h + lb1 * h1 + lb2 * h2 - la1 * l1 - la2 * l2 - q + el
+        y = acc >> 14
+        el = acc - (y << 14)
+        h2 = h1
+        h1 = h
+        l2 = l1
+        l1 = y
+        if k:
+            old = s[12 + pos]
+            if old & sign:
+                old -= wrap
+            s[12 + pos] = y
+            pos += 1
+            if pos == k:
+                pos = 0
+            y -= old
+        y = (y << 4) + 32768
+        if y < 0:
+            y = 0
+        elif y > 0xFFFF:
+            y = 0xFFFF
+        d[i] = y
+        i += 1
+    s[0] = x1
+    s[1] = x2
+    s[2] = h1
+    s[3] = h2
+    s[4] = l1
+    s[5] = l2
+    s[6] = eh
+    s[7] = el
+    s[8] = fh
+    s[9] = fl
+    s[11] = pos
+    return n
@@ -0,0 +1,101 @@
+import time
+import json
+
+ANALYZE_URL = "https://analysis.kubioscloud.com/v2/analytics/analyze"
+
+
+def _requests():
+    # Imported on first use, the HTTP client is not needed to boot to the menu
+    try:
+        import urequests as requests
+    except ImportError:
+        import requests
+    return requests
+
+
+class TokenManager:
+    """Kubios Cloud access token cache.
+    The client credentials token is kept in RAM together with its expiry
+    time and reused until shortly before it expires. If a file name is given
+    the token is also saved to flash so that it survives a restart. The
+    clock of the device may be reset on restart so a saved token can still
+    be rejected by the server; analyze() then refreshes it once.
+    """
+    def __init__(self, client_id, client_secret, token_url, name = None, margin = 60):
+        """Parameters
+
+        client_id (string): Kubios client id
+        client_secret (string): Kubios client secret
+        token_url (string): OAuth2 token endpoint
+        name (string): File to keep the token in. None means keep it only in RAM.
+        margin (int): Seconds before the expiry when the token is refreshed
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.name = name
+        self.margin = margin
+        self.access_token = None
+        self.expires_at = 0
+        if name is not None:
+            try:
+                with open(name) as f:
+                    saved = json.load(f)
+                self.access_token = saved["access_token"]
+                self.expires_at = saved["expires_at"]
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def get(self):
+        """Returns a valid access token, requests a new one only when needed"""
+        if self.access_token is None or time.time() >= self.expires_at - self.margin:
+            self.refresh()
+        return self.access_token
+
+    def refresh(self):
+        """Request a new access token"""
+        response = _requests().post(
+            url = self.token_url,
+            data = 'grant_type=client_credentials&client_id={}'.format(self.client_id),
+            headers = {'Content-Type':'application/x-www-form-urlencoded'},
+            auth = (self.client_id, self.client_secret)
+        )
+        try:
+            response_json = response.json()
+        finally:
+            response.close()
+        self.access_token = response_json["access_token"]
+        self.expires_at = time.time() + int(response_json.get("expires_in", 3600))
+        if self.name is not None:
+            with open(self.name, 'w') as f:
+                json.dump({"access_token": self.access_token, "expires_at": self.expires_at}, f)
+
+    def invalidate(self):
+        """Forget the token, the next get() requests a new one"""
+        self.access_token = None
+        self.expires_at = 0
+
+
+def analyze(tokens, api_key, ppi, url = ANALYZE_URL):
+    """Make a readiness analysis of the intervals in ppi (ms).
+    Returns the response as a dictionary. If the token is rejected it is
+    refreshed and the request is made once more."""
+    HRV_Info = {
+        "type": "RRI",
+        "data": ppi,
+        "analysis": {"type": "readiness"}
+    }
+    for attempt in range(2):
+        response = _requests().post(
+            url = url,
+            headers = {"Authorization": "Bearer {}".format(tokens.get()), "X-Api-Key": api_key},
+            json = HRV_Info
+        )
+        if response.status_code == 401 and attempt == 0:
+            response.close()
+            tokens.invalidate()
+            continue
+        try:
+            return response.json()
+        finally:
+            response.close()
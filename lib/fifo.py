@@ -4,44 +4,111 @@ import array
 class Fifo:
     """Interrupt safe fifo implementation
     Buffer used for storage is allocated when the object is instantiated.
-    Methods don't allocate memory.
+    put(), put_nowait() and get() don't allocate memory, only they are safe
+    to call from a hard interrupt. put_nowait() is the one to use there, a
+    full fifo would make put() raise.
     Typecode specifies the type of stored values as defined in array
-    When used from ISR, the ISR should call put() to add data to fifo and
-    the main program must read data from fifo by calling get() often enough
-    to prevent fifo from getting full.
+    When used from ISR, the ISR should call put_nowait() to add data to fifo
+    and the main program must read data from fifo by calling get() often
+    enough to prevent fifo from getting full.
+    get_into() and put_many() move many items at once with at most two slice
+    copies. The memoryview slices allocate a few small objects per call, so
+    they are for the main program or a thread, not for interrupts.
+    The size is rounded up to a power of two so that the indexes wrap with
+    a bit mask.
     """
     def __init__(self, size, typecode = 'H'):
         """Parameters
 
-        size (int): Fifo size. The maximum number of items stored is one less than the given size
+        size (int): Fifo size, rounded up to a power of two. The maximum number of items stored is one less than the size
         typecode (char): Type of data stored in fifo. (Default is 'H' - unsigned short)
         """        
+        n = 1
+        while n < size:
+            n <<= 1
         self.data = array.array(typecode)
-        for i in range(size):
+        for i in range(n):
             self.data.append(0)
+        self._mv = memoryview(self.data)
         self.head = 0
         self.tail = 0
-        self.size = size
+        self.size = n
+        self.mask = n - 1
         self.dc = 0
         
     def put(self, value):
         """Put one item into the fifo. Raises an exception if the fifo is full."""
-        nh = (self.head + 1) % self.size
+        nh = (self.head + 1) & self.mask
         if nh != self.tail:
             self.data[self.head] = value
             self.head = nh
         else:
             self.dc = self.dc + 1
             raise RuntimeError("Fifo is full - value dropped")
+
+    def put_nowait(self, value):
+        """Put one item into the fifo. If the fifo is full the item is dropped and counted
+        instead of raising, so it can be called where an exception must not escape, e.g. a hard interrupt.
+        Returns True if the item was put."""
+        nh = (self.head + 1) & self.mask
+        if nh == self.tail:
+            self.dc = self.dc + 1
+            return False
+        self.data[self.head] = value
+        self.head = nh
+        return True
             
     def get(self):
         """Get one item from the fifo. If the fifo is empty raises an exception and returns the last value."""
         val = self.data[self.tail]
-        if self.empty():
+        if self.head == self.tail:
             raise RuntimeError("Fifo is empty")
         else:
-            self.tail = (self.tail + 1) % self.size
+            self.tail = (self.tail + 1) & self.mask
         return val
+
+    def get_into(self, buf, n = -1):
+        """Copy up to n items (default len(buf)) into buf (array or memoryview).
+        Returns the number of items copied, zero if the fifo is empty."""
+        if n < 0 or n > len(buf):
+            n = len(buf)
+        t = self.tail
+        count = (self.head - t) & self.mask
+        if n > count:
+            n = count
+        if n == 0:
+            return 0
+        dst = memoryview(buf)
+        first = self.size - t
+        if first >= n:
+            dst[0:n] = self._mv[t:t + n]
+        else:
+            dst[0:first] = self._mv[t:self.size]
+            dst[first:n] = self._mv[0:n - first]
+        self.tail = (t + n) & self.mask
+        return n
+
+    def put_many(self, buf, n = -1):
+        """Put up to n items (default len(buf)) from buf (array or memoryview) into the fifo.
+        Items that don't fit are dropped and counted. Returns the number of items put."""
+        if n < 0 or n > len(buf):
+            n = len(buf)
+        h = self.head
+        free = (self.tail - h - 1) & self.mask
+        if n > free:
+            self.dc = self.dc + n - free
+            n = free
+        if n == 0:
+            return 0
+        src = memoryview(buf)
+        first = self.size - h
+        if first >= n:
+            self._mv[h:h + n] = src[0:n]
+        else:
+            self._mv[h:self.size] = src[0:first]
+            self._mv[0:n - first] = src[first:n]
+        self.head = (h + n) & self.mask
+        return n
     
     def dropped(self):
         """Return number of dropped items. A return value that is greater than zero means that fifo is emptied too slowly.""" 
@@ -1,4 +1,23 @@
 
+import array
+import struct
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+MAGIC = b'PPG1'
+HEADER = '<4sHBx' # magic, sample rate, typecode as a byte (MicroPython struct has no 'c')
+HEADER_SIZE = struct.calcsize(HEADER)
+
+
+def write_header(file, rate, typecode = 'H'):
+    """Write the header of a binary recording to an open file. The samples follow as
+    raw little-endian values of the given typecode."""
+    file.write(struct.pack(HEADER, MAGIC, rate, ord(typecode)))
+
+
 class Filefifo:
     """Mock version of Interrupt safe fifo implementation
     This mock version implements an interface that is identical to
@@ -7,23 +26,75 @@ class Filefifo:
     without actually using interrupts. Instead of creating a buffer for data
     the mock fifo reads data from a file. Method put is a dummy function that
     exists for sake of compatibility.
+    The file is either text with one value per line or a binary recording
+    that starts with a header made by write_header(). A binary recording is
+    read through mmap without copying when mmap is available (on a PC) and
+    otherwise in chunks into a reusable buffer. The sample rate of a binary
+    recording is in attribute rate.
     """
     def __init__(self, size, typecode = 'H', name = 'data.txt', repeat = True):
         """Parameters
-        size (integer): Not used - fifo size in the real implementation
+        size (integer): Not used - fifo size in the real implementation. Chunk size for binary recordings without mmap.
         typecode(string): Not used - type of stored values in real implementation
         name (string): Name of the file to read data from. 
         repeat (boolean): End of file behaviour. True means start over from beginning.
         """        
-        self._file  = open(name)
         self._repeat = repeat
+        self.rate = None
+        self._samples = None
+        self._file = open(name, 'rb')
+        header = self._file.read(HEADER_SIZE)
+        if len(header) == HEADER_SIZE and header[:4] == MAGIC:
+            magic, self.rate, typecode = struct.unpack(HEADER, header)
+            typecode = chr(typecode)
+            self._itemsize = struct.calcsize(typecode)
+            self._pos = 0
+            if mmap is not None:
+                self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+                self._samples = memoryview(self._map)[HEADER_SIZE:].cast(typecode)
+                self._count = len(self._samples)
+                self._chunk = None
+            else:
+                self._chunk = array.array(typecode)
+                for i in range(max(size, 64)):
+                    self._chunk.append(0)
+                self._samples = memoryview(self._chunk)
+                self._count = 0
+        else:
+            self._file.close()
+            self._file = open(name)
         
+    def _fill(self):
+        # Make more binary samples available, returns False when out of data
+        if self._chunk is None:
+            if not self._repeat or self._count == 0:
+                return False
+            self._pos = 0
+            return True
+        n = self._file.readinto(self._chunk)
+        if not n and self._repeat:
+            self._file.seek(HEADER_SIZE)
+            n = self._file.readinto(self._chunk)
+        self._pos = 0
+        self._count = (n or 0) // self._itemsize
+        return self._count > 0
+
+
     def put(self, value):
         """Put one item into the fifo. In the mock this function does nothing since data comes from a file."""
         pass
 
+    def put_nowait(self, value):
+        """Put one item into the fifo. In the mock this function does nothing since data comes from a file."""
+        return True
+
     def get(self):
         """Get one item from the fifo. If repeat is set to False and file ends raises an exception and returns the last value."""
+        if self._samples is not None:
+            if self._pos >= self._count and not self._fill():
+                raise RuntimeError("Out of data")
+            self._pos += 1
+            return self._samples[self._pos - 1]
         value = -1
         fail = False
         str = self._file.readline()
@@ -44,6 +115,35 @@ class Filefifo:
 
         return value
     
+    def get_into(self, buf, n = -1):
+        """Read up to n items (default len(buf)) into buf. Returns the number of items read.
+        If repeat is set to False and the file ends returns fewer items."""
+        if n < 0 or n > len(buf):
+            n = len(buf)
+        if self._samples is not None:
+            dst = memoryview(buf)
+            i = 0
+            while i < n:
+                if self._pos >= self._count and not self._fill():
+                    return i
+                k = min(n - i, self._count - self._pos)
+                dst[i:i + k] = self._samples[self._pos:self._pos + k]
+                self._pos += k
+                i += k
+            return n
+        for i in range(n):
+            try:
+                buf[i] = self.get()
+            except RuntimeError:
+                return i
+        return n
+
+    def put_many(self, buf, n = -1):
+        """Put items into the fifo. In the mock this function does nothing since data comes from a file."""
+        if n < 0 or n > len(buf):
+            n = len(buf)
+        return n
+
     def dropped(self):
         """Return number of dropped items. Mock always returns zero."""
         return 0
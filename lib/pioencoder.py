@@ -0,0 +1,122 @@
+try:
+    import rp2
+except ImportError:
+    rp2 = None # Not on RP2, only SimEncoder is available
+
+# Rotary encoder decoders that count the steps without interrupts.
+class PioEncoder:
+    """PioEncoder counts rotary encoder steps in a RP2 PIO state machine.
+    The state machine polls pin A, on a falling edge it reads pin B for the
+    direction and increments or decrements its X register. No interrupt or
+    Python code runs on the edges, so fast turns are not lost. On every loop
+    the program pushes X to the RX FIFO at a point where X is not halfway
+    through an update, count() and delta() only drain the FIFO.
+    State machines of PIO1 (4 - 7) are used so that Piotimer keeps PIO0.
+    """
+    _available = [4, 5, 6, 7]
+
+    def __init__(self, pin_a, pin_b, *args, freq = 100000):
+        """Parameters
+
+        pin_a (int): GPIO pin of encoder output A
+        pin_b (int): GPIO pin of encoder output B
+        freq (int): State machine frequency. Pin A must be stable for a few cycles to count.
+        """
+        from machine import Pin
+        if rp2 is None:
+            raise RuntimeError('PioEncoder needs RP2 PIO')
+        sid = -1
+        if len(args) > 0:
+            sid = int(args[0])
+        if sid < 0: # negative means dynamic allocation
+            if len(self._available) == 0:
+                raise RuntimeError('Out of state machines')
+            sid = self._available[0]
+
+        try:
+            self._available.remove(sid) # Raises ValueError if not in the list
+        except:
+            raise ValueError('State machine ' + str(sid) + ' is not available')
+
+        self.id = sid
+        self._last = 0
+        a = Pin(pin_a, Pin.IN, Pin.PULL_UP)
+        b = Pin(pin_b, Pin.IN, Pin.PULL_UP)
+        self.sm = rp2.StateMachine(self.id, _pio_encoder, freq = freq, in_base = b, jmp_pin = a)
+        self.sm.exec('set(x, 0)')
+        self.sm.exec('set(y, 0)')
+        self.sm.active(1)
+
+    def deinit(self):
+        self.sm.active(0)
+        self._available.append(self.id)
+
+    def count(self):
+        """Returns the signed number of steps since the start"""
+        # The fifo is full of old counts, the push after them is at most one loop old
+        for i in range(self.sm.rx_fifo() + 1):
+            v = self.sm.get()
+        if v & 0x80000000:
+            v -= 0x100000000
+        return v
+
+    def delta(self):
+        """Returns the signed number of steps since the previous call"""
+        v = self.count()
+        d = v - self._last
+        self._last = v
+        return d
+
+
+class SimEncoder:
+    """SimEncoder has the same interface as PioEncoder without any hardware.
+    Steps are added with turn(), e.g. from a test or a recorded input.
+    """
+    def __init__(self, *args, **kwargs):
+        self._count = 0
+        self._last = 0
+
+    def deinit(self):
+        pass
+
+    def turn(self, steps):
+        """Simulate turning the encoder steps steps, negative is the other way"""
+        self._count += steps
+
+    def count(self):
+        """Returns the signed number of steps since the start"""
+        return self._count
+
+    def delta(self):
+        """Returns the signed number of steps since the previous call"""
+        d = self._count - self._last
+        self._last = self._count
+        return d
+
+
+if rp2 is not None:
+    @rp2.asm_pio()
+    def _pio_encoder():
+        # X is the count, Y the level of A on the previous loop
+        wrap_target()
+        label("loop")
+        mov(isr, x)              # X is consistent here, push it
+        push(noblock)            # Dropped while the fifo is full
+        jmp(pin, "high")         # Pin A
+        jmp(not_y, "loop")       # A stays low
+        mov(isr, null)           # Falling edge of A, read B
+        in_(pins, 1)
+        mov(y, isr)
+        jmp(not_y, "down")       # B low is a step backward
+        mov(x, invert(x))        # X + 1 is ~(~X - 1)
+        jmp(x_dec, "inv")
+        label("inv")
+        mov(x, invert(x))
+        set(y, 0)                # A is low
+        jmp("loop")
+        label("down")
+        jmp(x_dec, "loop")       # X - 1, jumps whether X was 0 or not. Y is 0 already.
+        jmp("loop")
+        label("high")
+        set(y, 1)
+        wrap()
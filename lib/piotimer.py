@@ -1,4 +1,6 @@
 import rp2
+import array
+from machine import disable_irq, enable_irq
 
 # Timer class with hard interrupts. 
 class Piotimer:
@@ -6,7 +8,8 @@ class Piotimer:
     Hard interrupts will be handled immediately by the processor which
     makes them suitable for applications where accurate timing is essential.
     Piotimer implements an interface that is identical with MicroPython Timer
-    class.
+    class. In ONE_SHOT mode the state machine is stopped after the first
+    interrupt and the timer is released by deinit().
     See Timer class documentation for more information.
     """
     PERIODIC = 1
@@ -26,8 +29,8 @@ class Piotimer:
         if interval < 100:
             raise RuntimeError('Too high timer frequency')
 
-        if mode != self.PERIODIC:
-            raise RuntimeError('Piotimer supports only PERIODIC operation')
+        if mode != self.PERIODIC and mode != self.ONE_SHOT:
+            raise RuntimeError('Unknown mode')
  
         tid = -1
         if len(args) > 0:
@@ -43,14 +46,23 @@ class Piotimer:
             raise ValueError('Timer ' + str(tid) + ' is not available')
             
         self.id = tid
+        self._callback = callback
             
         self.sm = rp2.StateMachine(self.id, self.pio_timer, freq = 1000000)
         # set interrupt handler
-        self.sm.irq(handler = callback, hard = True)
+        if mode == self.ONE_SHOT:
+            self.sm.irq(handler = self._one_shot, hard = True)
+        else:
+            self.sm.irq(handler = callback, hard = True)
         # Start the StateMachine's running.
         self.sm.put(interval - 5)
         self.sm.active(1)
 
+    def _one_shot(self, sm):
+        self.sm.active(0)
+        if self._callback is not None:
+            self._callback(sm)
+
     def __del__(self):
         self.sm.active(0)
         self._available.append(self.id)
@@ -70,3 +82,153 @@ class Piotimer:
         irq(rel(0))
         wrap()
 
+
+
+# Many timers on one Piotimer.
+class Scheduler:
+    """Scheduler runs many periodic and one shot callbacks on one Piotimer.
+    The Piotimer interrupts at the tick frequency and the callbacks that are
+    due are called from that hard interrupt, so they have the accuracy of
+    the PIO timer and the same rules as Piotimer callbacks: no memory
+    allocation. Deadlines are kept in a binary min-heap built on arrays
+    that are allocated when the object is created. add() and cancel() are
+    O(log n) and the tick handler is O(1) when nothing is due.
+    stop() pauses the tick when nothing needs it, start() resumes it.
+    Tick counts wrap at 30 bits so that they stay small ints.
+    """
+    PERIODIC = Piotimer.PERIODIC
+    ONE_SHOT = Piotimer.ONE_SHOT
+
+    _MASK = 0x3FFFFFFF
+    _HALF = 0x20000000
+
+    def __init__(self, *args, freq = 1000, size = 16):
+        """Parameters
+
+        freq (int): Tick frequency in Hz. Periods are rounded to whole ticks.
+        size (int): Maximum number of callbacks
+        """
+        self.freq = freq
+        self.size = size
+        self.now = 0
+        self.n = 0
+        self._deadline = array.array('i', bytearray(4 * size))
+        self._period = array.array('i', bytearray(4 * size))
+        self._heap = array.array('b', bytearray(size))  # Slots ordered by deadline
+        self._pos = array.array('b', bytearray(size))   # Heap index of each slot, -1 if free
+        self._cb = [None] * size
+        for i in range(size):
+            self._pos[i] = -1
+        self._timer = Piotimer(*args, mode = Piotimer.PERIODIC, freq = freq, callback = self._tick)
+
+    def deinit(self):
+        self._timer.deinit()
+
+    def start(self):
+        """Resume the tick after stop()"""
+        self._timer.sm.active(1)
+
+    def stop(self):
+        """Pause the tick. Deadlines do not advance and no callback is called
+        until start(), the Piotimer is kept."""
+        self._timer.sm.active(0)
+
+    def add(self, callback, mode = PERIODIC, freq = -1, period = -1):
+        """Call callback(slot) at freq Hz or every period ms, or once after period ms
+        in ONE_SHOT mode. Returns the slot that cancel() takes. freq must
+        divide the tick frequency, otherwise ValueError is raised."""
+        if freq > 0:
+            if self.freq % freq:
+                raise ValueError('freq must divide the tick frequency')
+            ticks = self.freq // freq
+        elif period >= 0:
+            ticks = (period * self.freq + 500) // 1000
+        else:
+            raise RuntimeError('Must specify \'freq\' or \'period\'')
+        if ticks < 1:
+            ticks = 1
+        state = disable_irq()
+        try:
+            slot = -1
+            for i in range(self.size):
+                if self._pos[i] < 0:
+                    slot = i
+                    break
+            if slot < 0:
+                raise RuntimeError('Out of scheduler slots')
+            self._cb[slot] = callback
+            self._period[slot] = ticks if mode == self.PERIODIC else 0
+            self._deadline[slot] = (self.now + ticks) & self._MASK
+            self._heap[self.n] = slot
+            self._pos[slot] = self.n
+            self.n += 1
+            self._up(self.n - 1)
+        finally:
+            enable_irq(state)
+        return slot
+
+    def cancel(self, slot):
+        """Stop the callback of a slot. Cancelling a free slot does nothing."""
+        state = disable_irq()
+        try:
+            if self._pos[slot] >= 0:
+                self._remove(self._pos[slot])
+        finally:
+            enable_irq(state)
+
+    def _key(self, slot):
+        # Ticks until the deadline, negative when it has passed
+        d = (self._deadline[slot] - self.now) & self._MASK
+        if d >= self._HALF:
+            d -= self._MASK + 1
+        return d
+
+    def _swap(self, i, j):
+        a = self._heap[i]
+        b = self._heap[j]
+        self._heap[i] = b
+        self._heap[j] = a
+        self._pos[b] = i
+        self._pos[a] = j
+
+    def _up(self, i):
+        while i > 0:
+            parent = (i - 1) >> 1
+            if self._key(self._heap[i]) >= self._key(self._heap[parent]):
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _down(self, i):
+        while True:
+            child = 2 * i + 1
+            if child >= self.n:
+                break
+            if child + 1 < self.n and self._key(self._heap[child + 1]) < self._key(self._heap[child]):
+                child += 1
+            if self._key(self._heap[i]) <= self._key(self._heap[child]):
+                break
+            self._swap(i, child)
+            i = child
+
+    def _remove(self, i):
+        slot = self._heap[i]
+        self.n -= 1
+        if i != self.n:
+            self._swap(i, self.n)
+            self._down(i)
+            self._up(i)
+        self._pos[slot] = -1
+        self._cb[slot] = None
+
+    def _tick(self, sm):
+        self.now = (self.now + 1) & self._MASK
+        while self.n and self._key(self._heap[0]) <= 0:
+            slot = self._heap[0]
+            cb = self._cb[slot]
+            if self._period[slot]:
+                self._deadline[slot] = (self._deadline[slot] + self._period[slot]) & self._MASK
+                self._down(0)
+            else:
+                self._remove(0)
+            cb(slot)
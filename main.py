@@ -2,23 +2,52 @@
 # Importing Necessary Libraries and Files #
 ###########################################
 
-from machine import ADC,Pin, I2C
-from ssd1306 import SSD1306_I2C
-from fifo import Fifo
+#Only What The Menu Needs Is Imported Here, The Rest On First Use
 import time,utime
-from piotimer import Piotimer as Timer
+BOOT_START = time.ticks_ms()
+import machine
+from machine import Pin, I2C
+from display import Display
+from fifo import Fifo
+from pioencoder import PioEncoder
+import uasyncio as asyncio
 from led import Led
-import math
+import array
 import framebuf
-import Heart_Empty,line # Our Own Shapes Using Bitmap
-import network
-from umqtt.simple import MQTTClient 
-import urequests as requests 
-import ujson
-import json  # Add this line to import the json module
+import gc
+import Heart_Empty # Our Own Shape Using Bitmap
+from connection import ConnectionManager
+import ubinascii
 
 import micropython
+from micropython import const
 micropython.alloc_emergency_exception_buf(200)
+from profiler import Profiler
+
+
+#####################################################
+#  Profiling, PROFILE = 0 Compiles The Calls Away   #
+#####################################################
+
+PROFILE = const(0) #1 Collects Stage Times, Shown With SW_0 And Sent With The Results
+P_SAMPLER = const(0) #Timed In Pipeline.step
+P_DETECTOR = const(1) #Timed In Pipeline.step
+P_HRV = const(2)
+P_DISPLAY = const(3)
+P_MQTT = const(4)
+
+
+#############################
+#  Input Events In The Fifo #
+#############################
+
+PREV = 0   #Encoder Turned One Step Back
+NEXT = 1   #Encoder Turned One Step Forward
+PRESS = 2  #Encoder Button
+SW_2 = 3   #Yes Button
+SW_0 = 4   #No Button
+TIMEOUT = 5 #Measurement Took The Longest Time Allowed
+CONVERGED = 6 #HRV Results Are Stable, Measurement Can Stop
 
 
 #############################
@@ -27,30 +56,82 @@ micropython.alloc_emergency_exception_buf(200)
 
 
 class RotaryEncoder:
-    def __init__(self, pin_a, pin_b, pin_sw, min_interval):
-        self.pin_a = Pin(pin_a, Pin.IN, Pin.PULL_UP)
-        self.pin_b = Pin(pin_b, Pin.IN, Pin.PULL_UP)
+    def __init__(self, pin_a, pin_b, pin_sw, min_interval, decoder=None):
+        #Steps Are Counted In A PIO State Machine, Not In Interrupts
+        self.decoder = decoder if decoder is not None else PioEncoder(pin_a, pin_b)
+        self.steps = 0 #Steps Read From The Decoder, Not Yet Returned As Events
         self.pin_sw = Pin(pin_sw, Pin.IN, Pin.PULL_UP)
-        self.Rotation = Fifo(40) #FIFO queue to store rotation events
+        self.Rotation = Fifo(16) #FIFO queue to store button events
+        self.flag = asyncio.ThreadSafeFlag() #Wakes Up The Task Waiting For An Event
         self.min_interval = min_interval #Min. Time Between Switch Presses To Avoid Bouncing
         self.prev_press_time = 0
-        self.Menu_state = False
-        self.pin_a.irq(trigger=Pin.IRQ_FALLING, handler=self.rotary_handler)
         self.pin_sw.irq(trigger=Pin.IRQ_FALLING, handler=self.toggle_handler)
 
-
-    #Interrupt For Rotation
-    def rotary_handler(self, pin):
-        if self.pin_b.value() and self.Menu_state:
-            self.Rotation.put(1)
-        elif not self.pin_b.value() and self.Menu_state:
-            self.Rotation.put(0)
+    #Called From Interrupts, Stores The Event And Wakes Up The Waiting Task
+    def put(self, event):
+        self.Rotation.put_nowait(event) #Full Only Counts A Drop, Raising In A Hard IRQ Would Allocate
+        self.flag.set()
 
     #Interrupt For Button
     def toggle_handler(self, pin):
         current_time = time.ticks_ms()
-        if (time.ticks_diff(current_time, self.prev_press_time) > self.min_interval) and self.Menu_state:
-            self.Rotation.put(2)
+        if time.ticks_diff(current_time, self.prev_press_time) > self.min_interval:
+            self.put(PRESS)
+            self.prev_press_time = current_time
+
+    #Forgets Events That Came Before The Wait
+    def clear(self):
+        while self.Rotation.has_data():
+            self.Rotation.get()
+        self.decoder.delta()
+        self.steps = 0
+
+    #Waits For The Next Event, Buttons Wake It Up And The Step Count Is Checked Every 20 ms
+    async def next_event(self):
+        while True:
+            if self.Rotation.has_data():
+                return self.Rotation.get()
+            if self.steps == 0:
+                self.steps = self.decoder.delta()
+            if self.steps > 0:
+                self.steps -= 1
+                return NEXT
+            if self.steps < 0:
+                self.steps += 1
+                return PREV
+            try:
+                await asyncio.wait_for_ms(self.flag.wait(), 20)
+            except asyncio.TimeoutError:
+                pass
+
+    #Waits Until One Of The Given Events Happens And Returns It
+    async def wait_for(self, *events):
+        self.clear()
+        while True:
+            event = await self.next_event()
+            if event in events:
+                return event
+
+
+#############################
+#  Class For Push Buttons   #
+#############################
+
+
+class Button:
+    def __init__(self, pin, event, encoder, min_interval):
+        self.pin = Pin(pin, Pin.IN, Pin.PULL_UP)
+        self.event = event
+        self.encoder = encoder #Button Events Go To The Same Fifo As The Encoder Events
+        self.min_interval = min_interval
+        self.prev_press_time = 0
+        self.pin.irq(trigger=Pin.IRQ_FALLING, handler=self.handler)
+
+    #Interrupt For Button
+    def handler(self, pin):
+        current_time = time.ticks_ms()
+        if time.ticks_diff(current_time, self.prev_press_time) > self.min_interval:
+            self.encoder.put(self.event)
             self.prev_press_time = current_time
             
             
@@ -106,7 +187,7 @@ class MenuDisplay:
     #  Function To Show Welcome Text   #
     ####################################
     
-    def Welcome_Text(self):
+    async def Welcome_Text(self):
         self.oled.fill(1)
         self.led_onboard.on()
         self.oled.text("Welcome to", 26, 5, 0)
@@ -114,22 +195,22 @@ class MenuDisplay:
         self.oled.text("project!", 33, 25, 0)
         self.oled.blit(heart, 47, 40) #Custom Heart Shape
         self.oled.show()
-        time.sleep(3)
+        await asyncio.sleep(3)
     
     ###########################################
     #  Function to Show Press To Start Text   #
     ###########################################
 
-    def Press_Start(self):
+    async def Press_Start(self):
         self.led_onboard.on()
         self.oled.fill(0)
         self.oled.text("Place Finger On",0,18,1)
         self.oled.text("The Sensor For",0,28,1)
         self.oled.text("5secs Then...",0,38,1)
-        oled.show()
-        time.sleep(2.4)
-        oled.fill(0)
-        self.oled.blit(line, 0,35)#Custom Line
+        self.oled.show()
+        await asyncio.sleep(2.4)
+        self.oled.fill(0)
+        self.oled.blit(Line_Bitmap(), 0,35)#Custom Line
         self.oled.text("Press the Button",0,0,1)
         self.oled.text("To start Seeing",0,12,1)
         self.oled.text("Your HeartBeat!!",0,22,1)
@@ -140,12 +221,12 @@ class MenuDisplay:
     #  Function To Show Goodbye Text   #
     ####################################
 
-    def GoodBye(self):
+    async def GoodBye(self):
         self.oled.fill(0)
         self.oled.text("Goodbye!!!",25,26,1)
         self.oled.blit(heart, 47, 40)#Custom Heart Shape
         self.oled.show()
-        time.sleep(3)
+        await asyncio.sleep(3)
         self.led_onboard.off()
         self.oled.fill(0)
         self.oled.show()
@@ -154,7 +235,7 @@ class MenuDisplay:
     #  Function To Display Info for HRV and Kubios HRV  #
     ######################################################
 
-    def Show_Info(self,mode,MeanPPI,MeanHR,SDNN,RMSSD,SNS_OR_SD1,PNS_OR_SD2):
+    async def Show_Info(self,mode,MeanPPI,MeanHR,SDNN,RMSSD,SNS_OR_SD1,PNS_OR_SD2):
         
         self.oled.fill(0)
         self.oled.text('MeanPPI:'+ MeanPPI +'ms', 0, 0, 1)
@@ -174,7 +255,7 @@ class MenuDisplay:
         
         self.oled.show()
     
-        time.sleep(1)
+        await asyncio.sleep(1)
         
     ##########################################
     #  Function To Display Save For History  #
@@ -189,207 +270,104 @@ class MenuDisplay:
         self.oled.show()
 
 
-#######################################################
-# The Order of Fucntions Being Calld Is From Bottom Up#
-#######################################################
-
-#Calculates Threashold
-def calculate_threshold(arr):
-    mean = sum(arr) / len(arr)
-    std_dev = math.sqrt(sum((x - mean) ** 2 for x in arr) / len(arr))
-    threshold = mean +  std_dev
-    return threshold
-
-#Calculates Peaks
-def detect_peaks(arr):
-    global PPI
-    peaks = []
-    above_threshold = False
-    threshold=calculate_threshold(arr)
-    for i in range(1, len(arr) - 1):
-        if arr[i] > arr[i - 1] and arr[i] > arr[i + 1] and arr[i] > threshold and not above_threshold:
-            peaks.append(i)
-            PPI.append(i)
-            above_threshold = True
-        elif i < threshold and above_threshold:
-            above_threshold = False
-    return peaks
-
-#Calculates BPM
-def calculate_heart_rate(sensor_values):
-    peaks = detect_peaks(sensor_values)
-    if len(peaks) < 2:
-        return None, None  # Return None for BPM and PPG if not enough peaks
-    time_between_peaks = (peaks[-1] - peaks[0]) / len(sensor_values)
-    heart_rate = 60 / time_between_peaks
-    return heart_rate  # Return BPM
-
-#Stop Process And Display
-def stop_collection(tim):
-    global collection_done, sensor_values
-    collection_done = True
-    heart_rate = calculate_heart_rate(sensor_values)
-    display_bpm_ppg(heart_rate, sensor_values)
-
-#Get ADC Values
-def collect_values():
-    global collection_done, sensor_values
-    collection_done = False
-    Timer.init(period=3_600, mode=machine.Timer.ONE_SHOT, callback=stop_collection)
-    while not collection_done:
-        if encoder.pin_sw.value() == 0:
-            return False
-        sensor_value = adc.read_u16()
-        sensor_values.append(sensor_value)
-        utime.sleep_ms(2)
-    sensor_values.clear()
-    return True
-    
-
 ######################################
 # Function To Show PPG Graph and BPM #
 ######################################
 
-def display_bpm_ppg(bpm, sensor_values):
-    DISPLAY_WIDTH = 128
-    DISPLAY_HEIGHT = 64
+def display_bpm_ppg(bpm):
     # Display BPM text at the top left corner
     oled.fill_rect(0, 3, 128, 12, 1)
     oled.text("BPM:", 39,5, 0)
     if bpm is not None and 30 <= bpm <= 150:
         oled.text(str(round(bpm)), 69, 5, 0)  # BPM value next to the label
-    oled.fill_rect(0, 15, 128, 64, 0)
-
-    # Allocate more space for the PPG graph
-    top_margin = 12  # Reduce the top margin to give more space to the graph
-    graph_height = DISPLAY_HEIGHT - top_margin  # Adjust graph height
+    oled.fill_rect(0, 15, 128, 1, 0)
 
-    # Display PPG graph below the BPM text
-    max_sensor_values = max(sensor_values)
-    min_sensor_values = min(sensor_values)
-    sensor_values_range = max_sensor_values - min_sensor_values
+    # Only the new columns were drawn into the plot, copy it below the BPM text
     led.on()
-    for i in range(len(sensor_values) - 1):
-        x0 = i * (DISPLAY_WIDTH - 1) // len(sensor_values)
-        x1 = (i + 1) * (DISPLAY_WIDTH - 1) // len(sensor_values)
-        y0 = graph_height - 1 - int((sensor_values[i] - min_sensor_values) / sensor_values_range * (graph_height - top_margin))
-        y1 = graph_height - 1 - int((sensor_values[i + 1] - min_sensor_values) / sensor_values_range * (graph_height - top_margin))
-        oled.line(x0, y0 + top_margin, x1, y1 + top_margin, 1)
+    plot.draw(oled, 16)
+
+    # Live HRV Of The Sliding Window Below The Plot
+    oled.fill_rect(0, 56, 128, 8, 0)
+    if live.n >= 2:
+        oled.text("RMSSD" + str(live.rmssd()), 0, 56, 1)
+        oled.text("SDNN" + str(live.sdnn()), 72, 56, 1)
+    if PROFILE: profiler.start(P_DISPLAY)
     oled.show()
+    if PROFILE: profiler.stop(P_DISPLAY)
     led.off()
 
 
      
-#####################################
-#  Functions To Calculate HRV Info  #
-#####################################
-     
-     
-def meanPPI_calculator(data):
-    sumPPI = 0 
-    for i in data:
-        sumPPI += i
-    rounded_PPI = round(sumPPI/len(data), 0)
-    return int(rounded_PPI)
-
-def meanHR_calculator(meanPPI):
-    rounded_HR = round(60*1000/meanPPI, 0)
-    return int(rounded_HR)
-
-def SDNN_calculator(data, PPI):
-    summary = 0
-    for i in data:
-        summary += (i-PPI)**2
-    SDNN = (summary/(len(data)-1))**(1/2)
-    rounded_SDNN = round(SDNN, 0)
-    return int(rounded_SDNN)
-
-def RMSSD_calculator(data):
-    i = 0
-    summary = 0
-    while i < len(data)-1:
-        summary += (data[i+1]-data[i])**2
-        i +=1
-    rounded_RMSSD = round((summary/(len(data)-1))**(1/2), 0)
-    return int(rounded_RMSSD)
-
-def SDSD_calculator(data):
-    PP_array = []
-    i = 0
-    first_value = 0
-    second_value = 0
-    while i < len(data)-1:
-        PP_array.append(int(data[i+1])-int(data[i]))
-        i += 1
-    i = 0
-    while i < len(PP_array)-1:
-        first_value += float(PP_array[i]**2)
-        second_value += float(PP_array[i])
-        i += 1
-    first = first_value/(len(PP_array)-1)
-    second = (second_value/(len(PP_array)))**2
-    rounded_SDSD = round((first - second)**(1/2), 0)
-    return int(rounded_SDSD)
-  
-def SD1_calculator(SDSD):
-    rounded_SD1 = round(((SDSD**2)/2)**(1/2), 0)
-    return int(rounded_SD1)
-
-def SD2_calculator(SDNN, SDSD):
-    rounded_SD2 = round(((2*(SDNN**2))-((SDSD**2)/2))**(1/2), 0)
-    return int(rounded_SD2)
-     
-
-
-     
 ####################################
 #  Functions To Save/Read History  #
 ####################################
    
      
-def New_History(New_Data):
-    Date_Time = utime.localtime()
-    year, month, day, hour, minute, _, _, _ = Date_Time
-    Date_Time = f"{day}.{month}.{year} {hour}:{minute}"
-    f = open('Prev_History.txt','w')
-    f.write(Date_Time+New_Data)
-    f.close()
+def New_History(mode, mean_PPI, mean_HR, SDNN, RMSSD, A, B):
+    Init_History()
+    history.append(mode, int(mean_PPI), int(mean_HR), int(SDNN), int(RMSSD), int(A), int(B))
 
 
 
-def Previous_History():
-    History = open('Prev_History.txt','r')
-    History_Data = History.read()
-    Formated_Data = History_Data.split('\n')
-    History.close()
-    y = -11
+#Shows Record n Of The History, 0 Is The Newest
+def Previous_History(n):
     oled.fill(0)
+    if n >= len(history):
+        oled.text("No History Yet",0,28,1)
+        oled.show()
+        return
+    Time_Stamp, mode, mean_PPI, mean_HR, SDNN, RMSSD, A, B = history.read(n)
+    year, month, day, hour, minute, _, _, _ = utime.localtime(Time_Stamp)
+    Formated_Data = [f"{day}.{month}.{year} {hour}:{minute}",
+                     f"MeanPPI:{mean_PPI}ms", f"MeanHR:{mean_HR}bpm",
+                     f"SDNN:{SDNN}ms", f"RMSSD:{RMSSD}ms"]
+    if mode == HistoryLog.HRV:
+        Formated_Data.append(f"SD1:{A} SD2:{B}")
+    else:
+        Formated_Data.append(f"SNS:{A} PNS:{B}")
+    y = -11
     for i in Formated_Data:
         y+=11
         oled.text(i,0,y,1)
     oled.show()
-          
      
      
-###################################
-#  Functions To Connect to WLAN   #
-###################################
-     
-def connect_wlan():
-    # Connecting to the group WLAN
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    wlan.connect(SSID, PASSWORD)
-    Attempts = 0
-    # Attempt to connect once per second
-    while wlan.isconnected() == False and Attempts <= 150:
-        Attempts +=1
- 
-def connect_mqtt():
-    mqtt_client=MQTTClient("", BROKER_IP)
-    mqtt_client.connect(clean_session=True)
-    return mqtt_client
- 
+#####################################
+#  Function To Make The MQTT Result #
+#####################################
+
+def HRV_Result(mean_PPI, mean_HR, SDNN, RMSSD, SDSD, SD1, SD2):
+    Result = {"device": DEVICE_ID, "time": time.time(), "mean_ppi": mean_PPI, "mean_hr": mean_HR,
+              "sdnn": SDNN, "rmssd": RMSSD, "sdsd": SDSD, "sd1": SD1, "sd2": SD2}
+    if MQTT_PPI:
+        Result["ppi"] = list(PPI)
+    return Result
+
+
+#######################################
+#  Functions To Show Profiler Stats   #
+#######################################
+
+def Profile_Stats():
+    Init_Measurement()
+    Stats = profiler.report()
+    Stats["boot"] = [BOOT_MS, BOOT_MEM]
+    Stats["dropped"] = {"sampler": sampler.dropped(), "encoder": encoder.Rotation.dropped(),
+                        "recorder": recorder.dropped(), "pipeline": pipeline.dropped(),
+                        "mqtt": connections.dropped()}
+    return Stats
+
+#Average And Max Time In us Of Each Stage, Then The Dropped Counts
+def Show_Stats():
+    Init_Measurement()
+    oled.fill(0)
+    y = 0
+    for i, name in enumerate(profiler.names):
+        oled.text(f"{name[:4]} {profiler.t_avg[i]} {profiler.t_max[i]}",0,y,1)
+        y += 9
+    oled.text(f"Drop S{sampler.dropped()} R{recorder.dropped()} P{pipeline.dropped()}",0,y,1)
+    oled.text(f"Enc{encoder.Rotation.dropped()} M{connections.dropped()}",0,y + 9,1)
+    oled.show()
 
 
 #######################################
@@ -398,9 +376,9 @@ def connect_mqtt():
 
 
 
-#OLED 
+#OLED, Only Changed Parts Of The Screen Are Sent On show()
 i2c = I2C(1, scl=Pin(15), sda=Pin(14), freq=400000)
-oled = SSD1306_I2C(128, 64, i2c)
+oled = Display(128, 64, i2c)
 
 #Encoder
 encoder = RotaryEncoder(10, 11, 12, 300)
@@ -410,20 +388,112 @@ led_onboard = Pin("LED", Pin.OUT)
 led_onboard.off()
 menu_display = MenuDisplay(oled,led_onboard)
 
-#sw_0 And sw_2 Buttons
-On_btn = Pin(7,Pin.IN, Pin.PULL_UP)
-KG_btn= Pin(9,Pin.IN, Pin.PULL_UP)
+#sw_0 And sw_2 Buttons, Their Presses Go To The Encoder Event Fifo
+On_btn = Button(7, SW_2, encoder, 300)
+KG_btn = Button(9, SW_0, encoder, 300)
 
-#Custom Made Heart and Line Using Bitmap
+#Custom Made Heart Using Bitmap, The Line Is Made When It Is First Shown
 heart = framebuf.FrameBuffer(Heart_Empty.img, 32, 32, framebuf.MONO_VLSB)
-line = framebuf.FrameBuffer(line.img, 127, 32, framebuf.MONO_VLSB)
-
-#ADC
-adc = machine.ADC(0)
+line = None
+
+def Line_Bitmap():
+    global line
+    if line is None:
+        import line as line_img
+        line = framebuf.FrameBuffer(line_img.img, 127, 32, framebuf.MONO_VLSB)
+    return line
+
+#Raw Signal Of The Last Measurement Saved To Flash, Can Be Replayed With Filefifo
+#Flash Writes Disable Interrupts For Tens Of ms, Sampler Ticks Are Lost Then. Only For Collecting Test Data.
+RECORD = False
+RECORD_FILE = 'session.bin'
+
+#Sampling Rate In Hz, Peaks Are Timed Between Samples So 100 Hz Is Still Accurate To About 1 ms
+#The 1 kHz Scheduler Tick Must Be A Multiple Of It, e.g. 100, 125, 200, 250 Or 500, Else Sampler Raises ValueError
+RATE = 250
+
+#Longest Measurement, It Is Stopped Like With A Press After This
+MAX_MEASURE_MS = 5 * 60 * 1000
+
+#Measurement Stops By Itself When Mean HR, RMSSD And SDNN Are Within 10 % (Standard Error)
+#After At Least 30 Clean Beats, Or After 300 Clean Beats In Any Case. False Waits For A Press.
+EARLY_STOP = False
+
+#Acquisition And Detection Run On Core 1 With _thread, False Runs Them In The Detector Task
+MULTICORE = True
+
+#Measurement Parts Are Made When The First Measurement Starts
+sampler = None
+detector = None
+hrv = None
+live = None
+convergence = None
+ppg_filter = None
+pipeline = None
+scheduler = None
+plot = None
+recorder = None
+
+def Init_Measurement():
+    global sampler, detector, hrv, live, convergence, plot, recorder, ppg_filter, pipeline, scheduler
+    if sampler is not None:
+        return
+    from sampler import Sampler
+    from peaks import PeakDetector
+    from ppgfilter import PPGFilter
+    from hrv import HRVAccumulator, WindowHRV, Convergence
+    from plot import ScrollingPlot
+    from recorder import Recorder
+    from pipeline import Pipeline
+    from piotimer import Scheduler
+    Init_History()
+
+    #One 1 kHz PIO Tick For The Sampler And The Measurement Deadline, Runs Only While Measuring
+    scheduler = Scheduler(freq=1000)
+    scheduler.stop()
+
+    #ADC Sampled At A Fixed Rate By A Hard Timer Interrupt
+    sampler = Sampler(26, RATE, scheduler=scheduler)
+
+    #0.5-5 Hz Band-Pass And 16 ms Derivative, Removes Baseline Wander Before The Detector
+    ppg_filter = PPGFilter(RATE, 0.5, 5, max(1, 4 * RATE // 250))
+
+    #Streaming Peak Detector, Threshold From The Last 3 Seconds, No Beats Closer Than 300 ms
+    detector = PeakDetector(RATE, 3 * RATE, 300)
+
+    #HRV Metrics Calculated In A Single Pass Over The Intervals
+    hrv = HRVAccumulator()
+
+    #Live HRV Of The Last 60 Beats Or 60 Seconds, Updated On Every Beat
+    live = WindowHRV(60, 60000)
+
+    #Knows When There Are Enough Beats, Used With EARLY_STOP
+    convergence = Convergence(0.1, 30, 300)
+
+    #PPG Graph Below The BPM Text, About 3.6 s Across The Screen, Live HRV Below It
+    plot = ScrollingPlot(128, 40, max(1, 7 * RATE // 250))
+
+    recorder = Recorder(RATE, 256)
+
+    #Sampler, Filter And Detector On The Second Core, So Network And Display Do Not Stall Them
+    #Their Stages Are Profiled Inside The Pipeline, On The Core They Run On
+    pipeline = Pipeline(sampler, ppg_filter, detector, recorder, MULTICORE, profiler=profiler if PROFILE else None)
 
 #LED
 led = Led(21)
 
+#Timing And Allocation Of The Hot Paths
+profiler = Profiler(("sampler", "detector", "hrv", "display", "mqtt"))
+
+#Measurement History, Ring Of The 50 Newest Records, Opened On First Use
+history = None
+
+def Init_History():
+    global history, HistoryLog
+    if history is None:
+        from history import HistoryLog
+        history = HistoryLog('history.bin', 50)
+
 
 
 ##################################################
@@ -435,6 +505,17 @@ SSID = "KME761_Group_5"
 PASSWORD = "TeamFive12345?"
 BROKER_IP = "192.168.5.253"
 
+#Results As One Compact JSON Message, Optionally With The Raw PPI
+#Results Queued While Offline Arrive Later As A JSON Array On RESULT_TOPIC + "/batch"
+MQTT_JSON = True
+MQTT_PPI = False
+DEVICE_ID = ubinascii.hexlify(machine.unique_id()).decode()
+RESULT_TOPIC = "hrv/" + DEVICE_ID + "/result"
+STATS_TOPIC = "hrv/" + DEVICE_ID + "/stats"
+
+#WLAN And MQTT Session Kept Up Between Measurements
+connections = ConnectionManager(SSID, PASSWORD, BROKER_IP)
+
 
 ##################################
 #  Kubios API, Login, And URI    #
@@ -448,399 +529,383 @@ LOGIN_URL = "https://kubioscloud.auth.eu-west-1.amazoncognito.com/login"
 TOKEN_URL = "https://kubioscloud.auth.eu-west-1.amazoncognito.com/oauth2/token" 
 REDIRECT_URI = "https://analysis.kubioscloud.com/v1/portal/login"
 
+#Access Token Kept Until It Expires, Also Over Restarts, Loaded On First Use
+tokens = None
+
+def Kubios_Tokens():
+    global tokens
+    if tokens is None:
+        import kubios
+        tokens = kubios.TokenManager(CLIENT_ID, CLIENT_SECRET, TOKEN_URL, 'kubios_token.json')
+    return tokens
+
 
 ####################################
 #  Assigned States and Variables   #
 ####################################
 
-start_state = True
-begining = True
-collect_state=True
-work_state=True
-sensor_values = []
 PPI = []
-Timer = machine.Timer(-1)
+network_started = False
+BOOT_MS = 0  #Time From Start Of main.py To The First Screen
+BOOT_MEM = 0 #Heap In Use At That Point
+block = array.array('H', bytearray(2 * 32)) #Samples Drained From The Sampler Fifo At Once
+intervals = array.array('H', bytearray(2 * 8)) #Intervals Found In One Block
+measuring = asyncio.Event() #Set By The UI While A Measurement Runs
+measured = asyncio.Event()  #Set By The Detector When The Last Samples Are Handled
+save_queue = []             #History Records Waiting To Be Written
+save_event = asyncio.Event()
 
 
-    ###############
-    #  Main Loop  #   
-    ###############
+#######################################################
+#  Tasks, They Talk Over The Fifos, Events And Queues #
+#######################################################
 
 
-while True:
-    if (On_btn.value() == 0 or KG_btn.value()== 0) and start_state: #Turn On Machine
-        if begining: #If It Begins From Begining
-            menu_display.Welcome_Text()
-            encoder.current_row = 0
-            begining = False
-        menu_display.update()
-        encoder.Menu_state = True
-        while encoder.Menu_state:
-            
+#Drains The Sampler Fifo, Finds The Peaks And Draws The Graph
+async def detector_task():
+    while True:
+        await measuring.wait()
+        ppg_filter.reset()
+        detector.reset()
+        hrv.reset()
+        live.reset()
+        convergence.reset()
+        plot.reset()
+        PPI.clear()
+        if RECORD:
+            recorder.start(RECORD_FILE)
+        pipeline.start()
+        while measuring.is_set():
+            pipeline.poll() #Filter And Detector Run Here Only Without MULTICORE
+            if recorder.pending():
+                save_event.set() #The Storage Task Writes The Full Block
+            count = pipeline.samples.get_into(block) #Filtered Samples For The Graph
+            plot.add_many(block, count) #Whole Block In One Call, Viper Compiled When Possible
+            found = pipeline.beats.get_into(intervals) #Peak-to-Peak Intervals In ms Of The Peaks Found
+            for i in range(found):
+                PPI.append(intervals[i])
+                hrv.add(intervals[i]) #HRV Sums Are Updated As Each Interval Arrives
+                live.add(intervals[i])
+                convergence.add(intervals[i])
+            if found and EARLY_STOP and convergence.done():
+                encoder.put(CONVERGED) #Ends The Measurement Like A Press
+            if count == len(block) or found == len(intervals):
+                continue #More Waiting
+            if plot.new_columns >= 8: #Refresh About 4 Times A Second
+                display_bpm_ppg(live.mean_hr() if live.n else detector.bpm())
+            await asyncio.sleep_ms(20)
+        pipeline.stop()
+        recorder.stop()
+        measured.set()
+
+
+#Network Is Brought Up Only When It Is First Needed
+def Start_Network():
+    global network_started
+    if not network_started:
+        network_started = True
+        asyncio.create_task(network_task())
+
+
+#Keeps The Connection Alive And Sends What Is In The Queue
+async def network_task():
+    while True:
+        if PROFILE: profiler.start(P_MQTT)
+        connections.service()
+        if PROFILE: profiler.stop(P_MQTT)
+        if connections.pending():
+            await asyncio.sleep_ms(200)
+        else:
+            await asyncio.sleep(1)
+
+
+#Writes The History Records And The Recorded Blocks
+async def storage_task():
+    while True:
+        await save_event.wait()
+        save_event.clear()
+        while save_queue:
+            New_History(*save_queue.pop(0))
+        recorder.write()
+
+
+#Waits Until The Queued Messages Are Sent Or The Time Is Up
+async def wait_sent(timeout):
+    start = time.ticks_ms()
+    while connections.pending():
+        if time.ticks_diff(time.ticks_ms(), start) >= timeout:
+            return False
+        await asyncio.sleep_ms(100)
+    return True
+
+
+############################
+# Do You Want To Save Text #
+############################
+
+async def ask_save(*record):
+    menu_display.Save_Info_Text()
+    # Yes, Save
+    if await encoder.wait_for(SW_2, SW_0) == SW_2:
+        save_queue.append(record)
+        save_event.set()
+        oled.fill(0)
+        oled.text("History Has Been",0,25,1)
+        oled.text("Updated!!!",24,35,1)
+        oled.show()
+        await asyncio.sleep(1)
+
+
+########################
+# Normal HRV With MQTT #
+########################
+
+async def hrv_results():
+    if PROFILE: profiler.start(P_HRV)
+    mean_PPI, mean_HR, SDNN, RMSSD, SDSD, SD1, SD2 = hrv.results()
+    if PROFILE: profiler.stop(P_HRV)
+    Result = HRV_Result(mean_PPI, mean_HR, SDNN, RMSSD, SDSD, SD1, SD2) #Before PPI Is Cleared
+
+    #Converting Them To String To Display It
+    mean_PPI = str(mean_PPI)
+    mean_HR = str(mean_HR)
+    SDNN = str(SDNN)
+    RMSSD = str(RMSSD)
+    SD1 = str(SD1)
+    SD2 = str(SD2)
+
+    #Calls Function To Display The Info
+    await menu_display.Show_Info("HRV",mean_PPI,mean_HR,SDNN,RMSSD,SD1,SD2)
+    PPI.clear() #Clears Peak-to-Peak Intervals
+
+    # Press To Continue
+    await encoder.wait_for(PRESS)
+    await ask_save(HistoryLog.HRV, mean_PPI, mean_HR, SDNN, RMSSD, SD1, SD2)
+
+    oled.fill(0)
+    oled.text("Sending Info to ",0,28,1)
+    oled.text("The Server... ",10,38,1)
+    oled.show()
+
+    # Sending Info Of Analysis by MQTT, The Network Task Sends The Queue
+    if MQTT_JSON:
+        connections.publish_json(RESULT_TOPIC, Result) #One Message Per Measurement
+    else:
+        topic = "HRV"
+        Info = ['MeanPPI:'+ mean_PPI +'ms','MeanHR:'+ mean_HR +'bpm',
+                'SDNN:'+ SDNN +'ms','RMSSD:'+ RMSSD +'ms',
+                'SD1:'+ SD1 +' SD2:'+ SD2]
+        for i in Info:
+            connections.publish(topic, i)
+        Space = "---------------"
+        connections.publish(topic, Space)
+    if PROFILE:
+        connections.publish_json(STATS_TOPIC, Profile_Stats())
+
+    if await wait_sent(5000):
+        oled.fill(0)
+        oled.text("The Infomation",0,28,1)
+        oled.text("Has Been Sent!!!",0,38,1)
+        oled.show()
+    else:
+        #Unable To Connect, The Info Is Sent When The Connection Is Back
+        oled.fill(0)
+        oled.text("Connection Could",0,17,1)
+        oled.text("Not be Made Now,",0,27,1)
+        oled.text("Will Retry Later",0,37,1)
+        oled.show()
+    await asyncio.sleep(2)
+
+
+##########################
+# HRV Using Kubios Cloud #
+##########################
+
+async def kubios_results():
+    oled.text("Analyzing PPI",0,12,1)
+    oled.text("Using The Kubios",0,22,1)
+    oled.text("Cloud Server",0,32,1)
+    oled.text("Please Wait...",0,52,1)
+    oled.show()
+    await asyncio.sleep(1.25)
+
+    try:
+        # Make the readiness analysis, the token is reused until it expires
+        import kubios
+        response = kubios.analyze(Kubios_Tokens(), APIKEY, PPI)
+
+        # Done To Make It Easier To Display And Save
+        mean_PPI = str(int(response["analysis"]["mean_rr_ms"]))
+        mean_HR =  str(int(response["analysis"]["mean_hr_bpm"]))
+        SDNN = str(int(response["analysis"]["sdnn_ms"]))
+        RMSSD =str(int(response["analysis"]["rmssd_ms"]))
+        SNS =str(int(response["analysis"]["sns_index"]))
+        PNS =str(int(response["analysis"]["pns_index"]))
+
+    # Incase Connection Could Not Be Made
+    except:
+        oled.fill(0)
+        oled.text("Connection Could",0,17,1)
+        oled.text("Not be Made, Try",0,27,1)
+        oled.text("Again Later..",0,37,1)
+        oled.show()
+        await asyncio.sleep(2)
+        return
+
+    #Display The Data On The OLED
+    await menu_display.Show_Info("Kubios HRV",mean_PPI,mean_HR,SDNN,RMSSD,SNS,PNS)
+    PPI.clear() #Clear The PPI Valuse
+
+    # Press To Continue
+    await encoder.wait_for(PRESS)
+    await ask_save(HistoryLog.KUBIOS, mean_PPI, mean_HR, SDNN, RMSSD, SNS, PNS)
+
+
+###############
+# HRV Options #
+###############
+
+#Called From The Timer Interrupt When The Measurement Has Run Too Long
+def Measure_Deadline(slot):
+    encoder.put(TIMEOUT)
+
+
+async def measure(option):
+    Init_Measurement()
+    Start_Network() #WLAN Comes Up While Measuring
+    await menu_display.Press_Start()
+    await encoder.wait_for(PRESS)
+    oled.fill(0)
+    oled.text("Calculating ",20,26,1)
+    oled.text("BPM..",49,36,1)
+    oled.show()
+    await asyncio.sleep(0.5)
+
+    # Collecting ADC And Finding BPM Keeps Going Till Button Is Pressed Or Time Is Up
+    measured.clear()
+    scheduler.start()
+    measuring.set()
+    deadline = scheduler.add(Measure_Deadline, scheduler.ONE_SHOT, period=MAX_MEASURE_MS)
+    await encoder.wait_for(PRESS, TIMEOUT, CONVERGED)
+    scheduler.cancel(deadline)
+    measuring.clear()
+    await measured.wait()
+    scheduler.stop() #Sampler Slot Is Cancelled, No Idle Interrupts Between Measurements
+    oled.fill(0)
+
+    if PPI and option == "HRV":
+        await hrv_results()
+    elif len(PPI) >= 10 and option == "Kubios HRV":
+        await kubios_results()
+
+    # Interupting before A Single PPI Could Be Found
+    elif not PPI:
+        oled.text("The Process Was",0,17,1)
+        oled.text("Stopped, Going ",0,27,1)
+        oled.text("Back To The Menu",0,37,1)
+        oled.show()
+        await asyncio.sleep(2)
+    await asyncio.sleep(0.5)
+
+
+#################################
+# Want To View Previous History #
+#################################
+
+async def show_history():
+    oled.fill(0)
+    oled.text("Retrieving The",0,25,1)
+    oled.text("Previous Info...",0,35,1)
+    oled.show()
+    Init_History()
+    await asyncio.sleep(1.7)
+    History_Index = 0
+    Previous_History(History_Index)
+
+    # Turn To Page, Press To Continue
+    while True:
+        rotation_action = await encoder.wait_for(NEXT, PREV, PRESS)
+        if rotation_action == PRESS:
+            break
+        if rotation_action == NEXT and History_Index < len(history) - 1:
+            History_Index += 1 #Older
+        elif rotation_action == PREV and History_Index > 0:
+            History_Index -= 1 #Newer
+        else:
+            continue
+        Previous_History(History_Index)
+    await asyncio.sleep(0.7)
+
+
+##########################
+# Turning Off The Device #
+##########################
+
+async def turn_off():
+    oled.fill(0)
+    oled.text("Do You Want To",0,0,1)
+    oled.text("Turn Off Device?",0,9,1)
+    oled.text("SW_2 = Yes",0,28,1)
+    oled.text("SW_0 = No",0,38,1)
+    oled.show()
+
+    # Yes, Turn Off
+    if await encoder.wait_for(SW_2, SW_0) == SW_2:
+        menu_display.current_row = 0
+        await menu_display.GoodBye()
+        return True
+    return False
+
+
+#Menu And Everything The User Sees
+async def ui_task():
+    global BOOT_MS, BOOT_MEM
+    BOOT_MS = time.ticks_diff(time.ticks_ms(), BOOT_START)
+    gc.collect()
+    BOOT_MEM = gc.mem_alloc()
+    while True:
+        await encoder.wait_for(SW_2, SW_0) #Turn On Machine
+        await menu_display.Welcome_Text()
+        while True:
+
             ###################
             # Choosing Option #
             ###################
-            
-            while encoder.Rotation.has_data():
-                rotation_action = encoder.Rotation.get()
-                if rotation_action == 1: 
-                    menu_display.next_opt()
-                elif rotation_action == 0:  
-                    menu_display.prev_opt()
-                elif encoder.pin_sw.value() == 0:  
-                    menu_display.toggle_opt()
-                    
-                            ###############
-                            # HRV Options #
-                            ###############
-                    
-                    if menu_display.options_state == "HRV" or menu_display.options_state == "Kubios HRV":
-                        encoder.Menu_state = False
-                        menu_display.Press_Start()
-                        time.sleep(0.5)
-                        while work_state:
-                            if encoder.pin_sw.value() == 0:
-                                time.sleep(0.5)
-                                oled.fill(0)
-                                oled.text("Calculating ",20,26,1)
-                                oled.text("BPM..",49,36,1)
-                                oled.show()
-                                
-                                
-                                ##################################
-                                # Collecting ADC And Finding BPM #
-                                ##################################
-                                
-                                while collect_state:
-                                        collect_state = collect_values() #Keeps Going Till Button Is Pressed
-                                        
-                                work_state = False
-                        
-                        Timer.deinit()
-                        oled.fill(0)
-                        
-                        
-                                ########################
-                                # Normal HRV With MQTT #
-                                ########################
-                        
-                        if PPI and menu_display.options_state == "HRV":
-                            
-                            
-                            ###################################
-                            # Calculating The Analysis Values #
-                            ###################################
-                            
-                            mean_PPI = meanPPI_calculator(PPI)                            
-                            mean_HR = str(int(meanHR_calculator(mean_PPI)))                            
-                            SDNN = SDNN_calculator(PPI, mean_PPI)
-                            RMSSD = str(int(RMSSD_calculator(PPI)))        
-                            SDSD = SDSD_calculator(PPI)
-                            SD1 = str(int(SD1_calculator(SDSD)))
-                            SD2 = str(int(SD2_calculator(SDNN, SDSD)))
-                            
-                            #Converting Them To String To Display It
-                            mean_PPI = str(int(mean_PPI))
-                            SDNN = str(int(SDNN))
-                            SDSD = str(int(SDSD))
-                            
-                            
-                            #Calls Function To Display The Info
-                            menu_display.Show_Info(menu_display.options_state,mean_PPI,mean_HR,SDNN,RMSSD,SD1,SD2)                    
-                           
-                            PPI.clear() #Clears Peak-to-Peak Intervals
-                            
-                            time.sleep(0.5)
-                            
-                            #####################
-                            # Press To Continue #
-                            #####################
-                            
-                            while True:
-                                if encoder.pin_sw.value() == 0:
-                                    break
-                            
-                            ############################
-                            # Do You Want To Save Text #
-                            ############################
-                                                        
-                            menu_display.Save_Info_Text()
-                            
-                            #####################
-                            # Save The HRV Info #
-                            #####################
-    
-                            while True:
-                                # Yes, Save
-                                if On_btn.value() == 0:
-                                    Data_Saved = f"\nMeanPPI:{mean_PPI}ms\nMeanHR:{mean_HR}bpm\nSDNN:{SDNN}ms\nRMSSD:{RMSSD}ms\nSD1:{SD1} SD2:{SD2}"    
-                                    New_History(Data_Saved)
-                                    oled.fill(0)
-                                    oled.text("History Has Been",0,25,1)
-                                    oled.text("Updated!!!",24,35,1)
-                                    oled.show()
-                                    time.sleep(1)
-                                    break
-                                
-                                #No, Donot Save
-                                if KG_btn.value() == 0:
-                                    break
-                            
-                                ####################
-                                # MQTT Server Part #
-                                ####################
-                            
-                            oled.fill(0)
-                            oled.text("Sending Info to ",0,28,1)
-                            oled.text("The Server... ",10,38,1)
-                            oled.show()
-                            
-                            time.sleep(1.25)
-                            
-                            connect_wlan()
-
-                            try:
-                                #Try To Connect
-                                mqtt_client=connect_mqtt()
-                                try:
-                                
-                                    # Sending Info Of Analysis by MQTT.
-                                    topic = "HRV"
-                                    Info = ['MeanPPI:'+ mean_PPI +'ms','MeanHR:'+ mean_HR +'bpm',
-                                            'SDNN:'+ SDNN +'ms','RMSSD:'+ RMSSD +'ms',
-                                            'SD1:'+ SD1 +' SD2:'+ SD2]
-                                    for i in Info:
-                                        mqtt_client.publish(topic, i)
-                                    Space = "---------------"
-                                    mqtt_client.publish(topic, Space)
-                                    oled.fill(0)
-                                    oled.text("The Infomation",0,28,1)
-                                    oled.text("Has Been Sent!!!",0,38,1)
-                                    oled.show()
-                                    time.sleep(2)
-                                                                   
-                                        
-                                except Exception as e:
-                                    #Unable To Send Info
-                                    oled.fill(0)
-                                    oled.text("Unable to Send",0,17,1)
-                                    oled.text("Info,Try Again ",0,27,1)
-                                    oled.text("Later Please...",0,37,1)
-                                    oled.show()
-                            
-                                
-                            except Exception as e:
-                                #Unable To Connect
-                                oled.fill(0)
-                                oled.text("Connection Could",0,17,1)
-                                oled.text("Not be Made, Try",0,27,1)
-                                oled.text("Again Later..",0,37,1)
-                                oled.show()
-                                time.sleep(2)
-                          
-                            
-                            ##########################
-                            # HRV Using Kubios Cloud #
-                            ##########################
-                            
-                        elif len(PPI) >= 10 and menu_display.options_state == "Kubios HRV":
-                            oled.text("Analyzing PPI",0,12,1)
-                            oled.text("Using The Kubios",0,22,1)
-                            oled.text("Cloud Server",0,32,1)
-                            oled.text("Please Wait...",0,52,1)
-                            oled.show()
-                            time.sleep(1.25)
-                            
-                                    
-                                #############################
-                                # Using Response For Kubios #
-                                #############################
-                            
-                            
-                            try:
-                                response = requests.post(
-                                    url = TOKEN_URL, 
-                                    data = 'grant_type=client_credentials&client_id={}'.format(CLIENT_ID), 
-                                    headers = {'Content-Type':'application/x-www-form-urlencoded'}, 
-                                    auth = (CLIENT_ID, CLIENT_SECRET)
-                                )
-                                
-                                response_json = response.json()  # Parse JSON response into a python dictionary 
-                                access_token = response_json["access_token"]  # Parse access token
-                                HRV_Info= {
-                                    "type": "RRI",
-                                    "data": PPI,
-                                    "analysis": {"type": "readiness"}
-                                }
-                                
-                                # Make the readiness analysis with the given data
-                                response = requests.post(
-                                    url = "https://analysis.kubioscloud.com/v2/analytics/analyze",
-                                    headers = {"Authorization": "Bearer {}".format(access_token), "X-Api-Key": APIKEY},
-                                    json = HRV_Info
-                                )
-                                
-                                #Get The Response and Make It A Nested Dictonary
-                                response = response.json()
-                                
-                                
-                                # Done To Make It Easier To Display And Save
-                                mean_PPI = str(int(response["analysis"]["mean_rr_ms"]))
-                                mean_HR =  str(int(response["analysis"]["mean_hr_bpm"]))
-                                SDNN = str(int(response["analysis"]["sdnn_ms"]))
-                                RMSSD =str(int(response["analysis"]["rmssd_ms"]))
-                                SNS =str(int(response["analysis"]["sns_index"]))
-                                PNS =str(int(response["analysis"]["pns_index"]))
-                                
-                                #Display The Data On The OLED
-                                menu_display.Show_Info(menu_display.options_state,mean_PPI,mean_HR,SDNN,RMSSD,SNS,PNS)                              
-                                
-                                #Clear The PPI Valuse
-                                PPI.clear()
-                                
-                                time.sleep(0.5)
-                                
-                                #####################
-                                # Press To Continue #
-                                #####################
-                                
-                                while True:
-                                    if encoder.pin_sw.value() == 0:
-                                        break
-                                
-                                ############################
-                                # Do You Want To Save Text #
-                                ############################
-                                
-                                menu_display.Save_Info_Text()
-                                
-                                #####################
-                                # Save The HRV Info #
-                                #####################
-                                
-                                while True:
-                                    # Yes, Save
-                                    if On_btn.value() == 0:
-                                        Data_Saved = f"\nMeanPPI:{mean_PPI}ms\nMeanHR:{mean_HR}bpm\nSDNN:{SDNN}ms\nRMSSD:{RMSSD}ms\nSNS:{SNS} PNS:{PNS}"    
-                                        New_History(Data_Saved)
-                                        oled.fill(0)
-                                        oled.text("History Has Been",0,25,1)
-                                        oled.text("Updated!!!",24,35,1)
-                                        oled.show()
-                                        time.sleep(1)
-                                        break
-                                    
-                                    #No, Donot Save
-                                    if KG_btn.value() == 0:
-                                        break
-                                    
-                                    
-                    #######################################
-                    # Incase Connection Could Not Be Made #
-                    #######################################
-                                
-                            except:
-                                oled.fill(0)
-                                oled.text("Connection Could",0,17,1)
-                                oled.text("Not be Made, Try",0,27,1)
-                                oled.text("Again Later..",0,37,1)
-                                oled.show()
-                                time.sleep(2)
-                                                  
-                           
-                    ##################################################
-                    # Interupting before A Single PPI Could Be Found #
-                    ##################################################
-                        
-                        elif not PPI:
-                            oled.text("The Process Was",0,17,1)
-                            oled.text("Stopped, Going ",0,27,1)
-                            oled.text("Back To The Menu",0,37,1)
-                            oled.show()
-                            time.sleep(2)
-                                
-                    #####################################################
-                    # Reseting States For Menu, Working, and ADC Values #
-                    #####################################################
-                        
-                        menu_display.options_state = ""
-                        time.sleep(0.5)
-                        encoder.Menu_state = True
-                        work_state = True
-                        collect_state=True
-                        menu_display.update()
-                        
-                        
-                        
-                        #################################
-                        # Want To View Previous History #
-                        #################################
-                        
-                    
-                    elif menu_display.options_state == "History":
-                        oled.fill(0)
-                        oled.text("Retrieving The",0,25,1)
-                        oled.text("Previous Info...",0,35,1)
-                        oled.show()
-                        time.sleep(1.7)                       
-                        Previous_History()
-                        
-                         #####################
-                        # Press To Continue #
-                        #####################
-                        
-                        while True:
-                            if encoder.pin_sw.value() == 0:
-                                break
-                        
-                        time.sleep(0.7)
-                   
-                            ##########################
-                            # Turning Off The Device # 
-                            ##########################
-                    
-                    elif menu_display.options_state == "Exit":
-                        encoder.Menu_state = False
-                        oled.fill(0)
-                        oled.show()
-                        oled.text("Do You Want To",0,0,1)
-                        oled.text("Turn Off Device?",0,9,1)
-                        
-                        # Turns Off The Device
-                        oled.text("SW_2 = Yes",0,28,1)
-                        oled.text("SW_0 = No",0,38,1)
-                        menu_display.options_state = ""
-                        oled.show()
-                        
-                        
-                        #####################################
-                        # Conformation Of Turning Of Device #
-                        #####################################
-                        
-                        while True:
-                            # Yes, Turn Off
-                            if On_btn.value() == 0:
-                                begining=True
-                                menu_display.current_row = 0
-                                menu_display.GoodBye()
-                                break
-                            
-                            #No, Got Back To Menu
-                            if KG_btn.value() == 0:
-                                work_state = True
-                                menu_display.update()
-                                break
-                        start_state = True
-                        
-                    
-    ############################################################
-    # Checking States and Making sure to go to the right place #
-    ############################################################
-                    if not encoder.Menu_state:
-                        break
-                menu_display.update()
-                if begining:
-                    break
-            if begining:
-                break         
 
+            menu_display.update()
+            rotation_action = await encoder.wait_for(NEXT, PREV, PRESS, SW_0)
+            if rotation_action == SW_0: #Hidden, Shows The Profiler Stats
+                if PROFILE:
+                    Show_Stats()
+                    await encoder.wait_for(PRESS, SW_0, SW_2)
+                continue
+            elif rotation_action == NEXT:
+                menu_display.next_opt()
+                continue
+            elif rotation_action == PREV:
+                menu_display.prev_opt()
+                continue
+            menu_display.toggle_opt()
+            option = menu_display.options_state
+            menu_display.options_state = ""
+
+            if option == "HRV" or option == "Kubios HRV":
+                await measure(option)
+            elif option == "History":
+                await show_history()
+            elif option == "Exit" and await turn_off():
+                break
+
+
+async def main():
+    asyncio.create_task(detector_task())
+    asyncio.create_task(storage_task())
+    await ui_task()
+
+
+    ###############
+    #  Main Loop  #   
+    ###############
+
+
+asyncio.run(main())
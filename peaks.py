@@ -0,0 +1,124 @@
+import array
+import kernels
+
+
+class PeakDetector:
+    """Streaming peak detector for PPG samples.
+    Samples are fed one at a time with add(). The last window samples are
+    kept in a ring buffer together with their running sum and sum of squares,
+    so the threshold (mean + one standard deviation) is kept up to date in
+    constant time and memory however long the session runs.
+    A peak is a local maximum above the threshold. After a peak the detector
+    is rearmed when the signal falls below the mean again, and peaks closer
+    than the refractory period to the previous one are ignored.
+    add_many() runs the per-sample loop in kernels.scan over a whole block,
+    only the threshold test of peak candidates is done here.
+    The time of a peak is refined between samples by fitting a parabola
+    through the peak sample and its neighbours, so the intervals are
+    accurate to well under the sample period also at low sampling rates.
+    """
+    def __init__(self, rate = 250, window = 750, refractory = 300, interpolate = True):
+        """Parameters
+
+        rate (int): Sampling rate in Hz. Used to convert sample counts to milliseconds.
+        window (int): Number of samples the threshold is calculated from (Default is 3 s at 250 Hz)
+        refractory (int): Shortest accepted interval in ms (Default is 300 ms - 200 bpm)
+        interpolate (bool): Refine the peak times between samples
+        """
+        self.rate = rate
+        self.size = window
+        self.refractory = refractory * rate // 1000
+        self.interpolate = interpolate
+        self.period_us = 1000000 // rate
+        self.buf = array.array('H', bytearray(2 * window))
+        self.st = kernels.state(kernels.PEAK_SLOTS)
+        self._one = array.array('H', bytearray(2))
+        self._out = array.array('H', bytearray(2))
+        self.reset()
+
+    def reset(self):
+        """Forget all samples and peaks. Call before starting a new measurement."""
+        for i in range(self.size):
+            self.buf[i] = 0
+        for i in range(kernels.PEAK_SLOTS):
+            self.st[i] = 0
+        self.st[kernels.PEAK_SIZE] = self.size
+        self.st[kernels.PEAK_ARMED] = 1
+        self.last_peak = -1
+        self.last_offset = 0 # Time of the peak from its sample in us
+        self.ppi = 0
+        self.ppi_us = 0
+
+    def add(self, value):
+        """Add one sample. Returns the peak-to-peak interval in ms when a new
+        peak completes an interval, otherwise returns 0."""
+        self._one[0] = value
+        if self.add_many(self._one, 1, self._out):
+            return self._out[0]
+        return 0
+
+    def add_many(self, data, n, out):
+        """Add samples data[:n]. The intervals completed by them are written
+        to out (e.g. array('H')), returns how many there are. Intervals that
+        do not fit in out are dropped."""
+        st = self.st
+        st[kernels.PEAK_INDEX] = 0
+        found = 0
+        while kernels.scan(self.buf, st, data, n):
+            ppi = self._peak()
+            if ppi and found < len(out):
+                out[found] = ppi
+                found += 1
+        return found
+
+    def _peak(self):
+        # The kernel stopped at a candidate, the sample before the last one
+        st = self.st
+        count = st[kernels.PEAK_COUNT]
+        n = min(count, self.size)
+        total = st[kernels.PEAK_SUM]
+        sq_sum = st[kernels.PEAK_SQ_LO] | st[kernels.PEAK_SQ_HI] << 32
+        # p > mean + std  <=>  n*p - sum > 0 and (n*p - sum)^2 > n*sq_sum - sum^2
+        d = n * st[kernels.PEAK_PREV2] - total
+        if d * d <= n * sq_sum - total * total:
+            return 0
+        peak = count - 2
+        if self.last_peak >= 0 and peak - self.last_peak < self.refractory:
+            return 0 # Too soon, a notch or motion. Stays armed for the real peak.
+        st[kernels.PEAK_ARMED] = 0
+        offset = self._offset() if self.interpolate else 0
+        ppi = 0
+        if self.last_peak >= 0:
+            self.ppi_us = (peak - self.last_peak) * 1000000 // self.rate + offset - self.last_offset
+            if self.interpolate:
+                ppi = (self.ppi_us + 500) // 1000
+            else:
+                ppi = (peak - self.last_peak) * 1000 // self.rate
+            self.ppi = ppi
+        self.last_peak = peak
+        self.last_offset = offset
+        return ppi
+
+    def _offset(self):
+        # Vertex of the parabola through the peak and its neighbours, in us from the peak sample
+        # Negative indexes wrap around the end of the ring like they should
+        pos = self.st[kernels.PEAK_POS]
+        after = self.buf[pos - 1]
+        p = self.buf[pos - 2]
+        before = self.buf[pos - 3]
+        den = 2 * (before - 2 * p + after)
+        if den >= 0:
+            return 0
+        return (before - after) * self.period_us // den
+
+    def peak_ms(self):
+        """Returns the time of the latest peak in ms from the start or -1 if no peak is found yet"""
+        if self.last_peak < 0:
+            return -1
+        return self.last_peak * 1000 // self.rate + self.last_offset // 1000
+
+    def bpm(self):
+        """Returns the heart rate of the latest interval or None if there is none yet"""
+        if self.ppi == 0:
+            return None
+        return 60000 / self.ppi
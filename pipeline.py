@@ -0,0 +1,130 @@
+import array
+import time
+from fifo import Fifo
+
+try:
+    import threading
+except ImportError:
+    threading = None
+    import _thread
+
+
+def _sleep_ms(ms):
+    if hasattr(time, 'sleep_ms'):
+        time.sleep_ms(ms)
+    else:
+        time.sleep(ms / 1000)
+
+
+class Pipeline:
+    """Acquisition and detection stage that can run on the second core.
+    Blocks of samples are drained from the sampler, recorded raw, filtered
+    and fed to the peak detector. The filtered samples and the intervals of
+    the detected beats are handed over in two Fifos. Each Fifo has a single
+    producer and a single consumer, the producer only moves head and the
+    consumer only moves tail, so they need no lock between the cores.
+    With threaded=True start() runs the stage in a thread: _thread on
+    MicroPython, where it is the second core, and threading on CPython.
+    Otherwise poll() runs it on the caller until the sampler is empty.
+    With a profiler the stages are timed where they run, on whichever core
+    that is.
+    """
+    def __init__(self, sampler, ppg_filter, detector, recorder = None, threaded = True,
+                 block = 32, samples = 512, beats = 32, profiler = None):
+        """Parameters
+
+        sampler (Sampler): Sample source
+        ppg_filter (PPGFilter): Filter applied before the detector, None for raw samples
+        detector (PeakDetector): Peak detector
+        recorder (Recorder): Records the raw samples when it is started, None for no recording
+        threaded (bool): Run the stage in its own thread
+        block (int): Number of samples handled at once
+        samples (int): Size of the fifo of filtered samples for the plot
+        beats (int): Size of the fifo of intervals
+        profiler (Profiler): Times draining the sampler in its stage "sampler" and recording,
+            filtering and detecting in its stage "detector". None for no profiling.
+        """
+        self.sampler = sampler
+        self.ppg_filter = ppg_filter
+        self.detector = detector
+        self.recorder = recorder
+        self.threaded = threaded
+        self.samples = Fifo(samples)
+        self.beats = Fifo(beats)
+        self._block = array.array('H', bytearray(2 * block))
+        self._out = array.array('H', bytearray(2 * (block // 2 + 1)))
+        self.profiler = profiler
+        if profiler is not None:
+            self._p_sampler = profiler.names.index("sampler")
+            self._p_detector = profiler.names.index("detector")
+        self.processed = 0
+        self._active = False
+        self._running = False
+
+    def step(self):
+        """Handle one block of samples. Returns the number of samples handled."""
+        buf = self._block
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start(self._p_sampler)
+        n = self.sampler.get_into(buf)
+        if n == 0:
+            return 0 # Not counted, the next start() starts over
+        if profiler is not None:
+            profiler.stop(self._p_sampler)
+            profiler.start(self._p_detector)
+        if self.recorder is not None:
+            self.recorder.add_many(buf, n)
+        if self.ppg_filter is not None:
+            self.ppg_filter.process(buf, n)
+        self.samples.put_many(buf, n)
+        found = self.detector.add_many(buf, n, self._out)
+        if found:
+            self.beats.put_many(self._out, found)
+        if profiler is not None:
+            profiler.stop(self._p_detector)
+        self.processed += n
+        return n
+
+    def poll(self):
+        """Run the stage until the sampler is empty, when not threaded.
+        Stops earlier when the fifo of samples could not take another block."""
+        if not self.threaded:
+            blocks = (self.samples.size - 1) // len(self._block)
+            while blocks and self.step() == len(self._block):
+                blocks -= 1
+
+    def _run(self):
+        try:
+            while self._active:
+                if self.step() < len(self._block):
+                    _sleep_ms(2)
+        finally:
+            self._running = False
+
+    def start(self):
+        """Clear the fifos and start the sampler and the stage"""
+        while self.samples.has_data():
+            self.samples.get()
+        while self.beats.has_data():
+            self.beats.get()
+        self.processed = 0
+        self.sampler.start()
+        if self.threaded and not self._running:
+            self._active = True
+            self._running = True
+            if threading is not None:
+                threading.Thread(target = self._run, daemon = True).start()
+            else:
+                _thread.start_new_thread(self._run, ())
+
+    def stop(self):
+        """Stop the stage and wait until the thread has finished, then stop the sampler"""
+        self._active = False
+        while self._running:
+            _sleep_ms(1)
+        self.sampler.stop()
+
+    def dropped(self):
+        """Returns the number of samples and intervals dropped because a fifo was full"""
+        return self.samples.dropped() + self.beats.dropped()
@@ -0,0 +1,137 @@
+import array
+import framebuf
+import kernels
+
+
+class ScrollingPlot:
+    """Scrolling PPG plot widget.
+    Samples are decimated to one min/max pair per pixel column and the pairs
+    are stored in fixed size arrays. The plot has its own framebuffer which is
+    scrolled one pixel to the left when a column is completed, so only the
+    new column is drawn. Scaling to pixels uses integer fixed point math.
+    The range is recalculated from the stored columns when a column does not
+    fit in it and once every full width, and only then is the plot redrawn.
+    add_many() finds the min/max of a block of samples with kernels.span.
+    """
+    def __init__(self, width = 128, height = 48, decimation = 7):
+        """Parameters
+
+        width (int): Plot width in pixels, one column per pixel
+        height (int): Plot height in pixels. Must be a multiple of 8.
+        decimation (int): Number of samples per column (Default is 7 - 3.6 s across 128 columns at 250 Hz)
+        """
+        self.width = width
+        self.height = height
+        self.decimation = decimation
+        self.buffer = bytearray(width * height // 8)
+        self.fb = framebuf.FrameBuffer(self.buffer, width, height, framebuf.MONO_VLSB)
+        self.col_min = array.array('H')
+        self.col_max = array.array('H')
+        for i in range(width):
+            self.col_min.append(0)
+            self.col_max.append(0)
+        self.st = kernels.state(kernels.SPAN_SLOTS)
+        self.st[kernels.SPAN_DECIMATION] = decimation
+        self._one = array.array('H', bytearray(2))
+        self.reset()
+
+    def reset(self):
+        """Clear the plot and all stored columns"""
+        self.fb.fill(0)
+        self.pos = 0
+        self.count = 0
+        self.age = 0
+        self.st[kernels.SPAN_K] = 0
+        self.st[kernels.SPAN_MIN] = 0xFFFF
+        self.st[kernels.SPAN_MAX] = 0
+        self.lo = 0
+        self.hi = 0
+        self.scale = 0
+        self.new_columns = 0
+
+    def add(self, value):
+        """Add one sample. Returns True when it completed a new column."""
+        self._one[0] = value
+        return self.add_many(self._one, 1) > 0
+
+    def add_many(self, data, n):
+        """Add samples data[:n]. Returns the number of columns they completed."""
+        st = self.st
+        st[kernels.SPAN_INDEX] = 0
+        columns = 0
+        while st[kernels.SPAN_INDEX] < n:
+            kernels.span(data, st, n)
+            if st[kernels.SPAN_K] >= self.decimation:
+                self._complete(st[kernels.SPAN_MIN], st[kernels.SPAN_MAX])
+                st[kernels.SPAN_K] = 0
+                st[kernels.SPAN_MIN] = 0xFFFF
+                st[kernels.SPAN_MAX] = 0
+                columns += 1
+        return columns
+
+    def _complete(self, cur_min, cur_max):
+        prev = self.pos - 1 if self.pos else self.width - 1
+        self.col_min[self.pos] = cur_min
+        self.col_max[self.pos] = cur_max
+        self.pos += 1
+        if self.pos == self.width:
+            self.pos = 0
+        if self.count < self.width:
+            self.count += 1
+        self.age += 1
+
+        if cur_min < self.lo or cur_max > self.hi or self.age >= self.width:
+            self._rescale()
+        else:
+            self.fb.scroll(-1, 0)
+            self._column(self.width - 1, prev)
+        self.new_columns += 1
+
+    def _y(self, value):
+        return self.height - 1 - (((value - self.lo) * self.scale) >> 16)
+
+    def _column(self, x, prev):
+        # Column spans its own min/max and reaches the previous column so the trace is continuous
+        i = x - self.width + self.pos
+        if i < 0:
+            i += self.width
+        lo = self.col_min[i]
+        hi = self.col_max[i]
+        if self.count > 1 and x > self.width - self.count:
+            if self.col_max[prev] < lo:
+                lo = self.col_max[prev]
+            if self.col_min[prev] > hi:
+                hi = self.col_min[prev]
+        top = self._y(hi)
+        self.fb.vline(x, 0, self.height, 0)
+        self.fb.vline(x, top, self._y(lo) - top + 1, 1)
+
+    def _rescale(self):
+        self.age = 0
+        lo = 0xFFFF
+        hi = 0
+        i = self.pos
+        for n in range(self.count):
+            i -= 1
+            if i < 0:
+                i = self.width - 1
+            if self.col_min[i] < lo:
+                lo = self.col_min[i]
+            if self.col_max[i] > hi:
+                hi = self.col_max[i]
+        # Leave some headroom so that small changes do not cause a redraw
+        margin = (hi - lo) >> 3
+        self.lo = max(0, lo - margin)
+        self.hi = min(0xFFFF, hi + margin)
+        if self.hi > self.lo:
+            self.scale = ((self.height - 1) << 16) // (self.hi - self.lo)
+        else:
+            self.scale = 0
+        self.fb.fill(0)
+        for x in range(self.width - self.count, self.width):
+            self._column(x, (x - self.width + self.pos - 1) % self.width)
+
+    def draw(self, oled, y):
+        """Copy the plot to the display framebuffer at row y"""
+        oled.blit(self.fb, 0, y)
+        self.new_columns = 0
@@ -0,0 +1,69 @@
+import array
+import math
+import kernels
+
+
+def _biquad(kind, f, rate):
+    # Butterworth low-pass or high-pass biquad (RBJ cookbook). b0 - b2 are Q14, a1 and a2
+    # Q28 split in the Q14 part and 14 fraction bits as kernels.bandpass expects.
+    w = 2 * math.pi * f / rate
+    s = math.sin(w / 2)
+    one_minus_cos = 2 * s * s # Accurate for small w also in single precision
+    alpha = math.sin(w) / (2 * math.sqrt(0.5))
+    a0 = 1 + alpha
+    if kind == 'low':
+        b0 = round(one_minus_cos / 2 * 16384 / a0)
+        b1 = 2 * b0
+    else:
+        b0 = round((2 - one_minus_cos) / 2 * 16384 / a0)
+        b1 = -2 * b0 # b0 + b1 + b2 is exactly 0, the high-pass rejects DC
+    a2 = round((1 - alpha) / a0 * (1 << 28))
+    # 1 + a1 + a2 = 2 (1 - cos w) / a0 sets the gain at DC, it is tiny at high rates
+    a1 = round(2 * one_minus_cos / a0 * (1 << 28)) - (1 << 28) - a2
+    return [b0, b1, b0, a1 >> 14, a2 >> 14, a1 & 0x3FFF, a2 & 0x3FFF]
+
+
+class PPGFilter:
+    """Streaming band-pass filter for PPG samples.
+    Blocks of samples are filtered in place between the sampler and the peak
+    detector. A high-pass biquad removes the baseline wander and a low-pass
+    biquad the noise above the heart rate band. Optionally the output is the
+    moving average derivative over k samples, which has sharper peaks on the
+    upstroke of every pulse. The filter uses integer math only and its state
+    is a fixed size array, the per-sample loop is kernels.bandpass.
+    The output is centred on 32768 so it can be fed to PeakDetector as is.
+    """
+    def __init__(self, rate = 250, low = 0.5, high = 5, derivative = 0):
+        """Parameters
+
+        rate (int): Sampling rate in Hz
+        low (float): High-pass corner frequency in Hz (Default is 0.5 Hz - 30 bpm)
+        high (float): Low-pass corner frequency in Hz (Default is 5 Hz)
+        derivative (int): Derivative distance in samples, up to 8. 0 means no derivative.
+        """
+        if not 0 <= derivative <= kernels.FILTER_MAX_K:
+            raise ValueError('derivative must be 0 - {}'.format(kernels.FILTER_MAX_K))
+        self.rate = rate
+        self.coef = array.array('i', _biquad('high', low, rate) + _biquad('low', high, rate))
+        self.st = kernels.state(kernels.FILTER_SLOTS, 'i')
+        self.derivative = derivative
+        self.reset()
+
+    def reset(self):
+        """Clear the filter state. The next sample starts the filter without a step."""
+        for i in range(kernels.FILTER_SLOTS):
+            self.st[i] = 0
+        self.st[kernels.FILTER_K] = self.derivative
+        self.primed = False
+
+    def process(self, data, n):
+        """Filter data[:n] (e.g. array('H')) in place"""
+        if n <= 0:
+            return
+        if not self.primed:
+            # Start from the level of the first sample so that the high-pass does not ring
+            x = data[0] >> 4
+            self.st[kernels.FILTER_X1] = x
+            self.st[kernels.FILTER_X2] = x
+            self.primed = True
+        kernels.bandpass(data, self.st, self.coef, n)
@@ -0,0 +1,68 @@
+import array
+import gc
+import time
+
+
+class Profiler:
+    """Lightweight per-stage profiler.
+    Each stage has a slot number. start() and stop() around the stage measure
+    the time with time.ticks_us() and the heap growth with gc.mem_alloc().
+    Min, average and max time and the max allocation are kept in arrays that
+    are allocated when the object is created, so profiling does not allocate.
+    The average is a rolling exponential average over about 8 runs.
+    Write the calls as "if PROFILE: profiler.start(slot)" with PROFILE defined
+    by micropython.const() so that they compile away when PROFILE is 0.
+    """
+    def __init__(self, names):
+        """Parameters
+
+        names (tuple): Stage names, the index of a name is the slot number of the stage
+        """
+        self.names = names
+        n = len(names)
+        self.count = array.array('I')
+        self.t_min = array.array('I')
+        self.t_avg = array.array('I')
+        self.t_max = array.array('I')
+        self.alloc = array.array('I')
+        self._t = array.array('I')
+        self._m = array.array('I')
+        for a in (self.count, self.t_min, self.t_avg, self.t_max, self.alloc, self._t, self._m):
+            for i in range(n):
+                a.append(0)
+
+    def reset(self):
+        """Clear all counters"""
+        for i in range(len(self.names)):
+            self.count[i] = 0
+            self.t_min[i] = 0
+            self.t_avg[i] = 0
+            self.t_max[i] = 0
+            self.alloc[i] = 0
+
+    def start(self, slot):
+        """Mark the start of a stage"""
+        self._m[slot] = gc.mem_alloc()
+        self._t[slot] = time.ticks_us()
+
+    def stop(self, slot):
+        """Mark the end of a stage and update its counters"""
+        dt = time.ticks_diff(time.ticks_us(), self._t[slot])
+        da = gc.mem_alloc() - self._m[slot]
+        if self.count[slot] == 0:
+            self.t_min[slot] = dt
+            self.t_avg[slot] = dt
+        else:
+            if dt < self.t_min[slot]:
+                self.t_min[slot] = dt
+            self.t_avg[slot] += (dt - self.t_avg[slot]) >> 3
+        if dt > self.t_max[slot]:
+            self.t_max[slot] = dt
+        if da > self.alloc[slot]:
+            self.alloc[slot] = da
+        self.count[slot] += 1
+
+    def report(self):
+        """Returns the counters as a dictionary {name: [count, min, avg, max, alloc]}, times in us"""
+        return {name: [self.count[i], self.t_min[i], self.t_avg[i], self.t_max[i], self.alloc[i]]
+                for i, name in enumerate(self.names)}
@@ -0,0 +1,108 @@
+import array
+from filefifo import write_header
+
+
+class Recorder:
+    """Raw PPG session recorder.
+    Samples are copied into one of two fixed size blocks. When a block is
+    full it is handed over for writing and filling continues in the other
+    block. write() writes at most one whole block per call and must be called
+    outside the interrupt, so the time spent in one call is bounded by one
+    block write. If the writer has not caught up when the second block is
+    full that block is dropped and counted.
+    The file is a binary recording that Filefifo can replay.
+    """
+    def __init__(self, rate = 250, block = 256, typecode = 'H'):
+        """Parameters
+
+        rate (int): Sampling rate in Hz written in the file header
+        block (int): Number of samples in one block
+        typecode (char): Type of the samples as defined in array (Default is 'H' - unsigned short)
+        """
+        self.rate = rate
+        self.typecode = typecode
+        self.size = block
+        self.blocks = (array.array(typecode), array.array(typecode))
+        for i in range(block):
+            self.blocks[0].append(0)
+            self.blocks[1].append(0)
+        self._views = (memoryview(self.blocks[0]), memoryview(self.blocks[1]))
+        self.file = None
+        self.fill = 0
+        self.pos = 0
+        self.ready = -1
+        self.dc = 0
+        self.written = 0
+
+    def start(self, name):
+        """Start a new recording into file name"""
+        if self.file is not None:
+            self.stop()
+        self.file = open(name, 'wb')
+        write_header(self.file, self.rate, self.typecode)
+        self.fill = 0
+        self.pos = 0
+        self.ready = -1
+        self.dc = 0
+        self.written = 0
+
+    def _swap(self):
+        if self.ready >= 0:
+            # Writer is behind, reuse the block that was being filled
+            self.dc += 1
+        else:
+            self.ready = self.fill
+            self.fill ^= 1
+        self.pos = 0
+
+    def add(self, value):
+        """Add one sample"""
+        if self.file is None:
+            return
+        self.blocks[self.fill][self.pos] = value
+        self.pos += 1
+        if self.pos == self.size:
+            self._swap()
+
+    def add_many(self, buf, n = -1):
+        """Add up to n samples (default len(buf)) from an array or memoryview"""
+        if self.file is None:
+            return
+        if n < 0 or n > len(buf):
+            n = len(buf)
+        src = memoryview(buf)
+        i = 0
+        while i < n:
+            k = min(n - i, self.size - self.pos)
+            self._views[self.fill][self.pos:self.pos + k] = src[i:i + k]
+            self.pos += k
+            i += k
+            if self.pos == self.size:
+                self._swap()
+
+    def pending(self):
+        """Returns True if a full block is waiting to be written"""
+        return self.ready >= 0
+
+    def write(self):
+        """Write the full block if there is one. Returns True if a block was written."""
+        if self.ready < 0 or self.file is None:
+            return False
+        self.file.write(self.blocks[self.ready])
+        self.ready = -1
+        self.written += 1
+        return True
+
+    def stop(self):
+        """Write what is left and close the file"""
+        if self.file is None:
+            return
+        self.write()
+        if self.pos:
+            self.file.write(self._views[self.fill][:self.pos])
+        self.file.close()
+        self.file = None
+
+    def dropped(self):
+        """Return number of blocks dropped because the writer was too slow"""
+        return self.dc
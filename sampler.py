@@ -0,0 +1,83 @@
+from fifo import Fifo
+
+
+class Sampler:
+    """Fixed rate ADC sampler.
+    A Piotimer hard interrupt reads the ADC and puts the sample into a
+    preallocated Fifo. The main program drains the fifo by calling get()
+    while has_data() returns True, or many at once with get_into(). Nothing
+    is allocated in the interrupt.
+    If a file name is given the sampler runs in host mode: no timer or ADC
+    is used and the samples are read from the file through Filefifo.
+    With a piotimer.Scheduler the sampler shares its tick instead of using
+    a Piotimer of its own.
+    """
+    def __init__(self, adc_pin = 26, rate = 250, size = 500, name = None, scheduler = None):
+        """Parameters
+
+        adc_pin (int): GPIO pin of the ADC input (Default is 26 - ADC0)
+        rate (int): Sampling rate in Hz (Default is 250)
+        size (int): Size of the sample fifo. Must hold the samples that arrive between two drains.
+        name (string): Recording to read samples from. None means use the ADC.
+        scheduler (Scheduler): Scheduler to sample on. None means a Piotimer of its own.
+            rate must divide its tick frequency, otherwise ValueError is raised.
+        """
+        if name is None and scheduler is not None and scheduler.freq % rate:
+            raise ValueError('rate must divide the scheduler tick frequency')
+        self.rate = rate
+        self.scheduler = scheduler
+        self._timer = None
+        self._slot = -1
+        if name is None:
+            from machine import ADC
+            self._adc = ADC(adc_pin)
+            self.fifo = Fifo(size)
+        else:
+            from filefifo import Filefifo
+            self._adc = None
+            self.fifo = Filefifo(size, name = name)
+            if self.fifo.rate:
+                self.rate = self.fifo.rate # Binary recordings know their own rate
+
+    def _handler(self, tid):
+        # An exception would abort the interrupt or the whole scheduler tick, a full fifo only counts the drop
+        self.fifo.put_nowait(self._adc.read_u16())
+
+    def start(self):
+        """Start sampling. In host mode the recording is always available."""
+        if self._adc is None:
+            return
+        if self.scheduler is not None:
+            if self._slot < 0:
+                self._slot = self.scheduler.add(self._handler, freq = self.rate)
+        elif self._timer is None:
+            from piotimer import Piotimer
+            self._timer = Piotimer(mode = Piotimer.PERIODIC, freq = self.rate, callback = self._handler)
+
+    def stop(self):
+        """Stop sampling and discard the samples that were not read."""
+        if self._timer is not None or self._slot >= 0:
+            if self._timer is not None:
+                self._timer.deinit()
+                self._timer = None
+            else:
+                self.scheduler.cancel(self._slot)
+                self._slot = -1
+            while self.fifo.has_data():
+                self.fifo.get()
+
+    def has_data(self):
+        """Returns True if there are samples waiting"""
+        return self.fifo.has_data()
+
+    def get(self):
+        """Get the oldest sample"""
+        return self.fifo.get()
+
+    def get_into(self, buf, n = -1):
+        """Copy up to n of the oldest samples into buf. Returns the number of samples copied."""
+        return self.fifo.get_into(buf, n)
+
+    def dropped(self):
+        """Return number of samples dropped because the fifo was full"""
+        return self.fifo.dropped()
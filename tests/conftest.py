@@ -0,0 +1,18 @@
+"""The modules are imported from the project root and lib, as on the Pico."""
+import os
+import sys
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lib')]
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """The hardware modules of bench/fakes. Modules imported during the test are
+    removed afterwards, so other tests do not see the fakes."""
+    monkeypatch.syspath_prepend(os.path.join(ROOT, 'bench', 'fakes'))
+    before = set(sys.modules)
+    yield
+    for name in set(sys.modules) - before:
+        del sys.modules[name]
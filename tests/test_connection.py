@@ -0,0 +1,171 @@
+"""ConnectionManager on the unix port of MicroPython against a stub MQTT broker
+that runs in a thread of the test."""
+import socket
+import threading
+import time
+import pytest
+from test_micropython import MICROPYTHON, run
+
+pytestmark = pytest.mark.skipif(MICROPYTHON is None, reason = 'micropython not found')
+
+
+class Broker:
+    """Answers CONNECT, PUBLISH with QoS 0 and PINGREQ. A message to the topic
+    'drop' closes the session and refuses the next connection."""
+    def __init__(self):
+        self.connects = []
+        self.messages = []
+        self.pings = 0
+        self.refuse = 0
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(2)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target = self.serve, daemon = True).start()
+
+    def wait(self, n, timeout = 2):
+        # The session thread may still be reading what the client sent before it exited
+        end = time.monotonic() + timeout
+        while len(self.messages) < n and time.monotonic() < end:
+            time.sleep(0.01)
+        return self.messages
+
+    def serve(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target = self.session, args = (conn,), daemon = True).start()
+
+    def read(self, conn, n):
+        data = b''
+        while len(data) < n:
+            part = conn.recv(n - len(data))
+            if not part:
+                raise EOFError
+            data += part
+        return data
+
+    def packet(self, conn):
+        kind = self.read(conn, 1)[0]
+        n = shift = 0
+        while True:
+            b = self.read(conn, 1)[0]
+            n |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                return kind, self.read(conn, n)
+
+    def session(self, conn):
+        with conn:
+            try:
+                while True:
+                    kind, body = self.packet(conn)
+                    if kind == 0x10:
+                        # Protocol name, level, flags and keepalive before the client id
+                        self.connects.append(int.from_bytes(body[8:10], 'big'))
+                        if self.refuse:
+                            self.refuse -= 1
+                            conn.sendall(b'\x20\x02\x00\x03')
+                            return
+                        conn.sendall(b'\x20\x02\x00\x00')
+                    elif kind & 0xF0 == 0x30:
+                        n = int.from_bytes(body[:2], 'big')
+                        topic = body[2:2 + n].decode()
+                        if topic == 'drop':
+                            self.refuse = 1
+                            return
+                        self.messages.append((topic, body[2 + n:]))
+                    elif kind == 0xC0:
+                        self.pings += 1
+                        conn.sendall(b'\xD0\x00')
+                    elif kind == 0xE0:
+                        return
+            except (EOFError, OSError):
+                pass
+
+
+@pytest.fixture
+def broker():
+    b = Broker()
+    yield b
+    b.sock.close()
+
+
+def test_session_is_kept_and_restored(broker, tmp_path):
+    out = run("""
+import time
+from connection import ConnectionManager
+cm = ConnectionManager('ssid', 'pw', '127.0.0.1', 'pico', keepalive = 1, min_backoff = 200, port = {})
+cm.publish('hr/raw', b'1,2,3')
+print(cm.flush(2000), cm.connected())
+# Nothing to send, the broker is pinged at half of the keepalive
+time.sleep_ms(600)
+cm.service()
+time.sleep_ms(100)
+print(cm.service())
+# The broker goes away and refuses the first reconnect
+cm.publish('drop', b'')
+t = time.ticks_ms()
+while cm.service() and time.ticks_diff(time.ticks_ms(), t) < 2000:
+    time.sleep_ms(10)
+for i in range(3):
+    cm.publish('hr/raw', str(i))
+t = time.ticks_ms()
+print(cm.connected(), cm.service(), cm.pending())
+print(cm.flush(3000), time.ticks_diff(time.ticks_ms(), t) >= 550, cm.pending(), cm.dropped())
+""".format(broker.port), tmp_path)
+    assert out == ['True', 'True', 'True', 'False', 'False', '3', 'True', 'True', '0', '0']
+    assert broker.connects == [1, 1, 1]
+    assert broker.pings >= 1
+    assert broker.wait(4) == [('hr/raw', b'1,2,3'), ('hr/raw', b'0'), ('hr/raw', b'1'), ('hr/raw', b'2')]
+
+
+def test_full_queue_drops_the_oldest(tmp_path):
+    # No broker, the messages wait in the queue
+    out = run("""
+from connection import ConnectionManager
+cm = ConnectionManager('ssid', 'pw', '127.0.0.1', queue_size = 3, min_backoff = 10000, port = 1)
+for i in range(5):
+    cm.publish('t', str(i))
+print(cm.service(), cm.service(), cm.pending(), cm.dropped(), [m for t, m in cm.queue])
+""", tmp_path)
+    assert out == ['False', 'False', '3', '2', "['2',", "'3',", "'4']"]
+
+
+def test_queued_results_are_batched(broker, tmp_path):
+    # Queued before the first connect, as if the broker had been unreachable
+    out = run("""
+from connection import ConnectionManager
+cm = ConnectionManager('ssid', 'pw', '127.0.0.1', batch_size = 3, port = {})
+for i in range(4):
+    cm.publish_json('r', {{'n': i}})
+cm.publish('x', 'raw')
+cm.publish_json('r', {{'n': 4}})
+print(cm.flush(2000))
+""".format(broker.port), tmp_path)
+    assert out == ['True']
+    assert broker.wait(4) == [('r/batch', b'[{"n":0},{"n":1},{"n":2}]'), ('r', b'{"n":3}'),
+                               ('x', b'raw'), ('r', b'{"n":4}')]
+
+
+def test_silent_broker_does_not_block(tmp_path):
+    # Accepts the TCP connection but never answers the CONNECT
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(4)
+    try:
+        out = run("""
+import time
+from connection import ConnectionManager
+cm = ConnectionManager('ssid', 'pw', '127.0.0.1', min_backoff = 0, port = {}, connect_timeout = 200)
+cm.publish('t', 'x')
+for i in range(2):
+    t = time.ticks_ms()
+    print(cm.service(), time.ticks_diff(time.ticks_ms(), t) < 1000)
+print(cm.pending())
+""".format(sock.getsockname()[1]), tmp_path)
+    finally:
+        sock.close()
+    assert out == ['False', 'True', 'False', 'True', '1']
@@ -0,0 +1,88 @@
+import random
+from hrv import Convergence
+
+
+def series(seed, n, start = 850):
+    # Slowly wandering intervals without artefacts
+    rng = random.Random(seed)
+    x = start
+    out = []
+    for i in range(n):
+        x = min(1100, max(600, x + rng.randint(-30, 30)))
+        out.append(x)
+    return out
+
+
+def test_not_done_before_min_beats():
+    # The errors are within 30 % after a dozen beats, done() still waits for min_beats
+    c = Convergence(0.3, 30, 300)
+    ppi = series(4, 30)
+    for x in ppi[:-1]:
+        assert c.add(x)
+        assert not c.done()
+    assert max(c.errors()) <= 0.3
+    c.add(ppi[-1])
+    assert c.done()
+
+
+def test_done_at_max_beats():
+    # A tolerance that is never met, the measurement still ends at max_beats
+    c = Convergence(0.0001, 30, 50)
+    for i, x in enumerate(series(1, 50)):
+        assert not c.done()
+        c.add(x)
+    assert c.n == 50 and c.done()
+
+
+def test_no_limit_without_max_beats():
+    c = Convergence(0.0001, 30, 0)
+    for x in series(2, 500):
+        c.add(x)
+    assert not c.done()
+
+
+def test_artefacts_are_left_out():
+    c = Convergence(0.1, 5, 0)
+    for x in (800, 810, 790, 805, 795):
+        assert c.add(x)
+    # Outside 300 - 2000 ms, or more than 30 % from the mean of 800
+    for x in (250, 2500, 1100, 500):
+        assert not c.add(x)
+    assert c.add(1030) and c.add(600)
+    assert c.n == 7 and c.rejected == 4
+    # The left out intervals do not change the statistics
+    d = Convergence(0.1, 5, 0)
+    for x in (800, 810, 790, 805, 795, 1030, 600):
+        d.add(x)
+    assert c.errors() == d.errors()
+
+
+def test_stable_series_converges():
+    for seed in range(10):
+        c = Convergence(0.1, 30, 0)
+        for i, x in enumerate(series(seed, 1000)):
+            c.add(x)
+            if c.done():
+                break
+        assert 30 <= c.n < 300, seed
+        assert max(c.errors()) <= 0.1
+    # A tighter tolerance needs more beats
+    tight = Convergence(0.05, 30, 0)
+    for x in series(3, 1000):
+        tight.add(x)
+        if tight.done():
+            break
+    loose = Convergence(0.1, 30, 0)
+    for x in series(3, 1000):
+        loose.add(x)
+        if loose.done():
+            break
+    assert tight.done() and loose.n < tight.n
+
+
+def test_reset():
+    c = Convergence(0.1, 3, 0)
+    for x in (800, 250, 800, 800):
+        c.add(x)
+    c.reset()
+    assert c.n == 0 and c.rejected == 0 and not c.done()
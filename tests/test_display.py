@@ -0,0 +1,88 @@
+import random
+import pytest
+
+
+class Panel:
+    """I2C bus with an SSD1306 behind it, keeps the display RAM in horizontal
+    addressing mode and counts the bytes written"""
+    def __init__(self):
+        self.written = 0
+        self.ram = bytearray(1024)
+        self.cmds = []
+        self.cols = (0, 127)
+        self.pages = (0, 7)
+        self.col = 0
+        self.page = 0
+
+    def writeto(self, addr, buf):
+        self.written += len(buf)
+        assert buf[0] == 0x80
+        self.cmds.append(buf[1])
+        if len(self.cmds) == 3 and self.cmds[0] in (0x21, 0x22):
+            if self.cmds[0] == 0x21:
+                self.cols = (self.cmds[1], self.cmds[2])
+                self.col = self.cmds[1]
+            else:
+                self.pages = (self.cmds[1], self.cmds[2])
+                self.page = self.cmds[1]
+            self.cmds = []
+
+    def writevto(self, addr, bufs):
+        assert bytes(bufs[0]) == b'\x40'
+        self.written += 1 + len(bufs[1])
+        for v in bytes(bufs[1]):
+            self.ram[self.page * 128 + self.col] = v
+            self.col += 1
+            if self.col > self.cols[1]:
+                self.col = self.cols[0]
+                self.page = self.page + 1 if self.page < self.pages[1] else self.pages[0]
+
+
+@pytest.fixture
+def oled(fakes):
+    from display import Display
+    return Display(128, 64, Panel())
+
+
+def sent(oled):
+    before = oled.i2c.written
+    oled.show()
+    return oled.i2c.written - before
+
+
+def test_identical_frame_sends_nothing(oled):
+    oled.text('HRV', 0, 0, 1)
+    sent(oled)
+    assert sent(oled) == 0
+    assert oled.i2c.ram == oled.buffer
+
+
+def test_one_pixel_sends_one_column(oled):
+    oled.pixel(10, 20, 1)
+    # Six two byte commands for the column and page range, the data prefix and one byte
+    assert sent(oled) == 6 * 2 + 1 + 1
+    assert sent(oled) == 0
+    oled.pixel(10, 20, 0)
+    oled.pixel(30, 21, 1)
+    assert sent(oled) == 6 * 2 + 1 + 21
+    assert oled.i2c.ram == oled.buffer
+
+
+def test_every_page_changed_sends_the_frame(oled):
+    oled.fill(1)
+    assert sent(oled) == 6 * 2 + 1 + 1024
+    oled.invalidate()
+    assert sent(oled) == 6 * 2 + 1 + 1024
+    assert sent(oled) == 0
+
+
+def test_random_drawing_reaches_the_panel(oled):
+    rng = random.Random(5)
+    for i in range(100):
+        for j in range(rng.randint(0, 6)):
+            oled.pixel(rng.randrange(128), rng.randrange(64), rng.randint(0, 1))
+        if i % 10 == 0:
+            oled.fill_rect(rng.randrange(128), rng.randrange(64), 20, 5, rng.randint(0, 1))
+        oled.show()
+        assert oled.i2c.ram == oled.buffer
+        assert oled.shadow == oled.buffer
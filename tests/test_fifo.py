@@ -0,0 +1,22 @@
+import array
+from fifo import Fifo
+
+
+def test_put_nowait_counts_instead_of_raising():
+    fifo = Fifo(4)
+    assert [fifo.put_nowait(v) for v in range(5)] == [True, True, True, False, False]
+    assert fifo.dropped() == 2
+    buf = array.array('H', bytearray(2 * 4))
+    assert fifo.get_into(buf) == 3
+    assert list(buf[:3]) == [0, 1, 2]
+    assert fifo.put_nowait(7)
+
+
+def test_put_many_wraps():
+    fifo = Fifo(8)
+    buf = array.array('H', bytearray(2 * 8))
+    for start in range(0, 30, 5):
+        assert fifo.put_many(array.array('H', range(start, start + 5))) == 5
+        assert fifo.get_into(buf) == 5
+        assert list(buf[:5]) == list(range(start, start + 5))
+    assert fifo.dropped() == 0
@@ -0,0 +1,56 @@
+import array
+import pytest
+import filefifo
+from filefifo import Filefifo, write_header
+
+DATA = [i * 101 % 65536 for i in range(300)]
+
+
+@pytest.fixture(params = ['mmap', 'chunked'])
+def recording(request, tmp_path, monkeypatch):
+    # Binary recording read through mmap as on a PC, or in chunks as on the Pico
+    if request.param == 'chunked':
+        monkeypatch.setattr(filefifo, 'mmap', None)
+    name = str(tmp_path / 'rec.bin')
+    with open(name, 'wb') as f:
+        write_header(f, 125)
+        f.write(array.array('H', DATA))
+    return name
+
+
+def test_text_file(tmp_path):
+    name = str(tmp_path / 'rec.txt')
+    with open(name, 'w') as f:
+        f.write(''.join('{}\n'.format(v) for v in DATA[:10]))
+    fifo = Filefifo(10, name = name)
+    assert fifo.rate is None
+    assert [fifo.get() for i in range(15)] == DATA[:10] + DATA[:5]
+
+
+def test_binary_get(recording):
+    fifo = Filefifo(16, name = recording, repeat = False)
+    assert fifo.rate == 125
+    assert [fifo.get() for i in range(len(DATA))] == DATA
+    with pytest.raises(RuntimeError):
+        fifo.get()
+
+
+def test_binary_get_into_repeats(recording):
+    fifo = Filefifo(16, name = recording)
+    buf = array.array('H', bytearray(2 * 70))
+    got = []
+    for i in range(10):
+        assert fifo.get_into(buf) == len(buf)
+        got.extend(buf)
+    assert got == (DATA * 3)[:700]
+
+
+def test_binary_end_without_repeat(recording):
+    fifo = Filefifo(16, name = recording, repeat = False)
+    buf = array.array('H', bytearray(2 * 128))
+    assert fifo.get() == DATA[0]
+    assert fifo.get_into(buf) == 128
+    assert fifo.get_into(buf, 50) == 50
+    assert fifo.get_into(buf) == len(DATA) - 179
+    assert list(buf[:len(DATA) - 179]) == DATA[179:]
+    assert fifo.get_into(buf) == 0
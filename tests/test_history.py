@@ -0,0 +1,62 @@
+import os
+import pytest
+from history import HistoryLog
+
+
+def record(i):
+    return (HistoryLog.HRV if i % 2 else HistoryLog.KUBIOS, 800 + i, 75 - i, 40 + i, 30 + i, -i, i)
+
+
+def test_default_timestamp(tmp_path):
+    log = HistoryLog(str(tmp_path / 'history.bin'))
+    log.append(*record(1))
+    assert isinstance(log.read(0)[0], int) and log.read(0)[0] > 0
+
+
+def test_newest_first(tmp_path):
+    log = HistoryLog(str(tmp_path / 'history.bin'), 5)
+    assert len(log) == 0
+    for i in range(3):
+        log.append(*record(i), timestamp = 1000 + i)
+    assert len(log) == 3
+    assert [log.read(n) for n in range(3)] == [(1000 + i,) + record(i) for i in (2, 1, 0)]
+
+
+def test_wrap_around_overwrites_the_oldest(tmp_path):
+    name = str(tmp_path / 'history.bin')
+    log = HistoryLog(name, 5)
+    size = os.path.getsize(name)
+    for i in range(12):
+        log.append(*record(i), timestamp = i)
+    assert len(log) == 5
+    assert [log.read(n)[0] for n in range(5)] == [11, 10, 9, 8, 7]
+    assert os.path.getsize(name) == size # Preallocated, the file does not grow
+
+
+def test_reopen_keeps_records_and_capacity(tmp_path):
+    name = str(tmp_path / 'history.bin')
+    log = HistoryLog(name, 4)
+    for i in range(6):
+        log.append(*record(i), timestamp = i)
+    log = HistoryLog(name, 50)
+    assert log.capacity == 4 and len(log) == 4
+    log.append(*record(6), timestamp = 6)
+    assert [log.read(n)[0] for n in range(4)] == [6, 5, 4, 3]
+
+
+def test_read_outside_the_records(tmp_path):
+    log = HistoryLog(str(tmp_path / 'history.bin'), 3)
+    log.append(*record(0), timestamp = 0)
+    for n in (-1, 1, 3):
+        with pytest.raises(IndexError):
+            log.read(n)
+
+
+def test_other_file_is_replaced(tmp_path):
+    name = str(tmp_path / 'history.bin')
+    with open(name, 'w') as f:
+        f.write('7.5.2024 9:55\nMeanPPI:968ms\n')
+    log = HistoryLog(name, 3)
+    assert len(log) == 0 and log.capacity == 3
+    log.append(*record(0), timestamp = 5)
+    assert HistoryLog(name).read(0)[0] == 5
@@ -0,0 +1,86 @@
+import array
+import random
+import pytest
+from hrv import HRVAccumulator
+
+np = pytest.importorskip('numpy')
+
+NAMES = ('meanPPI', 'meanHR', 'SDNN', 'RMSSD', 'SDSD', 'SD1', 'SD2')
+
+
+def intervals(seed, n):
+    rng = random.Random(seed)
+    x = 850
+    out = array.array('H')
+    for i in range(n):
+        x = min(1500, max(400, x + rng.randint(-60, 60)))
+        out.append(x)
+    return out
+
+
+def reference(ppi):
+    x = np.array(ppi, dtype = np.float64)
+    d = np.diff(x)
+    sdnn = np.std(x, ddof = 1)
+    sdsd = np.std(d, ddof = 1)
+    return (np.mean(x), 60000 / np.mean(x), sdnn, np.sqrt(np.mean(d * d)), sdsd,
+            sdsd / np.sqrt(2), np.sqrt(2 * sdnn ** 2 - sdsd ** 2 / 2))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_metrics_match_numpy(seed):
+    ppi = intervals(seed, 10 + 13 * seed)
+    hrv = HRVAccumulator()
+    for x in ppi:
+        hrv.add(x)
+    got = (hrv.mean_ppi(), hrv.mean_hr(), hrv.sdnn(), hrv.rmssd(), hrv.sdsd(), hrv.sd1(), hrv.sd2())
+    assert got == pytest.approx(reference(ppi), rel = 1e-9)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_rounded_results_match_numpy(seed):
+    ppi = intervals(seed, 10 + 13 * seed)
+    hrv = HRVAccumulator()
+    for x in ppi:
+        hrv.add(x)
+    for name, got, ref in zip(NAMES, hrv.results(), reference(ppi)):
+        if abs(ref - int(ref) - 0.5) > 1e-9: # An exact tie can round either way in floats
+            assert got == round(ref), name
+
+
+def test_add_array_matches_add():
+    ppi = intervals(99, 300)
+    one = HRVAccumulator()
+    for x in ppi:
+        one.add(x)
+    many = HRVAccumulator()
+    many.add_array(ppi[:100])
+    many.add_array(ppi[100:])
+    assert many.results() == one.results()
+    assert many.sdsd() == pytest.approx(one.sdsd(), rel = 1e-12)
+
+
+# The calculators that HRVAccumulator replaced, as they were in main.py
+def old_mean_ppi(data):
+    return int(round(sum(data) / len(data), 0))
+
+
+def old_sdnn(data, ppi):
+    return int(round((sum((i - ppi) ** 2 for i in data) / (len(data) - 1)) ** (1 / 2), 0))
+
+
+def old_rmssd(data):
+    return int(round((sum((data[i + 1] - data[i]) ** 2 for i in range(len(data) - 1)) / (len(data) - 1)) ** (1 / 2), 0))
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_agrees_with_the_old_calculators(seed):
+    # Mean HR, SDSD, SD1 and SD2 deliberately differ, see HRVAccumulator
+    ppi = list(intervals(seed, 10 + 7 * seed))
+    hrv = HRVAccumulator()
+    for x in ppi:
+        hrv.add(x)
+    mean_ppi, mean_hr, sdnn, rmssd = hrv.results()[:4]
+    assert mean_ppi == old_mean_ppi(ppi)
+    assert sdnn == old_sdnn(ppi, old_mean_ppi(ppi))
+    assert rmssd == old_rmssd(ppi)
@@ -0,0 +1,63 @@
+import math
+import random
+from fractions import Fraction
+import pytest
+from hrv import HRVAccumulator, isqrt, _round_div, _round_sqrt
+
+
+def test_isqrt():
+    for n in range(20000):
+        assert isqrt(n) == math.isqrt(n)
+    rng = random.Random(1)
+    for i in range(2000):
+        n = rng.getrandbits(rng.randint(1, 80))
+        assert isqrt(n) == math.isqrt(n)
+
+
+def test_round_div_ties_to_even():
+    for a in range(-300, 300):
+        for b in range(1, 13):
+            assert _round_div(a, b) == round(Fraction(a, b))
+
+
+def test_round_sqrt_is_exact():
+    rng = random.Random(2)
+    for i in range(5000):
+        a = rng.randint(0, 10 ** 9)
+        b = rng.randint(1, 10 ** 4)
+        k = _round_sqrt(a, b)
+        # k - 0.5 <= sqrt(a / b) <= k + 0.5
+        assert (2 * k - 1) ** 2 * b <= 4 * a <= (2 * k + 1) ** 2 * b
+
+
+def reference(ppi):
+    # The float formulas, as the metrics are defined
+    n = len(ppi)
+    mean = sum(ppi) / n
+    sdnn = math.sqrt(sum((x - mean) ** 2 for x in ppi) / (n - 1))
+    d = [ppi[i + 1] - ppi[i] for i in range(n - 1)]
+    rmssd = math.sqrt(sum(x * x for x in d) / (n - 1))
+    mean_d = sum(d) / len(d)
+    sdsd = math.sqrt(sum((x - mean_d) ** 2 for x in d) / (len(d) - 1))
+    return (mean, 60000 / mean, sdnn, rmssd, sdsd, sdsd / math.sqrt(2), math.sqrt(2 * sdnn ** 2 - sdsd ** 2 / 2))
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_results_match_float_reference(seed):
+    rng = random.Random(seed)
+    ppi = [rng.randint(500, 1200) for i in range(3 + 5 * seed)]
+    hrv = HRVAccumulator()
+    for x in ppi:
+        hrv.add(x)
+    for got, ref in zip(hrv.results(), reference(ppi)):
+        if abs(ref - int(ref) - 0.5) > 1e-9:
+            assert got == round(ref)
+
+
+def test_short_series():
+    hrv = HRVAccumulator()
+    assert hrv.results() == (0, 0, 0, 0, 0, 0, 0)
+    hrv.add(800)
+    assert hrv.results() == (800, 75, 0, 0, 0, 0, 0)
+    hrv.add(1000)
+    assert hrv.results() == (900, 67, 141, 200, 0, 0, 200)
@@ -0,0 +1,116 @@
+import json
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+import kubios
+
+pytest.importorskip('requests')
+
+
+class Server:
+    """Token endpoint and analysis endpoint of Kubios Cloud on localhost. Every
+    token handed out is counted, the analysis accepts only the latest one."""
+    def __init__(self):
+        self.tokens = 0
+        self.expires_in = 3600
+        self.analyses = []
+        self.reject = False
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.path == '/token':
+                    assert self.headers['Authorization'].startswith('Basic ')
+                    assert body == b'grant_type=client_credentials&client_id=id'
+                    server.tokens += 1
+                    self.reply(200, {"access_token": "t{}".format(server.tokens), "expires_in": server.expires_in})
+                elif server.reject or self.headers['Authorization'] != 'Bearer t{}'.format(server.tokens):
+                    self.reply(401, {"message": "Unauthorized"})
+                else:
+                    assert self.headers['X-Api-Key'] == 'key'
+                    server.analyses.append(json.loads(body))
+                    self.reply(200, {"status": "ok", "analysis": {"sns_index": 1.5, "pns_index": -0.5}})
+
+            def reply(self, status, value):
+                data = json.dumps(value).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_port)
+        threading.Thread(target = self.httpd.serve_forever, daemon = True).start()
+
+
+@pytest.fixture
+def server():
+    s = Server()
+    yield s
+    s.httpd.shutdown()
+    s.httpd.server_close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now = 1000.0)
+    monkeypatch.setattr(kubios, 'time', types.SimpleNamespace(time = lambda: clock.now))
+    return clock
+
+
+def test_token_is_reused_until_near_expiry(server, clock):
+    tokens = kubios.TokenManager('id', 'secret', server.url + '/token', margin = 60)
+    assert tokens.get() == 't1'
+    clock.now += 3600 - 61
+    assert tokens.get() == 't1'
+    assert server.tokens == 1
+    clock.now += 1
+    assert tokens.get() == 't2'
+    assert server.tokens == 2
+
+
+def test_token_survives_restart(server, clock, tmp_path):
+    name = str(tmp_path / 'kubios_token.json')
+    assert kubios.TokenManager('id', 'secret', server.url + '/token', name).get() == 't1'
+    tokens = kubios.TokenManager('id', 'secret', server.url + '/token', name)
+    assert tokens.get() == 't1'
+    assert server.tokens == 1
+
+
+def test_analyze(server, clock):
+    tokens = kubios.TokenManager('id', 'secret', server.url + '/token')
+    ppi = [812, 845, 830, 790, 805, 820, 860, 840, 815, 800]
+    for i in range(3):
+        response = kubios.analyze(tokens, 'key', ppi, server.url + '/analyze')
+        assert response["analysis"]["sns_index"] == 1.5
+    assert server.tokens == 1
+    assert server.analyses == [{"type": "RRI", "data": ppi, "analysis": {"type": "readiness"}}] * 3
+
+
+def test_rejected_token_is_refreshed_once(server, clock, tmp_path):
+    # A token saved before a restart that the server no longer accepts
+    name = str(tmp_path / 'kubios_token.json')
+    with open(name, 'w') as f:
+        json.dump({"access_token": "stale", "expires_at": clock.now + 3600}, f)
+    tokens = kubios.TokenManager('id', 'secret', server.url + '/token', name)
+    response = kubios.analyze(tokens, 'key', [800] * 10, server.url + '/analyze')
+    assert response["status"] == "ok"
+    assert server.tokens == 1 and len(server.analyses) == 1
+    with open(name) as f:
+        assert json.load(f)["access_token"] == 't1'
+
+
+def test_second_rejection_is_returned(server, clock):
+    # The server refuses every token, analyze gives up after one refresh
+    server.reject = True
+    tokens = kubios.TokenManager('id', 'secret', server.url + '/token')
+    tokens.access_token = 'x'
+    tokens.expires_at = clock.now + 3600
+    assert kubios.analyze(tokens, 'key', [800] * 10, server.url + '/analyze') == {"message": "Unauthorized"}
+    assert server.tokens == 1 and server.analyses == []
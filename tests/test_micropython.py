@@ -0,0 +1,237 @@
+"""Checks that run on the unix port of MicroPython.
+
+The micropython binary is taken from the MICROPYTHON environment variable or
+found in PATH, without it these tests are skipped. The hardware modules are
+the fakes in bench/fakes.
+"""
+import os
+import shutil
+import subprocess
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MICROPYTHON = os.environ.get('MICROPYTHON') or shutil.which('micropython')
+
+pytestmark = pytest.mark.skipif(MICROPYTHON is None, reason = 'micropython not found')
+
+PATH = "import sys\nsys.path[:0] = ['{0}/bench/fakes', '{0}', '{0}/lib']\n".format(ROOT)
+
+
+def run(code, cwd):
+    # Files written by the code, e.g. the history log of main.py, go to cwd
+    result = subprocess.run([MICROPYTHON, '-c', PATH + code], cwd = str(cwd), capture_output = True,
+                            text = True, timeout = 120)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout.split()
+
+
+# main.py without starting the event loop, its globals are in g. The emergency
+# exception buffer only exists on the boards.
+MAIN = """
+src = open({!r}).read()
+src = src.replace('asyncio.run(main())', '').replace('micropython.alloc_emergency_exception_buf(200)', '')
+g = {{'__name__': 'main'}}
+exec(src, g)
+""".format(os.path.join(ROOT, 'main.py'))
+
+
+def test_main_imports(tmp_path):
+    out = run(MAIN + """
+g['Init_Measurement']()
+print(g['scheduler']._timer.sm.active(), g['pipeline'].sampler.rate)
+""", tmp_path)
+    # The scheduler tick is stopped until a measurement starts
+    assert out[-2] == '0' and out[-1].isdigit()
+
+
+def test_encoder_events(tmp_path):
+    # RotaryEncoder of main.py driven by SimEncoder, NEXT=1 PREV=0 PRESS=2 SW_2=3 SW_0=4
+    out = run(MAIN + """
+import uasyncio as asyncio
+from pioencoder import SimEncoder
+sim = SimEncoder()
+enc = g['RotaryEncoder'](10, 11, 12, 300, decoder = sim)
+
+async def events(n):
+    out = []
+    for i in range(n):
+        out.append(await enc.next_event())
+    return out
+
+async def test():
+    sim.turn(3)
+    print(await events(3))
+    sim.turn(-2)
+    print(await events(2))
+    # Buttons come before the steps that are waiting
+    sim.turn(2)
+    enc.put(2)
+    print(await events(3))
+    # wait_for forgets what came before it and skips the other events
+    sim.turn(5)
+    enc.put(4)
+    task = asyncio.create_task(enc.wait_for(2, 3))
+    await asyncio.sleep_ms(50)
+    sim.turn(1)
+    enc.put(4)
+    await asyncio.sleep_ms(50)
+    print(task.done())
+    enc.put(3)
+    print(await task, sim.delta())
+    # A full queue counts the drop instead of raising, put() is called from interrupts
+    for i in range(20):
+        enc.put(2)
+    print(enc.Rotation.dropped())
+
+asyncio.run(test())
+""", tmp_path)
+    assert out == ['[1,', '1,', '1]', '[0,', '0]', '[2,', '1,', '1]', 'False', '3', '0', '5']
+
+
+def test_recording_round_trip(tmp_path):
+    name = str(tmp_path / 'rec.bin')
+    out = run("""
+import array
+from recorder import Recorder
+from filefifo import Filefifo
+recorder = Recorder(rate = 125, block = 16)
+recorder.start({!r})
+data = array.array('H', [i * 37 & 0xFFFF for i in range(100)])
+for i in range(0, 100, 10):
+    recorder.add_many(data[i:i + 10])
+    recorder.write()
+recorder.stop()
+fifo = Filefifo(8, name = {!r}, repeat = False)
+buf = array.array('H', bytearray(2 * 128))
+n = fifo.get_into(buf)
+print(fifo.rate, n, buf[:n] == data, recorder.dropped())
+""".format(name, name), tmp_path)
+    assert out == ['125', '100', 'True', '0']
+
+
+def test_viper_kernels_match(tmp_path):
+    out = run("""
+import array, kernels
+from ppgfilter import PPGFilter
+from peaks import PeakDetector
+seed = 1
+signal = array.array('H')
+for i in range(3000):
+    seed = (seed * 1103515245 + 12345) & 0x7FFFFFF
+    signal.append(30000 + (12000 if i % 200 < 20 else 0) + (seed & 0x3FF))
+for rate in (100, 125, 200, 250, 500, 1000):
+    result = []
+    for impl in ('python', 'viper'):
+        kernels.select(impl)
+        data = array.array('H', signal)
+        ppg_filter = PPGFilter(rate, 0.5, 5, 4)
+        detector = PeakDetector(rate, 3 * rate)
+        out = array.array('H', bytearray(2 * 16))
+        beats = []
+        for i in range(0, len(data), 32):
+            block = memoryview(data)[i:i + 32]
+            ppg_filter.process(block, len(block))
+            beats.extend(out[:detector.add_many(block, len(block), out)])
+        result.append((data, beats, list(ppg_filter.st)))
+    print(kernels.IMPLEMENTATION, rate, result[0] == result[1], len(result[0][1]) > 0)
+""", tmp_path)
+    assert out == ' '.join('viper {} True True'.format(r) for r in (100, 125, 200, 250, 500, 1000)).split()
+
+
+def test_pipeline_profiles_its_stages(tmp_path):
+    # Polled and on a thread of its own, the stages are timed inside step()
+    name = str(tmp_path / 'rec.bin')
+    out = run("""
+import array, time
+from filefifo import write_header
+from sampler import Sampler
+from ppgfilter import PPGFilter
+from peaks import PeakDetector
+from pipeline import Pipeline
+from profiler import Profiler
+with open({!r}, 'wb') as f:
+    write_header(f, 250)
+    f.write(array.array('H', [30000 + (8000 if i % 200 < 20 else 0) for i in range(2000)]))
+buf = array.array('H', bytearray(2 * 32))
+for threaded in (False, True):
+    profiler = Profiler(("sampler", "detector", "hrv"))
+    pipeline = Pipeline(Sampler(name = {!r}), PPGFilter(250), PeakDetector(250), threaded = threaded,
+                        profiler = profiler)
+    pipeline.start()
+    while pipeline.processed < 1000:
+        pipeline.poll()
+        while pipeline.samples.get_into(buf):
+            pass
+        time.sleep_ms(1)
+    pipeline.stop()
+    report = profiler.report()
+    print(report["sampler"][0] > 0, report["detector"][0] == report["sampler"][0], report["hrv"][0])
+""".format(name, name), tmp_path)
+    assert out == ['True', 'True', '0'] * 2
+
+
+def test_hrv_add_does_not_allocate(tmp_path):
+    out = run("""
+import gc
+from hrv import HRVAccumulator
+def add(hrv, n):
+    for i in range(n):
+        hrv.add(600 + (i * 37) % 700)
+hrv = HRVAccumulator()
+add(hrv, 2)
+gc.collect()
+gc.disable()
+before = gc.mem_alloc()
+add(hrv, 1000)
+print(gc.mem_alloc() - before, hrv.n)
+gc.enable()
+""", tmp_path)
+    assert out == ['0', '1002']
+
+
+def test_unchanged_display_does_not_allocate(tmp_path):
+    out = run("""
+import gc
+from machine import I2C
+from display import Display
+def show(oled, n):
+    for i in range(n):
+        oled.show()
+oled = Display(128, 64, I2C())
+oled.text('HRV', 0, 0, 1)
+show(oled, 2)
+sent = oled.i2c.written
+gc.collect()
+gc.disable()
+before = gc.mem_alloc()
+show(oled, 100)
+print(gc.mem_alloc() - before, oled.i2c.written - sent)
+gc.enable()
+""", tmp_path)
+    assert out == ['0', '0']
+
+
+def test_fifo_single_items_do_not_allocate(tmp_path):
+    # The methods that interrupts may call, also when the fifo is full
+    out = run("""
+import gc
+from fifo import Fifo
+def fill(fifo, n):
+    for i in range(n):
+        fifo.put_nowait(i)
+        fifo.put(i)
+        fifo.get()
+    while fifo.put_nowait(1):
+        pass
+    fifo.put_nowait(2)
+fifo = Fifo(64)
+fill(fifo, 1)
+fifo = Fifo(64)
+gc.collect()
+gc.disable()
+before = gc.mem_alloc()
+fill(fifo, 40)
+print(gc.mem_alloc() - before, fifo.dropped())
+gc.enable()
+""", tmp_path)
+    assert out == ['0', '2']
@@ -0,0 +1,82 @@
+import array
+import math
+import pytest
+from filefifo import Filefifo, write_header
+from peaks import PeakDetector
+from ppgfilter import PPGFilter
+
+# The rates listed at RATE in main.py
+RATES = (100, 125, 200, 250, 500)
+
+
+def ppg(rate, seconds = 30, noise = 64, wander = 2000):
+    """PPG like signal with baseline wander and noise. Returns the samples and the
+    true intervals in ms."""
+    seed = 12345
+    period = 0.85
+    beats = [0.3]
+    while beats[-1] < seconds + period:
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        beats.append(beats[-1] + period * (0.9 + 0.2 * seed / 0x7FFFFFFF))
+    out = array.array('H')
+    b = 0
+    for i in range(rate * seconds):
+        t = i / rate
+        while t >= beats[b + 1]:
+            b += 1
+        ph = (t - beats[b]) / period
+        v = math.exp(-((ph - 0.15) / 0.07) ** 2) + 0.4 * math.exp(-((ph - 0.45) / 0.1) ** 2)
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        out.append(int(30000 + 12000 * v + wander * math.sin(2 * math.pi * 0.2 * t) + ((seed & 0xFF) - 128) * noise / 128))
+    # The pulse peaks 0.15 periods after the beat, the last one must be inside the signal
+    peaks = [t + 0.15 * period for t in beats if t + 0.15 * period < seconds - 0.1]
+    return out, [round(1000 * (peaks[i + 1] - peaks[i])) for i in range(len(peaks) - 1)]
+
+
+def errors(got, ppi, skip = 4):
+    # The first intervals are found once the detector window is full, match the rest from the end
+    got = got[-(len(ppi) - skip):]
+    return [abs(a - b) for a, b in zip(got, ppi[-len(got):])], len(got)
+
+
+@pytest.mark.parametrize('rate', RATES)
+def test_rates_of_main(rate):
+    # Filter and detector set up as in Init_Measurement
+    data, ppi = ppg(rate)
+    ppg_filter = PPGFilter(rate, 0.5, 5, max(1, 4 * rate // 250))
+    detector = PeakDetector(rate, 3 * rate, 300)
+    out = array.array('H', bytearray(2 * 8))
+    got = []
+    for i in range(0, len(data), 32):
+        block = memoryview(data)[i:i + 32]
+        ppg_filter.process(block, len(block))
+        got.extend(out[:detector.add_many(block, len(block), out)])
+    assert len(ppi) - 6 <= len(got) <= len(ppi)
+    err, n = errors(got, ppi)
+    assert sum(err) / n < 2 and max(err) <= 6
+
+
+def test_interpolation_from_high_rate_recording(tmp_path):
+    # Detect at 1 kHz and at lower rates by taking every k-th sample of the replayed recording
+    name = str(tmp_path / 'ppg1000.bin')
+    data, ppi = ppg(1000, noise = 8, wander = 300)
+    with open(name, 'wb') as f:
+        write_header(f, 1000)
+        f.write(data)
+    fifo = Filefifo(64, name = name, repeat = False)
+    replayed = array.array('H', bytearray(2 * len(data)))
+    assert fifo.rate == 1000 and fifo.get_into(replayed) == len(data)
+    detector = PeakDetector(1000, 3000)
+    reference = [p for p in (detector.add(v) for v in replayed) if p]
+    err, n = errors(reference, ppi, 2)
+    assert n >= len(ppi) - 4 and max(err) <= 1
+    for rate in (100, 125, 250):
+        step = 1000 // rate
+        mean = {}
+        for interpolate in (False, True):
+            detector = PeakDetector(rate, 3 * rate, 300, interpolate)
+            got = [p for p in (detector.add(replayed[i]) for i in range(0, len(replayed), step)) if p]
+            assert len(reference) - 2 <= len(got) <= len(reference)
+            err, n = errors(got, reference, 2)
+            mean[interpolate] = sum(err) / n
+        assert mean[True] < 1 and max(err) <= 2 and mean[True] < mean[False], (rate, mean)
@@ -0,0 +1,117 @@
+import pytest
+
+
+@pytest.mark.parametrize('rate', (100, 125, 200, 250, 500, 1000))
+def test_rates_that_divide_the_tick(fakes, rate):
+    from piotimer import Scheduler
+    from sampler import Sampler
+    scheduler = Scheduler(freq = 1000)
+    sampler = Sampler(26, rate, scheduler = scheduler)
+    sampler.start()
+    assert scheduler._period[sampler._slot] == 1000 // rate
+
+
+@pytest.mark.parametrize('rate', (300, 150, 400, 3000))
+def test_other_rates_are_refused(fakes, rate):
+    from piotimer import Scheduler
+    from sampler import Sampler
+    scheduler = Scheduler(freq = 1000)
+    with pytest.raises(ValueError):
+        Sampler(26, rate, scheduler = scheduler)
+    with pytest.raises(ValueError):
+        scheduler.add(lambda slot: None, freq = rate)
+    assert scheduler.n == 0
+
+
+def ticks(scheduler, n, fired):
+    # The PIO interrupt, n times, fired gets (tick, slot) of every callback
+    for t in range(n):
+        fired.tick += 1
+        scheduler._tick(None)
+
+
+class Fired(list):
+    tick = 0
+
+    def callback(self, slot):
+        self.append((self.tick, slot))
+
+
+def test_periodic_slots_fire_in_order(fakes):
+    from piotimer import Scheduler
+    scheduler = Scheduler(freq = 1000)
+    fired = Fired()
+    a = scheduler.add(fired.callback, freq = 250)
+    b = scheduler.add(fired.callback, period = 10)
+    ticks(scheduler, 40, fired)
+    expected = sorted([(t, a) for t in range(4, 41, 4)] + [(t, b) for t in range(10, 41, 10)])
+    assert sorted(fired) == expected
+    assert [t for t, slot in fired] == sorted(t for t, slot in fired)
+
+
+def test_one_shot_fires_once_and_frees_the_slot(fakes):
+    from piotimer import Scheduler
+    scheduler = Scheduler(freq = 1000, size = 2)
+    fired = Fired()
+    periodic = scheduler.add(fired.callback, freq = 100)
+    once = scheduler.add(fired.callback, Scheduler.ONE_SHOT, period = 25)
+    with pytest.raises(RuntimeError):
+        scheduler.add(fired.callback, freq = 100)
+    ticks(scheduler, 50, fired)
+    assert fired == [(10, periodic), (20, periodic), (25, once), (30, periodic), (40, periodic), (50, periodic)]
+    assert scheduler.n == 1 and scheduler._pos[once] == -1
+    assert scheduler.add(fired.callback, Scheduler.ONE_SHOT, period = 1) == once
+
+
+def test_cancel(fakes):
+    from piotimer import Scheduler
+    scheduler = Scheduler(freq = 1000)
+    fired = Fired()
+    a = scheduler.add(fired.callback, freq = 200)
+    b = scheduler.add(fired.callback, freq = 100)
+    c = scheduler.add(fired.callback, Scheduler.ONE_SHOT, period = 7)
+    scheduler.cancel(c)
+    scheduler.cancel(c) # A free slot, nothing happens
+    ticks(scheduler, 12, fired)
+    scheduler.cancel(a)
+    ticks(scheduler, 20, fired)
+    assert sorted(fired) == [(5, a), (10, a), (10, b), (20, b), (30, b)]
+    assert scheduler.n == 1
+
+
+def test_cancel_inside_callback(fakes):
+    from piotimer import Scheduler
+    scheduler = Scheduler(freq = 1000)
+    fired = Fired()
+    slots = {}
+
+    def stop_self(slot):
+        fired.callback(slot)
+        if len([s for t, s in fired if s == slot]) == 3:
+            scheduler.cancel(slot)
+
+    def stop_other(slot):
+        # Due on the same tick as 'other', which may have been called before it on that tick
+        fired.callback(slot)
+        scheduler.cancel(slots['other'])
+
+    slots['self'] = scheduler.add(stop_self, freq = 500)
+    slots['stop'] = scheduler.add(stop_other, Scheduler.ONE_SHOT, period = 10)
+    slots['other'] = scheduler.add(fired.callback, period = 10)
+    ticks(scheduler, 30, fired)
+    other = [x for x in fired if x[1] == slots['other']]
+    assert other in ([], [(10, slots['other'])])
+    assert [x for x in fired if x[1] != slots['other']] == \
+        [(2, slots['self']), (4, slots['self']), (6, slots['self']), (10, slots['stop'])]
+    assert scheduler.n == 0
+
+
+def test_deadlines_across_the_tick_wrap(fakes):
+    from piotimer import Scheduler
+    scheduler = Scheduler(freq = 1000)
+    scheduler.now = Scheduler._MASK - 5
+    fired = Fired()
+    a = scheduler.add(fired.callback, freq = 250)
+    b = scheduler.add(fired.callback, Scheduler.ONE_SHOT, period = 10)
+    ticks(scheduler, 12, fired)
+    assert fired == [(4, a), (8, a), (10, b), (12, a)]
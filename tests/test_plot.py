@@ -0,0 +1,79 @@
+import array
+import math
+import pytest
+
+
+@pytest.fixture
+def ScrollingPlot(fakes):
+    from plot import ScrollingPlot
+    return ScrollingPlot
+
+
+def signal(n, period = 150, lo = 20000, hi = 40000):
+    return array.array('H', [int((lo + hi) / 2 + (hi - lo) / 2 * math.sin(2 * math.pi * i / period)) for i in range(n)])
+
+
+def lit(plot, x):
+    return [y for y in range(plot.height) if plot.fb.pixel(x, y)]
+
+
+def test_add_many_matches_add(ScrollingPlot):
+    data = signal(2000)
+    one = ScrollingPlot(128, 40, 7)
+    columns = sum(one.add(v) for v in data)
+    many = ScrollingPlot(128, 40, 7)
+    total = 0
+    for i in range(0, len(data), 33):
+        block = data[i:i + 33]
+        total += many.add_many(block, len(block))
+    assert columns == total == len(data) // 7
+    assert many.buffer == one.buffer
+    assert many.new_columns == total
+
+
+def test_columns_are_continuous(ScrollingPlot):
+    # Every column is one vertical run that touches the run of the column before it
+    plot = ScrollingPlot(128, 40, 4)
+    data = signal(128 * 4 * 3)
+    plot.add_many(data, len(data))
+    prev = None
+    for x in range(128):
+        ys = lit(plot, x)
+        assert ys and ys == list(range(ys[0], ys[-1] + 1)), x
+        if prev:
+            assert ys[0] <= prev[-1] + 1 and ys[-1] >= prev[0] - 1, x
+        prev = ys
+
+
+def test_range_fills_the_height(ScrollingPlot):
+    # The range is the min/max of the stored columns with 1/8 headroom on both sides
+    plot = ScrollingPlot(128, 40, 4)
+    data = signal(128 * 4 * 2)
+    plot.add_many(data, len(data))
+    ys = [y for x in range(128) for y in lit(plot, x)]
+    assert 2 <= min(ys) <= 5 and 34 <= max(ys) <= 37
+    assert plot.lo < min(data) and plot.hi > max(data)
+
+
+def test_scrolls_before_the_plot_is_full(ScrollingPlot):
+    # The newest column is at the right edge, the empty part is on the left
+    plot = ScrollingPlot(128, 40, 1)
+    data = signal(30)
+    plot.add_many(data, len(data))
+    assert plot.count == 30
+    assert all(not lit(plot, x) for x in range(128 - 30))
+    assert all(lit(plot, x) for x in range(128 - 30, 128))
+
+
+def test_reset_and_draw(ScrollingPlot):
+    from framebuf import FrameBuffer, MONO_VLSB
+    plot = ScrollingPlot(128, 40, 2)
+    data = signal(400)
+    plot.add_many(data, len(data))
+    screen = bytearray(128 * 64 // 8)
+    oled = FrameBuffer(screen, 128, 64, MONO_VLSB)
+    plot.draw(oled, 16)
+    assert plot.new_columns == 0
+    assert all(oled.pixel(x, y + 16) == plot.fb.pixel(x, y) for x in range(128) for y in range(40))
+    plot.reset()
+    assert not any(plot.buffer) and plot.count == 0
@@ -0,0 +1,49 @@
+import array
+import math
+import pytest
+from ppgfilter import PPGFilter
+
+# The sample rates main.py can be set to, and the high rate of the interpolation check
+RATES = (100, 125, 200, 250, 500, 1000)
+
+
+def run(ppg_filter, signal, block = 32):
+    out = array.array('H', signal)
+    for i in range(0, len(out), block):
+        ppg_filter.process(memoryview(out)[i:i + block], min(block, len(out) - i))
+    return out
+
+
+@pytest.mark.parametrize('derivative', (0, 4))
+@pytest.mark.parametrize('rate', RATES)
+def test_dc_is_rejected(rate, derivative):
+    # A step from 20000 to 40000, after 10 s the output is back at the centre
+    ppg_filter = PPGFilter(rate, 0.5, 5, derivative)
+    out = run(ppg_filter, [20000] * rate + [40000] * (12 * rate))
+    tail = out[-2 * rate:]
+    assert min(tail) >= 32768 - 16 and max(tail) <= 32768 + 16, (min(tail), max(tail))
+
+
+@pytest.mark.parametrize('rate', RATES)
+def test_constant_input_stays_centred(rate):
+    out = run(PPGFilter(rate), [50000] * (5 * rate))
+    assert set(out) == {32768}
+
+
+@pytest.mark.parametrize('rate', RATES)
+def test_heart_rate_band_passes(rate):
+    # 1.2 Hz (72 bpm) with an amplitude of 4000, in the pass band the gain is close to 1
+    signal = [int(30000 + 4000 * math.sin(2 * math.pi * 1.2 * i / rate)) for i in range(15 * rate)]
+    out = run(PPGFilter(rate), signal)
+    tail = out[-5 * rate:]
+    assert 3000 < (max(tail) - min(tail)) / 2 < 4400
+    assert abs((max(tail) + min(tail)) / 2 - 32768) < 200
+
+
+@pytest.mark.parametrize('rate', RATES)
+def test_coefficients_fit_the_kernel(rate):
+    coef = PPGFilter(rate).coef
+    assert coef[0] + coef[1] + coef[2] == 0
+    for fraction in (coef[5], coef[6], coef[12], coef[13]):
+        assert 0 <= fraction < 1 << 14
+    assert len(coef) == 14
@@ -0,0 +1,39 @@
+import array
+from recorder import Recorder
+from filefifo import Filefifo
+
+
+def replay(name):
+    fifo = Filefifo(8, name = name, repeat = False)
+    buf = array.array('H', bytearray(2 * 64))
+    out = array.array('H')
+    while True:
+        n = fifo.get_into(buf)
+        out.extend(buf[:n])
+        if n < len(buf):
+            return fifo.rate, out
+
+
+def test_round_trip(tmp_path):
+    name = str(tmp_path / 'rec.bin')
+    recorder = Recorder(rate = 125, block = 16)
+    recorder.start(name)
+    data = array.array('H', [i * 37 & 0xFFFF for i in range(100)])
+    for i in range(0, 100, 10):
+        recorder.add_many(data[i:i + 10])
+        recorder.write()
+    recorder.stop()
+    assert recorder.dropped() == 0
+    assert replay(name) == (125, data)
+
+
+def test_dropped_block_is_counted(tmp_path):
+    # Three blocks without a write: the first one waits, the next two are dropped
+    name = str(tmp_path / 'rec.bin')
+    recorder = Recorder(block = 4)
+    recorder.start(name)
+    for v in range(12):
+        recorder.add(v)
+    assert recorder.dropped() == 2
+    recorder.stop()
+    assert list(replay(name)[1]) == [0, 1, 2, 3]
@@ -0,0 +1,76 @@
+import random
+from hrv import HRVAccumulator, WindowHRV
+
+
+def intervals(seed, n, low = 400, high = 1500):
+    rng = random.Random(seed)
+    return [rng.randint(low, high) for i in range(n)]
+
+
+def window(ppi, beats, window_ms):
+    # The newest beats intervals, then the oldest are dropped while longer than window_ms, keeping 2
+    w = list(ppi[-beats:])
+    while len(w) > 2 and sum(w) > window_ms:
+        w.pop(0)
+    return w
+
+
+def check(live, ppi, beats, window_ms):
+    w = window(ppi, beats, window_ms)
+    assert live.n == len(w) and live.total == sum(w)
+    hrv = HRVAccumulator()
+    for x in w:
+        hrv.add(x)
+    mean_ppi, mean_hr, sdnn, rmssd = hrv.results()[:4]
+    assert (live.mean_hr(), live.sdnn(), live.rmssd()) == (mean_hr, sdnn, rmssd)
+
+
+def test_evicted_by_beat_count():
+    # The time window never fills, only the ring size limits the window
+    ppi = intervals(1, 200, 600, 1000)
+    live = WindowHRV(20, 10 ** 6)
+    for i, x in enumerate(ppi):
+        live.add(x)
+        check(live, ppi[:i + 1], 20, 10 ** 6)
+    assert live.n == 20
+
+
+def test_evicted_by_window_ms():
+    ppi = intervals(2, 300)
+    live = WindowHRV(60, 10000)
+    for i, x in enumerate(ppi):
+        live.add(x)
+        check(live, ppi[:i + 1], 60, 10000)
+        assert live.total <= 10000 or live.n == 2
+
+
+def test_two_intervals_are_kept():
+    # Intervals longer than the whole window still leave two for RMSSD and SDNN
+    live = WindowHRV(60, 1000)
+    for x in (900, 1200, 1500, 1100):
+        live.add(x)
+        assert live.n <= 2
+    assert live.n == 2 and live.total == 2600
+    assert live.rmssd() == 400 and live.sdnn() == 283
+
+
+def test_matches_accumulator_across_seeds():
+    for seed in range(20):
+        beats = 5 + seed * 3
+        window_ms = 3000 + seed * 2000
+        ppi = intervals(100 + seed, 400)
+        live = WindowHRV(beats, window_ms)
+        for i, x in enumerate(ppi):
+            live.add(x)
+            check(live, ppi[:i + 1], beats, window_ms)
+
+
+def test_reset():
+    live = WindowHRV(10, 5000)
+    for x in intervals(3, 30):
+        live.add(x)
+    live.reset()
+    assert (live.n, live.total, live.mean_hr(), live.rmssd(), live.sdnn()) == (0, 0, 0, 0, 0)
+    live.add(800)
+    live.add(1000)
+    assert (live.mean_hr(), live.rmssd(), live.sdnn()) == (67, 200, 141)
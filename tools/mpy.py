@@ -0,0 +1,62 @@
+"""Precompile the modules to .mpy files for faster boot.
+
+Importing a .py file on the device means compiling it first, which takes
+time and heap. mpy-cross does that on the PC. Every .py file listed in
+package.json except main.py is compiled into build/ with the same layout,
+and build/package.json lists the .mpy files instead, so the build directory
+can be served and installed with mip like the source tree.
+
+Usage: python tools/mpy.py [-o build] [-march=armv6m] [mpy-cross options]
+
+mpy-cross must be installed (pip install mpy-cross) and of the same .mpy
+version as the firmware.
+"""
+import sys
+import os
+import json
+import shutil
+import subprocess
+
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def main(argv):
+    out = os.path.join(_root, 'build')
+    options = []
+    i = 1
+    while i < len(argv):
+        if argv[i] == '-o':
+            out = argv[i + 1]
+            i += 1
+        else:
+            options.append(argv[i])
+        i += 1
+    if not any(o.startswith('-march') for o in options):
+        options.append('-march=armv6m')
+
+    with open(os.path.join(_root, 'package.json')) as f:
+        package = json.load(f)
+
+    urls = []
+    for name, url in package['urls']:
+        src = os.path.join(_root, name)
+        if name.endswith('.py') and name != 'main.py':
+            name = name[:-3] + '.mpy'
+            url = url[:-3] + '.mpy'
+            dst = os.path.join(out, name)
+            os.makedirs(os.path.dirname(dst), exist_ok = True)
+            subprocess.check_call(['mpy-cross'] + options + ['-o', dst, src])
+        else:
+            dst = os.path.join(out, name)
+            os.makedirs(os.path.dirname(dst), exist_ok = True)
+            shutil.copyfile(src, dst)
+        print(name)
+        urls.append([name, url])
+
+    package['urls'] = urls
+    with open(os.path.join(out, 'package.json'), 'w') as f:
+        json.dump(package, f, indent = 2)
+
+
+if __name__ == '__main__':
+    main(sys.argv)